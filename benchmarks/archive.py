@@ -0,0 +1,126 @@
+"""Benchmark the live database before and after archiving old orders.
+
+Run from the repository root::
+
+    python -m benchmarks.archive --orders 30000 --years 3
+
+A synthetic history of ``--years`` years is logged (every order but the
+last few weeks' is complete), then :func:`data.archive.archive_orders`
+moves everything finished more than ``--days`` days before its end into
+monthly archives and :func:`data.archive.incremental_vacuum` shrinks the
+live file. The file size and the best of ``--repeat`` runs of the reports
+are printed for both states: the last month (which reads no archive), the
+whole history (which reads all of them) and a scan of every live step.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.log_orders import STEP_NAMES
+from data import archive, db, metrics
+from parsers.manage_html import Order, Step
+
+BASE = datetime(2022, 1, 1)
+
+
+def make_orders(count, years):
+    rng = random.Random(0)
+    end = BASE + timedelta(days=365 * years)
+    orders = []
+    for n in range(count):
+        ts = BASE + timedelta(minutes=rng.randrange(365 * years * 24 * 60))
+        steps = []
+        for name in STEP_NAMES:
+            steps.append(Step(name, ts if ts < end else None))
+            ts += timedelta(minutes=rng.randrange(30, 3 * 24 * 60))
+        orders.append(Order(str(100000 + n), f"Company {n % 50}", "", "", steps))
+    return orders, end
+
+
+def _size(conn, path):
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(path) / 1e6
+
+
+def _best(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark archiving old orders")
+    parser.add_argument("--orders", type=int, default=30000, help="Orders to log")
+    parser.add_argument("--years", type=int, default=3, help="Years of history")
+    parser.add_argument("--days", type=int, default=90, help="Archive after this many days")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N runs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    metrics.registry.enabled = False
+    orders, end = make_orders(args.orders, args.years)
+    month = (end - timedelta(days=30), end)
+    history = (BASE, end)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "orders.db")
+        conn, lock = db.connect_db(path)
+        for i in range(0, len(orders), 1000):
+            db.log_orders(conn, lock, orders[i : i + 1000])
+
+        cases = [
+            ("last month report", lambda: db.load_order_groups_by_date_range(conn, lock, *month)),
+            ("last month hours", lambda: db.load_order_hours(conn, lock, *month)),
+            (
+                "history export",
+                lambda: sum(1 for _ in db.iter_jobs_by_date_range(conn, lock, *history)),
+            ),
+            ("history report", lambda: db.load_order_groups_by_date_range(conn, lock, *history)),
+            (
+                "scan live steps",
+                lambda: conn.execute("SELECT COUNT(*), MAX(timestamp) FROM steps").fetchone(),
+            ),
+        ]
+
+        def measure():
+            return [_best(func, args.repeat) for _, func in cases]
+
+        before_size = _size(conn, path)
+        before = measure()
+        started = time.perf_counter()
+        moved = archive.archive_orders(conn, lock, args.days, now=end)
+        archived = time.perf_counter() - started
+        started = time.perf_counter()
+        freed = archive.incremental_vacuum(conn, lock)
+        vacuumed = time.perf_counter() - started
+        after_size = _size(conn, path)
+        after = measure()
+        archive_size = sum(
+            os.path.getsize(os.path.join(conn.archive_dir, name))
+            for name in os.listdir(conn.archive_dir)
+        )
+        conn.close()
+
+    print(
+        f"archived {sum(moved.values())} of {len(orders)} orders into {len(moved)} files "
+        f"in {archived:.2f} s; incremental vacuum freed {freed} pages in {vacuumed:.2f} s"
+    )
+    print(
+        f"live file: {before_size:.1f} MB -> {after_size:.1f} MB "
+        f"(archives {archive_size / 1e6:.1f} MB)"
+    )
+    print(f"{'case':>20} {'before_ms':>10} {'after_ms':>10}")
+    for (label, _), b, a in zip(cases, before, after):
+        print(f"{label:>20} {b * 1e3:>10.2f} {a * 1e3:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
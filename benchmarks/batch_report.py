@@ -0,0 +1,98 @@
+"""Benchmark parsing archived manage page snapshots across processes.
+
+Run from the repository root::
+
+    python -m benchmarks.batch_report --files 200 --orders 500 --workers 1 2 4
+
+``--files`` snapshots of a page of ``--orders`` orders are written to a
+temporary directory, each one with a few more steps completed than the
+one before, in the ``td.move`` layout ``manage_html_report.py`` reads.
+:func:`manage_html_report.parse_snapshots` then parses and merges them
+with each ``--workers`` count, reporting files per second and the speedup
+over one worker. The speedup cannot exceed the number of cores (this
+machine has ``os.cpu_count()``).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from html import escape
+
+from benchmarks.log_orders import advance, make_page
+from benchmarks.parse_orders import STEP
+from manage_html_report import parse_snapshots, snapshot_paths
+from parsers import manage_html
+
+ROW = (
+    "<tr data-id='{number}'><td class='move'><p>YBS {number}</p></td>"
+    "<td>{company}</td><td>Running</td><td><ul class='workplaces'>{steps}</ul></td>"
+    "</tr>\n"
+)
+
+
+def render_snapshot(orders):
+    """Return a manage page listing ``orders`` with ``td.move`` job cells."""
+    rows = []
+    for order in orders:
+        steps = "".join(
+            STEP.format(
+                n=n + 1,
+                name=escape(step.name),
+                time=step.timestamp.strftime(manage_html.HTML_DATE_FORMAT)
+                if step.timestamp
+                else "&nbsp;",
+            )
+            for n, step in enumerate(order.steps)
+        )
+        rows.append(ROW.format(number=order.number, company=escape(order.company), steps=steps))
+    return f"<html><body><table><tbody id='table'>{''.join(rows)}</tbody></table></body></html>"
+
+
+def write_snapshots(directory, files, count):
+    page = make_page(count)
+    for i in range(files):
+        with open(os.path.join(directory, f"manage-{i:05d}.html"), "w", encoding="utf-8") as f:
+            f.write(render_snapshot(page))
+        page = advance(page, 0.05, seed=i)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark batch snapshot parsing")
+    parser.add_argument("--files", type=int, default=200, help="Snapshots to parse")
+    parser.add_argument("--orders", type=int, default=500, help="Orders per snapshot")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, os.cpu_count() or 1}),
+        help="Worker counts to compare",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        write_snapshots(tmp, args.files, args.orders)
+        paths = snapshot_paths(tmp)
+        print(f"{len(paths)} files of {args.orders} orders, {os.cpu_count()} cores")
+        print(f"{'workers':>8} {'seconds':>8} {'files_s':>8} {'speedup':>8}")
+        baseline = None
+        expected = None
+        for workers in args.workers:
+            started = time.perf_counter()
+            jobs, _, failed = parse_snapshots(paths, workers)
+            elapsed = time.perf_counter() - started
+            if failed or (expected is not None and jobs != expected):
+                raise SystemExit("workers disagree on the merged jobs")
+            expected = jobs
+            baseline = baseline or elapsed
+            print(
+                f"{workers:>8} {elapsed:>8.2f} {len(paths) / elapsed:>8.1f} "
+                f"{baseline / elapsed:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
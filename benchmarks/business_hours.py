@@ -0,0 +1,119 @@
+"""Benchmark business-hour calculations across growing interval spans.
+
+Run from the repository root::
+
+    python -m benchmarks.business_hours
+
+The closed-form :meth:`time_utils.BusinessCalendar.delta` should report
+roughly the same cost per call regardless of the span, while the
+day-by-day :func:`time_utils.business_hours_breakdown` grows linearly.
+The second table compares a Python loop over ``business_hours_delta``
+with one :func:`time_utils.business_hours_delta_many` call.
+"""
+
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from time_utils import (
+    DEFAULT_CALENDAR,
+    BusinessCalendar,
+    business_hours_breakdown,
+    business_hours_delta,
+    business_hours_delta_many,
+)
+
+SPANS_DAYS = [1, 7, 30, 180, 365, 3650]
+BATCH_SIZES = [1_000, 10_000, 100_000]
+
+
+def _breakdown_delta(start, end):
+    total = timedelta()
+    for seg_start, seg_end in business_hours_breakdown(start, end):
+        total += seg_end - seg_start
+    return total
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark business hour deltas")
+    parser.add_argument(
+        "--number", type=int, default=2000, help="Calls per measurement"
+    )
+    return parser.parse_args()
+
+
+def _random_pairs(count):
+    rng = random.Random(0)
+    base = datetime(2024, 1, 1)
+    starts = []
+    ends = []
+    for _ in range(count):
+        start = base + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        starts.append(start)
+        ends.append(start + timedelta(minutes=rng.randrange(30 * 24 * 60)))
+    return starts, ends
+
+
+def bench_batches():
+    print(f"{'pairs':>10} {'loop_ms':>15} {'vectorized_ms':>15}")
+    for count in BATCH_SIZES:
+        starts, ends = _random_pairs(count)
+        start_arr = np.array(starts, dtype="datetime64[us]")
+        end_arr = np.array(ends, dtype="datetime64[us]")
+        loop = timeit.timeit(
+            lambda: [business_hours_delta(s, e) for s, e in zip(starts, ends)],
+            number=1,
+        )
+        vectorized = timeit.timeit(
+            lambda: business_hours_delta_many(start_arr, end_arr), number=1
+        )
+        print(f"{count:>10} {loop * 1e3:>15.2f} {vectorized * 1e3:>15.2f}")
+
+
+def _holiday_calendar():
+    """Return a calendar with a dozen holidays per year for 2020-2035."""
+    rng = random.Random(1)
+    holidays = [
+        datetime(year, 1, 1).date() + timedelta(days=rng.randrange(365))
+        for year in range(2020, 2036)
+        for _ in range(12)
+    ]
+    return BusinessCalendar(holidays=holidays)
+
+
+def main():
+    args = parse_args()
+    start = datetime(2024, 1, 3, 10, 15)
+    calendar = _holiday_calendar()
+    print(
+        f"{'span_days':>10} {'closed_form_us':>15} {'calendar_us':>15} "
+        f"{'breakdown_us':>15}"
+    )
+    for days in SPANS_DAYS:
+        end = start + timedelta(days=days, hours=3)
+        # Call the calendar directly so the memoization in
+        # business_hours_delta does not hide the calculation cost
+        closed = timeit.timeit(
+            lambda: DEFAULT_CALENDAR.delta(start, end), number=args.number
+        )
+        with_holidays = timeit.timeit(
+            lambda: calendar.delta(start, end), number=args.number
+        )
+        walk_number = max(1, args.number // max(1, days // 7))
+        walk = timeit.timeit(
+            lambda: _breakdown_delta(start, end), number=walk_number
+        )
+        print(
+            f"{days:>10} {closed / args.number * 1e6:>15.2f} "
+            f"{with_holidays / args.number * 1e6:>15.2f} "
+            f"{walk / walk_number * 1e6:>15.2f}"
+        )
+    print()
+    bench_batches()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark grouping the Date Range Report in Python against SQLite.
+
+Run from the repository root::
+
+    python -m benchmarks.date_range_report --orders 12000
+
+A synthetic year of orders is logged, then the whole year is grouped per
+order twice: from the flat rows of :func:`data.db.load_jobs_by_date_range`
+the way the report did it in Python, and with
+:func:`data.db.load_order_groups_by_date_range`, which sums in SQL and
+leaves the workstation rows to be loaded when an order is expanded. Both
+are timed and their peak Python memory is taken with ``tracemalloc``.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.log_orders import make_page
+from data import db
+
+
+def python_groups(conn, lock, start, end):
+    """Group the flat job rows by order as ``run_date_range_report`` used to."""
+    grouped = {}
+    for r in db.load_jobs_by_date_range(conn, lock, start, end):
+        g = grouped.setdefault(
+            r["order"],
+            {
+                "order": r["order"],
+                "company": r["company"],
+                "hours": 0.0,
+                "workstations": [],
+                "status": "Completed",
+            },
+        )
+        g["hours"] += r["hours"]
+        g["workstations"].append(
+            {
+                "workstation": r["workstation"],
+                "hours": r["hours"],
+                "start": r["start"],
+                "end": r["end"],
+            }
+        )
+        if not r["end"]:
+            g["status"] = "In Progress"
+    return list(grouped.values())
+
+
+def measure(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark date range report grouping")
+    parser.add_argument("--orders", type=int, default=12000, help="Orders in the year")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N runs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start, end = datetime(2024, 1, 1), datetime(2025, 12, 31)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn, lock = db.connect_db(os.path.join(tmp, "orders.db"))
+        db.log_orders(conn, lock, make_page(args.orders))
+        rows = len(db.load_jobs_by_date_range(conn, lock, start, end))
+        cases = [
+            ("python grouping", lambda: python_groups(conn, lock, start, end)),
+            ("sql grouping", lambda: db.load_order_groups_by_date_range(conn, lock, start, end)),
+        ]
+        print(f"{rows} lead time rows")
+        print(f"{'case':>16} {'time_ms':>10} {'peak_kib':>10}")
+        for label, func in cases:
+            best, peak = measure(func, args.repeat)
+            print(f"{label:>16} {best * 1e3:>10.1f} {peak / 1024:>10.0f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark concurrent readers against a writer in ``data.db``.
+
+Run from the repository root::
+
+    python -m benchmarks.db_concurrency
+
+A writer thread keeps logging orders while reader threads run date range
+reports. The benchmark is run once with the rollback journal and a single
+shared connection and once with WAL plus the reader pool, printing
+throughput for both sides and the writer's worst-case latency.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from data import db
+
+STEP_NAMES = ["Print File", "Print", "Laminate", "Cut", "Pack", "Ship"]
+
+
+def _steps(rng, base):
+    ts = base + timedelta(minutes=rng.randrange(365 * 24 * 60))
+    steps = []
+    for name in STEP_NAMES:
+        steps.append((name, ts))
+        ts += timedelta(minutes=rng.randrange(30, 3 * 24 * 60))
+    return steps
+
+
+def build_db(path, orders, wal):
+    conn, lock = db.connect_db(path, wal=wal)
+    rng = random.Random(0)
+    base = datetime(2024, 1, 1)
+    for n in range(orders):
+        db.log_order(conn, lock, str(100000 + n), f"Company {n % 50}", _steps(rng, base))
+    return conn, lock
+
+
+def run(path, orders, readers, seconds, wal):
+    conn, lock = build_db(path, orders, wal)
+    stop = threading.Event()
+    reads = []
+    write_latencies = []
+
+    def writer():
+        rng = random.Random(1)
+        base = datetime(2024, 1, 1)
+        while not stop.is_set():
+            order = str(100000 + rng.randrange(orders))
+            started = time.perf_counter()
+            db.log_order(conn, lock, order, "Company", _steps(rng, base))
+            write_latencies.append(time.perf_counter() - started)
+
+    def reader():
+        count = 0
+        while not stop.is_set():
+            db.load_jobs_by_date_range(
+                conn, lock, datetime(2024, 3, 1), datetime(2024, 3, 31)
+            )
+            count += 1
+        reads.append(count)
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    conn.close()
+    write_latencies.sort()
+    p99 = write_latencies[int(len(write_latencies) * 0.99)] if write_latencies else 0.0
+    return sum(reads) / seconds, len(write_latencies) / seconds, p99
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent DB access")
+    parser.add_argument("--orders", type=int, default=5000, help="Orders to preload")
+    parser.add_argument("--readers", type=int, default=4, help="Reader threads")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Run time per mode")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print(f"{'mode':>10} {'reports/s':>12} {'writes/s':>12} {'write_p99_ms':>14}")
+    for label, wal in (("rollback", False), ("wal+pool", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "orders.db")
+            reads, writes, p99 = run(path, args.orders, args.readers, args.seconds, wal)
+        print(f"{label:>10} {reads:>12.1f} {writes:>12.1f} {p99 * 1e3:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Benchmark the overhead of the ``data.metrics`` instrumentation.
+
+Run from the repository root::
+
+    python -m benchmarks.db_metrics --orders 5000
+
+The instrumentation costs a fixed amount per instrumented call and per
+statement, independent of how much work the call does, and much less for
+the calls that sampling leaves untimed. Both costs are measured first,
+for timed and for untimed calls, with a trivial ``SELECT 1`` and the
+best of many short alternating runs, so machine noise hardly affects
+them. A synthetic page of orders is then logged and typical ``data.db``
+work is run: the timed and untimed calls and statements it makes, taken
+from :data:`data.metrics.registry` with its default sampling, times the
+unit costs give the estimated overhead relative to the uninstrumented
+time. The target is below 2%.
+
+The direct comparison is printed next to it: the median ratio of
+``--repeat`` pairs of runs with the registry disabled and enabled (in
+turns first), after the best time of each. Unlike the estimate it
+includes the slowdown of the calls right after a timed one, but on a
+busy machine its noise is about as large as the overhead.
+
+"session" is what the GUI does in one poll interval: store a page where
+a few orders advanced, run the Date Range Report for a month and export
+it. Loading one order at a time is the worst case.
+"""
+
+import argparse
+import gc
+import os
+import statistics
+import tempfile
+import time
+import timeit
+from datetime import datetime
+
+from benchmarks.log_orders import advance, make_page
+from data import db, metrics
+
+
+@metrics.instrumented
+def select_one(conn, lock, statements=1):
+    with db._reading(conn, lock) as reader:
+        for _ in range(statements):
+            reader.execute("SELECT 1").fetchall()
+
+
+def unit_costs(conn, lock, sample_interval):
+    """Return the instrumentation cost of one call and of one statement in seconds.
+
+    With ``sample_interval=0`` every call is timed; with a large value
+    none but the first is, giving the cost of the calls sampling skips.
+    """
+    saved = metrics.registry.sample_interval
+    metrics.registry.sample_interval = sample_interval
+
+    def cost(statements):
+        best = [float("inf"), float("inf")]
+        for n in range(30):
+            for enabled in (n % 2 == 0, n % 2 == 1):
+                metrics.registry.enabled = enabled
+                elapsed = timeit.timeit(lambda: select_one(conn, lock, statements), number=500)
+                best[enabled] = min(best[enabled], elapsed / 500)
+        return best[True] - best[False]
+
+    try:
+        one, many = cost(1), cost(21)
+    finally:
+        metrics.registry.sample_interval = saved
+    statement = (many - one) / 20
+    return one - statement, statement
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark instrumentation overhead")
+    parser.add_argument("--orders", type=int, default=5000, help="Orders in the database")
+    parser.add_argument("--repeat", type=int, default=21, help="Runs per case")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    page = make_page(args.orders)
+    sample = page[: min(len(page), 1000)]
+    year = (datetime(2024, 1, 1), datetime(2025, 12, 31))
+    month = (datetime(2024, 6, 1), datetime(2024, 6, 30))
+    polls = iter([advance(page, 0.05, seed=n) for n in range(2 * args.repeat + 2)])
+    with tempfile.TemporaryDirectory() as tmp:
+        conn, lock = db.connect_db(os.path.join(tmp, "orders.db"))
+        db.log_orders(conn, lock, page)
+        timed = unit_costs(conn, lock, 0)
+        untimed = unit_costs(conn, lock, float("inf"))
+        for label, (per_call, per_statement) in (("timed", timed), ("untimed", untimed)):
+            print(
+                f"{label} calls: {per_call * 1e6:.2f} us per call, "
+                f"{per_statement * 1e6:.2f} us per statement"
+            )
+
+        def session(conn, lock):
+            db.log_orders(conn, lock, next(polls))
+            groups = db.load_order_groups_by_date_range(conn, lock, *month)
+            db.load_order_hours(conn, lock, *month)
+            db.load_steps_many(conn, lock, [g["order"] for g in groups])
+            for _ in db.iter_jobs_by_date_range(conn, lock, *month):
+                pass
+
+        cases = [
+            ("session", session),
+            ("log_orders, unchanged", lambda conn, lock: db.log_orders(conn, lock, page)),
+            (
+                "load_jobs_by_date_range",
+                lambda conn, lock: db.load_jobs_by_date_range(conn, lock, *year),
+            ),
+            (
+                "load_order_groups",
+                lambda conn, lock: db.load_order_groups_by_date_range(conn, lock, *year),
+            ),
+            (
+                "iter_jobs_by_date_range",
+                lambda conn, lock: sum(1 for _ in db.iter_jobs_by_date_range(conn, lock, *year)),
+            ),
+            (
+                f"load_steps x {len(sample)}",
+                lambda conn, lock: [db.load_steps(conn, lock, o.number) for o in sample],
+            ),
+            (
+                f"log_order x {len(sample)}, unchanged",
+                lambda conn, lock: [
+                    db.log_order(
+                        conn, lock, o.number, o.company, [(s.name, s.timestamp) for s in o.steps]
+                    )
+                    for o in sample
+                ],
+            ),
+        ]
+        print(
+            f"{'case':>28} {'calls':>6} {'timed':>6} {'stmts':>6} {'off_ms':>9} "
+            f"{'on_ms':>9} {'measured':>9} {'estimated':>9}"
+        )
+        for label, func in cases:
+            metrics.registry.enabled = True
+            metrics.registry.reset()
+            func(conn, lock)
+            counts = metrics.registry.snapshot().values()
+            calls = sum(s["calls"] for s in counts)
+            sampled = sum(s["sampled"] for s in counts)
+            statements = sum(s["statements"] for s in counts)
+            sampled_statements = sum(s["statements"] * s["sampled"] / s["calls"] for s in counts)
+            best = [float("inf"), float("inf")]
+            ratios = []
+            for n in range(args.repeat):
+                elapsed = [0.0, 0.0]
+                for enabled in (n % 2 == 0, n % 2 == 1):
+                    metrics.registry.enabled = enabled
+                    gc.collect()
+                    started = time.perf_counter()
+                    func(conn, lock)
+                    elapsed[enabled] = time.perf_counter() - started
+                    best[enabled] = min(best[enabled], elapsed[enabled])
+                ratios.append(elapsed[True] / elapsed[False])
+            estimated = (
+                sampled * timed[0]
+                + sampled_statements * timed[1]
+                + (calls - sampled) * untimed[0]
+                + (statements - sampled_statements) * untimed[1]
+            ) / best[0]
+            print(
+                f"{label:>28} {calls:>6} {sampled:>6} {statements:>6} {best[0] * 1e3:>9.2f} "
+                f"{best[1] * 1e3:>9.2f} {100 * (statistics.median(ratios) - 1):>8.1f}% "
+                f"{100 * estimated:>8.2f}%"
+            )
+        metrics.registry.enabled = True
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
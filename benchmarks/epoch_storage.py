@@ -0,0 +1,209 @@
+"""Benchmark ISO text timestamps against INTEGER epoch columns.
+
+Run from the repository root::
+
+    python -m benchmarks.epoch_storage --orders 20000
+
+A synthetic database covering one year is written with the version 2
+schema (ISO text timestamps). A copy is then upgraded by
+:func:`data.db.connect_db`, which converts the columns to epoch seconds.
+Both files are vacuumed before their sizes are compared. The text variant
+is read with the queries and decoding ``data.db`` used before the
+migration; the integer variant with the current functions.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from data import db, migrations
+from manage_html_report import compute_lead_times
+
+STEP_NAMES = ["Print File", "Print", "Laminate", "Cut", "Pack", "Ship"]
+
+
+def build_text_db(path, orders):
+    """Write ``orders`` synthetic orders spread over 2024 as ISO text."""
+    rng = random.Random(0)
+    base = datetime(2024, 1, 1)
+    jobs = {}
+    for n in range(orders):
+        ts = base + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        steps = []
+        for name in STEP_NAMES:
+            steps.append((name, ts if rng.random() < 0.9 else None))
+            ts += timedelta(minutes=rng.randrange(30, 3 * 24 * 60))
+        jobs[str(100000 + n)] = steps
+    results = compute_lead_times(jobs)
+
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    migrations._base_tables(cur)
+    migrations._lookup_indexes(cur)
+    cur.execute("PRAGMA user_version = 2")
+    cur.executemany(
+        "INSERT INTO orders VALUES (?, ?)",
+        [(order, f"Company {i % 50}") for i, order in enumerate(jobs)],
+    )
+    cur.executemany(
+        "INSERT INTO steps VALUES (?, ?, ?)",
+        [
+            (order, name, ts.isoformat(sep=" ") if ts else None)
+            for order, steps in jobs.items()
+            for name, ts in steps
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO lead_times VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                order,
+                item["workstation"],
+                item["start"].isoformat(sep=" "),
+                item["end"].isoformat(sep=" "),
+                item["hours"],
+            )
+            for order, items in results.items()
+            for item in items
+        ],
+    )
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return list(jobs)
+
+
+def text_jobs_by_date_range(conn, lock, start, end):
+    """``load_jobs_by_date_range`` as it was for ISO text columns."""
+    with db._reading(conn, lock) as reader:
+        rows = reader.execute(
+            "SELECT lt.order_number, COALESCE(o.company,''), lt.workstation, lt.hours, "
+            "lt.start, lt.end FROM lead_times lt "
+            "LEFT JOIN orders o ON o.order_number = lt.order_number "
+            "WHERE lt.start >= ? AND lt.start < ?",
+            (start.isoformat(sep=" "), (end + timedelta(days=1)).isoformat(sep=" ")),
+        ).fetchall()
+    return [
+        {
+            "order": order,
+            "company": company,
+            "workstation": ws,
+            "hours": hours or 0.0,
+            "status": "Completed" if e else "In Progress",
+            "start": s[:16] if s else "",
+            "end": e[:16] if e else "",
+        }
+        for order, company, ws, hours, s, e in rows
+    ]
+
+
+def text_steps(conn, lock, order):
+    """``load_steps`` as it was for ISO text columns."""
+    with db._reading(conn, lock) as reader:
+        rows = reader.execute(
+            "SELECT step, timestamp FROM steps WHERE order_number=? ORDER BY rowid", (order,)
+        ).fetchall()
+    return [(step, datetime.fromisoformat(ts) if ts else None) for step, ts in rows]
+
+
+def text_lead_times(conn, lock, order):
+    """``load_lead_times`` as it was for ISO text columns."""
+    with db._reading(conn, lock) as reader:
+        rows = reader.execute(
+            "SELECT workstation, start, end, hours FROM lead_times WHERE order_number=? "
+            "ORDER BY start",
+            (order,),
+        ).fetchall()
+    return [
+        {
+            "workstation": r[0],
+            "start": datetime.fromisoformat(r[1]),
+            "end": datetime.fromisoformat(r[2]),
+            "hours": r[3],
+        }
+        for r in rows
+    ]
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark timestamp storage")
+    parser.add_argument("--orders", type=int, default=20000, help="Orders in the year")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N runs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        text_path = os.path.join(tmp, "text.db")
+        epoch_path = os.path.join(tmp, "epoch.db")
+        orders = build_text_db(text_path, args.orders)
+        shutil.copy(text_path, epoch_path)
+        started = time.perf_counter()
+        conn, lock = db.connect_db(epoch_path, wal=False)
+        migrated = time.perf_counter() - started
+        conn.execute("VACUUM")
+
+        text = sqlite3.connect(text_path)
+        text_lock = threading.Lock()
+        sample = orders[:: max(1, len(orders) // 1000)]
+        month = (datetime(2024, 6, 1), datetime(2024, 6, 30))
+        year = (datetime(2024, 1, 1), datetime(2024, 12, 31))
+        cases = [
+            (
+                "jobs, one month",
+                lambda: text_jobs_by_date_range(text, text_lock, *month),
+                lambda: db.load_jobs_by_date_range(conn, lock, *month),
+            ),
+            (
+                "jobs, whole year",
+                lambda: text_jobs_by_date_range(text, text_lock, *year),
+                lambda: db.load_jobs_by_date_range(conn, lock, *year),
+            ),
+            (
+                f"load_steps x {len(sample)}",
+                lambda: [text_steps(text, text_lock, o) for o in sample],
+                lambda: [db.load_steps(conn, lock, o) for o in sample],
+            ),
+            (
+                f"load_lead_times x {len(sample)}",
+                lambda: [text_lead_times(text, text_lock, o) for o in sample],
+                lambda: [db.load_lead_times(conn, lock, o) for o in sample],
+            ),
+        ]
+        print(f"{args.orders} orders, migration took {migrated:.2f}s")
+        print(f"{'case':>24} {'text_ms':>10} {'epoch_ms':>10} {'speedup':>8}")
+        for label, before, after in cases:
+            t_text = best_of(before, args.repeat)
+            t_epoch = best_of(after, args.repeat)
+            print(
+                f"{label:>24} {t_text * 1e3:>10.2f} {t_epoch * 1e3:>10.2f} "
+                f"{t_text / t_epoch:>7.2f}x"
+            )
+        text.close()
+        conn.close()
+        text_size = os.path.getsize(text_path)
+        epoch_size = os.path.getsize(epoch_path)
+    print(
+        f"file size: text {text_size / 1024:.0f} KiB, epoch {epoch_size / 1024:.0f} KiB "
+        f"({100 * (1 - epoch_size / text_size):.0f}% smaller)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Benchmark text keys against the integer order, company and workstation keys.
+
+Run from the repository root::
+
+    python -m benchmarks.integer_keys --orders 20000
+
+The synthetic year of :mod:`benchmarks.epoch_storage` is migrated twice:
+up to schema version 5, where steps and lead times still repeat the order
+number and workstation name on every row, and to the current schema with
+lookup tables. Both files are vacuumed before their sizes are compared.
+The text variant is read with the queries ``data.db`` used at version 5;
+the integer variant with the current functions, whose name cache lets
+loaded rows share one string per workstation and company.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.epoch_storage import build_text_db
+from data import db, migrations
+
+
+def text_jobs_by_date_range(conn, lock, start, end):
+    """``load_jobs_by_date_range`` as it was for text keys."""
+    with db._reading(conn, lock) as reader:
+        rows = reader.execute(
+            "SELECT lt.order_number, COALESCE(o.company,''), lt.workstation, lt.hours, "
+            "lt.start, lt.end FROM lead_times lt "
+            "LEFT JOIN orders o ON o.order_number = lt.order_number "
+            "WHERE lt.start >= ? AND lt.start < ?",
+            (db.to_epoch(start), db.to_epoch(end + timedelta(days=1))),
+        ).fetchall()
+    return [
+        {
+            "order": order,
+            "company": company,
+            "workstation": ws,
+            "hours": hours or 0.0,
+            "status": "Completed" if e is not None else "In Progress",
+            "start": db._minutes(s),
+            "end": db._minutes(e),
+        }
+        for order, company, ws, hours, s, e in rows
+    ]
+
+
+def text_steps(conn, lock, order):
+    """``load_steps`` as it was for text keys."""
+    with db._reading(conn, lock) as reader:
+        rows = reader.execute(
+            "SELECT step, timestamp FROM steps WHERE order_number=? ORDER BY rowid", (order,)
+        ).fetchall()
+    return [(step, db.from_epoch(ts)) for step, ts in rows]
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark integer keys")
+    parser.add_argument("--orders", type=int, default=20000, help="Orders in the year")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N runs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        text_path = os.path.join(tmp, "text.db")
+        int_path = os.path.join(tmp, "int.db")
+        orders = build_text_db(text_path, args.orders)
+        text = sqlite3.connect(text_path, check_same_thread=False)
+        for target in range(3, 6):
+            migrations.MIGRATIONS[target - 1](text.cursor())
+            text.execute(f"PRAGMA user_version = {target}")
+        text.commit()
+        text.execute("VACUUM")
+        shutil.copy(text_path, int_path)
+        started = time.perf_counter()
+        conn, lock = db.connect_db(int_path, wal=False)
+        migrated = time.perf_counter() - started
+        conn.execute("VACUUM")
+
+        text_lock = threading.Lock()
+        sample = orders[:: max(1, len(orders) // 1000)]
+        month = (datetime(2024, 6, 1), datetime(2024, 6, 30))
+        year = (datetime(2024, 1, 1), datetime(2024, 12, 31))
+        cases = [
+            (
+                "jobs, one month",
+                lambda: text_jobs_by_date_range(text, text_lock, *month),
+                lambda: db.load_jobs_by_date_range(conn, lock, *month),
+            ),
+            (
+                "jobs, whole year",
+                lambda: text_jobs_by_date_range(text, text_lock, *year),
+                lambda: db.load_jobs_by_date_range(conn, lock, *year),
+            ),
+            (
+                f"load_steps x {len(sample)}",
+                lambda: [text_steps(text, text_lock, o) for o in sample],
+                lambda: [db.load_steps(conn, lock, o) for o in sample],
+            ),
+        ]
+        print(f"{args.orders} orders, migration took {migrated:.2f}s")
+        print(f"{'case':>24} {'text_ms':>10} {'int_ms':>10} {'speedup':>8}")
+        for label, before, after in cases:
+            t_text = best_of(before, args.repeat)
+            t_int = best_of(after, args.repeat)
+            print(f"{label:>24} {t_text * 1e3:>10.2f} {t_int * 1e3:>10.2f} {t_text / t_int:>7.2f}x")
+        text_peak = peak_memory(lambda: text_jobs_by_date_range(text, text_lock, *year))
+        int_peak = peak_memory(lambda: db.load_jobs_by_date_range(conn, lock, *year))
+        print(
+            f"whole year peak memory: text {text_peak / 1024:.0f} KiB, "
+            f"int {int_peak / 1024:.0f} KiB"
+        )
+        text.close()
+        conn.close()
+        text_size = os.path.getsize(text_path)
+        int_size = os.path.getsize(int_path)
+    print(
+        f"file size: text {text_size / 1024:.0f} KiB, int {int_size / 1024:.0f} KiB "
+        f"({100 * (1 - int_size / text_size):.0f}% smaller)"
+    )
+
+
+if __name__ == "__main__":
+    main()
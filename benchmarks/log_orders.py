@@ -0,0 +1,100 @@
+"""Benchmark logging a full manage page per order versus in one batch.
+
+The batched database is then polled again with the same page and with a
+page where a few orders gained a step, which only writes the changes.
+
+Run from the repository root::
+
+    python -m benchmarks.log_orders --orders 2000
+
+Both variants write to a database file on disk so commit and fsync cost
+is included.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from data import db
+from parsers.manage_html import Order, Step
+
+STEP_NAMES = ["Print File", "Print", "Laminate", "Cut", "Pack", "Ship"]
+
+
+def make_page(count):
+    rng = random.Random(0)
+    base = datetime(2024, 1, 1)
+    orders = []
+    for n in range(count):
+        ts = base + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        steps = []
+        for name in STEP_NAMES:
+            done = rng.random() < 0.7
+            steps.append(Step(name, ts if done else None))
+            ts += timedelta(minutes=rng.randrange(30, 3 * 24 * 60))
+        orders.append(Order(str(100000 + n), f"Company {n % 50}", "Running", "", steps))
+    return orders
+
+
+def advance(page, fraction, seed=1):
+    """Return ``page`` with the next pending step completed on some orders."""
+    rng = random.Random(seed)
+    result = []
+    for order in page:
+        steps = list(order.steps)
+        pending = [i for i, s in enumerate(steps) if s.timestamp is None]
+        if pending and rng.random() < fraction:
+            i = pending[0]
+            steps[i] = Step(steps[i].name, datetime(2025, 1, 1, 9, 0))
+        result.append(replace(order, steps=steps))
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark order logging")
+    parser.add_argument("--orders", type=int, default=2000, help="Orders per page")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    page = make_page(args.orders)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn, lock = db.connect_db(os.path.join(tmp, "per_order.db"))
+        started = time.perf_counter()
+        for order in page:
+            db.log_order(
+                conn,
+                lock,
+                order.number,
+                order.company,
+                [(s.name, s.timestamp) for s in order.steps],
+            )
+        per_order = time.perf_counter() - started
+        conn.close()
+
+        conn, lock = db.connect_db(os.path.join(tmp, "batched.db"))
+        started = time.perf_counter()
+        db.log_orders(conn, lock, page)
+        batched = time.perf_counter() - started
+
+        started = time.perf_counter()
+        db.log_orders(conn, lock, page)
+        unchanged = time.perf_counter() - started
+
+        started = time.perf_counter()
+        db.log_orders(conn, lock, advance(page, 0.05))
+        few_changed = time.perf_counter() - started
+        conn.close()
+    print(f"log_order x {args.orders}: {per_order:.3f}s")
+    print(f"log_orders (one batch): {batched:.3f}s")
+    print(f"log_orders, page unchanged: {unchanged:.3f}s")
+    print(f"log_orders, 5% of orders advanced: {few_changed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark the order search index against a substring scan.
+
+Run from the repository root::
+
+    python -m benchmarks.order_search --orders 100000
+
+Orders with synthetic numbers and company names are stored, then a set of
+terms is looked up with :func:`data.db.search_orders` and with the
+lowercase substring scan over loaded rows that the date range filter used
+before. The scan only sees the rows it was given; the index covers every
+stored order.
+"""
+
+import argparse
+import time
+
+from data import db
+
+TERMS = ["1234", "5678", "pany 42", "signs", "99"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark order search")
+    parser.add_argument("--orders", type=int, default=100000, help="Stored orders")
+    parser.add_argument("--repeat", type=int, default=20, help="Lookups per term")
+    return parser.parse_args()
+
+
+def scan(rows, term):
+    term = term.lower()
+    return {
+        r["order"]
+        for r in rows
+        if term in r["order"].lower() or term in r["company"].lower()
+    }
+
+
+def per_lookup(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    args = parse_args()
+    conn, lock = db.connect_db(":memory:")
+    rows = [
+        {"order": str(100000 + n), "company": f"Company {n % 5000} Signs"}
+        for n in range(args.orders)
+    ]
+    with lock:
+        conn.executemany(
+            "INSERT OR IGNORE INTO companies(name) VALUES (?)",
+            [(r["company"],) for r in rows],
+        )
+        conn.executemany(
+            "INSERT INTO orders(order_number, company_id) "
+            "SELECT ?, id FROM companies WHERE name = ?",
+            [(r["order"], r["company"]) for r in rows],
+        )
+        conn.commit()
+    print(f"{'term':>10} {'matches':>8} {'scan_ms':>10} {'index_ms':>10}")
+    for term in TERMS:
+        matches = db.search_orders(conn, lock, term)
+        assert matches == scan(rows, term)
+        t_scan = per_lookup(lambda: scan(rows, term), args.repeat)
+        t_index = per_lookup(lambda: db.search_orders(conn, lock, term), args.repeat)
+        print(f"{term:>10} {len(matches):>8} {t_scan * 1e3:>10.3f} {t_index * 1e3:>10.3f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark how long a poll blocks with and without the write-behind writer.
+
+Run from the repository root::
+
+    python -m benchmarks.order_writer --orders 2000 --polls 20
+
+A burst of polls is simulated: each poll delivers the whole page again
+with a few orders advanced by one step. Storing the page directly with
+:func:`data.db.log_orders` makes the poll wait for the transaction and its
+commit; :class:`data.writer.OrderWriter` only buffers it. The benchmark
+runs once in WAL mode and once with the rollback journal, where every
+commit is synced to disk.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.log_orders import advance, make_page
+from data import db
+from data.writer import OrderWriter
+
+
+def _polls(page, count):
+    pages = []
+    for n in range(count):
+        page = advance(page, 0.05, seed=n)
+        pages.append(page)
+    return pages
+
+
+def run(path, wal, polls, use_writer):
+    conn, lock = db.connect_db(path, wal=wal)
+    db.log_orders(conn, lock, polls[0])
+    writer = OrderWriter(conn, lock) if use_writer else None
+    latencies = []
+    started = time.perf_counter()
+    for page in polls[1:]:
+        poll_started = time.perf_counter()
+        if writer is None:
+            db.log_orders(conn, lock, page)
+        else:
+            writer.submit_many(page)
+        latencies.append(time.perf_counter() - poll_started)
+    if writer is not None:
+        writer.close()
+    total = time.perf_counter() - started
+    conn.close()
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[-1], total
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark write-behind order logging")
+    parser.add_argument("--orders", type=int, default=2000, help="Orders per page")
+    parser.add_argument("--polls", type=int, default=20, help="Polls in the burst")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    polls = _polls(make_page(args.orders), args.polls + 1)
+    print(f"{'mode':>10} {'writer':>8} {'poll_p50_ms':>12} {'poll_max_ms':>12} {'drained_s':>10}")
+    for label, wal in (("wal", True), ("rollback", False)):
+        for use_writer in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                p50, worst, total = run(os.path.join(tmp, "orders.db"), wal, polls, use_writer)
+            print(
+                f"{label:>10} {'yes' if use_writer else 'no':>8} "
+                f"{p50 * 1e3:>12.2f} {worst * 1e3:>12.2f} {total:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
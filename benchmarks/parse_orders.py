@@ -0,0 +1,94 @@
+"""Benchmark the manage page parser backends.
+
+Run from the repository root::
+
+    python -m benchmarks.parse_orders --orders 5500
+
+The orders from :func:`benchmarks.log_orders.make_page` are rendered as a
+manage page (about 5 MB for the default) and parsed with each available
+backend of :func:`parsers.manage_html.parse_orders`. The best of
+``--repeat`` runs is printed next to the speedup over html.parser; every
+backend must give back the orders the page was rendered from.
+"""
+
+import argparse
+import time
+from html import escape
+
+from benchmarks.log_orders import make_page
+from parsers import manage_html
+
+ROW = (
+    "<tr class='row'>"
+    "<td><b>?</b><br><a href='/orders/{number}'>Order #{number}</a></td>"
+    "<td><span class='customer'>{company}</span></td>"
+    "<td><span class='status'>{status}</span></td>"
+    "<td><div class='notes'>Rush job, call before shipping. Proof approved.</div>"
+    "<ul class='workplaces'>{steps}</ul></td>"
+    "<td><input type='text' class='priority' value='{priority}'></td>"
+    "</tr>\n"
+)
+STEP = "<li class='workplace'><p class='name'>{n}{name}</p><p class='np'>{time}</p></li>"
+
+
+def render_page(orders):
+    """Return manage page HTML listing ``orders``."""
+    rows = []
+    for order in orders:
+        steps = "".join(
+            STEP.format(
+                n=n + 1,
+                name=escape(step.name),
+                time=step.timestamp.strftime(manage_html.HTML_DATE_FORMAT)
+                if step.timestamp
+                else "&nbsp;",
+            )
+            for n, step in enumerate(order.steps)
+        )
+        rows.append(
+            ROW.format(
+                number=escape(order.number),
+                company=escape(order.company),
+                status=escape(order.status),
+                priority=escape(order.priority),
+                steps=steps,
+            )
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Manage</title></head><body>"
+        "<table class='orders'><thead><tr><th>Order</th></tr></thead>"
+        f"<tbody id='table'>{''.join(rows)}</tbody></table></body></html>"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark manage page parsing")
+    parser.add_argument("--orders", type=int, default=5500, help="Rows on the page")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    expected = make_page(args.orders)
+    page = render_page(expected)
+    backends = ["html.parser"]
+    if manage_html.lxml_html is not None:
+        backends.append("lxml")
+    print(f"page: {len(page) / 1e6:.1f} MB, {args.orders} orders")
+    print(f"{'backend':>12} {'best_ms':>10} {'speedup':>8}")
+    baseline = None
+    for backend in backends:
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            orders = manage_html.parse_orders(page, backend=backend)
+            best = min(best, time.perf_counter() - started)
+        if orders != expected:
+            raise SystemExit(f"{backend} did not return the rendered orders")
+        baseline = baseline or best
+        print(f"{backend:>12} {best * 1e3:>10.1f} {baseline / best:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Micro-benchmark the per-row cost of the manage page parsers.
+
+Run from the repository root::
+
+    python -m benchmarks.parse_rows --orders 2000
+
+First one step timestamp is decoded with ``datetime.strptime`` and with
+:func:`parsers.rows.parse_timestamp` (uncached and memoized). Then a page
+of ``--orders`` rows rendered by :func:`benchmarks.parse_orders.render_page`
+is read by each parser: both :func:`parsers.manage_html.parse_orders`
+backends, :func:`parsers.manage_html.iter_orders` and
+:func:`manage_html_report.parse_manage_html`. The best of ``--repeat`` runs
+is printed in microseconds per timestamp or per row.
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import manage_html_report
+from benchmarks.log_orders import make_page
+from benchmarks.parse_orders import render_page
+from parsers import manage_html, rows
+
+TIMESTAMP = "07/22/25 10:00\xa0"
+
+
+def _best(func, repeat, count):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best / count * 1e6
+
+
+def _strptime(text):
+    return datetime.strptime(text.replace("\xa0", "").strip(), manage_html.HTML_DATE_FORMAT)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark manage page parsing per row")
+    parser.add_argument("--orders", type=int, default=2000, help="Rows on the page")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N runs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    calls = 20000
+    uncached = rows.parse_timestamp.__wrapped__
+    cases = [
+        ("strptime", lambda: [_strptime(TIMESTAMP) for _ in range(calls)], calls),
+        ("parse_timestamp", lambda: [uncached(TIMESTAMP) for _ in range(calls)], calls),
+        ("memoized", lambda: [rows.parse_timestamp(TIMESTAMP) for _ in range(calls)], calls),
+    ]
+    page = render_page(make_page(args.orders))
+    backends = ["html.parser"] + (["lxml"] if manage_html.lxml_html is not None else [])
+    for backend in backends:
+        cases.append(
+            (backend, lambda b=backend: manage_html.parse_orders(page, backend=b), args.orders)
+        )
+    cases.append(
+        ("iter_orders", lambda: list(manage_html.iter_orders(io.StringIO(page))), args.orders)
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "manage.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(page)
+        cases.append(
+            ("report", lambda: manage_html_report.parse_manage_html(path), args.orders)
+        )
+        print(f"{'case':>16} {'us':>9}")
+        for label, func, count in cases:
+            print(f"{label:>16} {_best(func, args.repeat, count):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
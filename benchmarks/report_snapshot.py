@@ -0,0 +1,121 @@
+"""Benchmark writer latency while long reports run, with and without a snapshot.
+
+Run from the repository root::
+
+    python -m benchmarks.report_snapshot --orders 5000
+
+A writer thread logs one order at a time while a reader thread runs the
+year-long Date Range Report and export back to back. The reports read
+either the live database or a :class:`data.snapshot.ReportingSnapshot`
+refreshed every ``--interval`` seconds; both journal modes are tried. The
+writer's p50, p99 and worst latency are printed next to the reports
+completed and the time spent copying.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from benchmarks.db_concurrency import _steps, build_db
+from data import db, metrics
+from data.snapshot import ReportingSnapshot
+
+YEAR = (datetime(2024, 1, 1), datetime(2024, 12, 31))
+
+
+def run(path, orders, seconds, wal, interval):
+    conn, lock = build_db(path, orders, wal)
+    snapshot = ReportingSnapshot(conn, lock, interval=interval) if interval else None
+    stop = threading.Event()
+    reports = []
+    latencies = []
+    copies = []
+
+    def writer():
+        rng = random.Random(1)
+        base = datetime(2024, 1, 1)
+        while not stop.is_set():
+            order = str(100000 + rng.randrange(orders))
+            started = time.perf_counter()
+            db.log_order(conn, lock, order, "Company", _steps(rng, base))
+            latencies.append(time.perf_counter() - started)
+            # Orders arrive with gaps, not back to back
+            time.sleep(0.002)
+
+    def reader():
+        count = 0
+        while not stop.is_set():
+            source = snapshot.reading() if snapshot else nullcontext((conn, lock))
+            with source as (rconn, rlock):
+                db.load_order_groups_by_date_range(rconn, rlock, *YEAR)
+                for _ in db.iter_jobs_by_date_range(rconn, rlock, *YEAR):
+                    pass
+            if snapshot and snapshot.duration is not None and (
+                not copies or copies[-1] != snapshot.duration
+            ):
+                copies.append(snapshot.duration)
+            count += 1
+        reports.append(count)
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    if snapshot:
+        snapshot.close()
+    conn.close()
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    copy_ms = 1e3 * sum(copies) / len(copies) if copies else 0.0
+    return sum(reports), len(latencies), pct(0.5), pct(0.99), latencies[-1], copy_ms
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark reports on a snapshot")
+    parser.add_argument("--orders", type=int, default=5000, help="Orders to preload")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Run time per mode")
+    parser.add_argument(
+        "--interval", type=float, default=2.0, help="Snapshot refresh interval in seconds"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Every report here is a slow query; do not log them
+    metrics.registry.slow_threshold = float("inf")
+    modes = [
+        ("rollback", False, None),
+        ("rollback+snapshot", False, args.interval),
+        ("wal", True, None),
+        ("wal+snapshot", True, args.interval),
+    ]
+    print(
+        f"{'mode':>18} {'reports':>8} {'writes':>7} {'p50_ms':>8} {'p99_ms':>8} "
+        f"{'max_ms':>8} {'copy_ms':>8}"
+    )
+    for label, wal, interval in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "orders.db")
+            reports, writes, p50, p99, worst, copy_ms = run(
+                path, args.orders, args.seconds, wal, interval
+            )
+        print(
+            f"{label:>18} {reports:>8} {writes:>7} {p50 * 1e3:>8.2f} {p99 * 1e3:>8.2f} "
+            f"{worst * 1e3:>8.2f} {copy_ms:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
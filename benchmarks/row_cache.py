@@ -0,0 +1,84 @@
+"""Benchmark steady-state polls with and without the row fingerprint cache.
+
+Run from the repository root::
+
+    python -m benchmarks.row_cache --orders 5000
+
+A manage page of ``--orders`` rows is polled again unchanged, then with 1%
+and 10% of the orders gaining a step. Each poll is parsed and logged to a
+database file holding the previous poll, once the way it was before
+(``parse_orders`` and ``log_orders`` on every order) and once through a
+:class:`parsers.row_cache.RowCache` that has seen the previous poll, whose
+unchanged orders ``log_orders`` skips. Times are the best of ``--repeat``
+runs.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.log_orders import advance, make_page
+from benchmarks.parse_orders import render_page
+from data import db, metrics
+from parsers.manage_html import parse_orders
+from parsers.row_cache import RowCache
+
+
+def time_poll(tmp, previous, page, cached):
+    """Seconds to parse and to log ``page`` after ``previous``."""
+    conn, lock = db.connect_db(os.path.join(tmp, f"{time.monotonic_ns()}.db"))
+    db.log_orders(conn, lock, parse_orders(previous))
+    if cached:
+        cache = RowCache()
+        cache.parse(previous)
+        started = time.perf_counter()
+        orders = cache.parse(page)
+        parsed = time.perf_counter()
+        db.log_orders(conn, lock, orders, unchanged=cache.unchanged)
+    else:
+        started = time.perf_counter()
+        orders = parse_orders(page)
+        parsed = time.perf_counter()
+        db.log_orders(conn, lock, orders)
+    logged = time.perf_counter()
+    conn.close()
+    return parsed - started, logged - parsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the row fingerprint cache")
+    parser.add_argument("--orders", type=int, default=5000, help="Rows on the page")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    metrics.registry.enabled = False
+    base = make_page(args.orders)
+    previous = render_page(base)
+    polls = [
+        ("unchanged", previous),
+        ("1% changed", render_page(advance(base, 0.01))),
+        ("10% changed", render_page(advance(base, 0.10, seed=2))),
+    ]
+    print(f"{'poll':>12} {'mode':>7} {'parse_ms':>9} {'log_ms':>8} {'total_ms':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, page in polls:
+            cache = RowCache()
+            cache.parse(previous)
+            if cache.parse(page) != parse_orders(page):
+                raise SystemExit("the cache returned different orders")
+            for mode, cached in (("full", False), ("cached", True)):
+                runs = [time_poll(tmp, previous, page, cached) for _ in range(args.repeat)]
+                parse_time = min(p for p, _ in runs)
+                log_time = min(l for _, l in runs)
+                print(
+                    f"{label:>12} {mode:>7} {parse_time * 1e3:>9.1f} "
+                    f"{log_time * 1e3:>8.1f} {(parse_time + log_time) * 1e3:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
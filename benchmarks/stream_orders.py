@@ -0,0 +1,93 @@
+"""Benchmark peak memory of parsing a manage page whole versus streamed.
+
+Run from the repository root::
+
+    python -m benchmarks.stream_orders --orders 2000 8000 --soup
+
+For each page size a manage page rendered by
+:func:`benchmarks.parse_orders.render_page` is written to a file, then each
+mode runs in a fresh interpreter and reports its peak resident memory and
+run time: reading the file and calling
+:func:`parsers.manage_html.parse_orders` (lxml, and html.parser with
+``--soup``), or consuming :func:`parsers.manage_html.iter_orders` one order
+at a time. ``idle`` is the interpreter with the same imports.
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.log_orders import make_page
+from benchmarks.parse_orders import render_page
+from parsers import manage_html
+
+
+def write_page(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(render_page(make_page(count)))
+
+
+def child(mode, path):
+    started = time.perf_counter()
+    count = 0
+    if mode == "iter_orders":
+        with open(path, "rb") as f:
+            for _ in manage_html.iter_orders(f):
+                count += 1
+    elif mode != "idle":
+        with open(path, encoding="utf-8") as f:
+            count = len(manage_html.parse_orders(f.read(), backend=mode))
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(count, peak, elapsed)
+
+
+def _run(*args):
+    return subprocess.run(
+        [sys.executable, "-m", "benchmarks.stream_orders", "--child", *map(str, args)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark streamed manage page parsing")
+    parser.add_argument("--orders", type=int, nargs="+", default=[2000, 8000], help="Page sizes")
+    parser.add_argument("--soup", action="store_true", help="Also time html.parser (slow)")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        mode, path, *count = args.child
+        if mode == "write":
+            write_page(path, int(count[0]))
+        else:
+            child(mode, path)
+        return
+    modes = ["idle", "lxml", "iter_orders"] + (["html.parser"] if args.soup else [])
+    print(f"{'orders':>7} {'page_mb':>8} {'mode':>12} {'peak_mb':>8} {'seconds':>8}")
+    for count in args.orders:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "manage.html")
+            # Built in a child too: peak memory survives fork and exec
+            _run("write", path, count)
+            size = os.path.getsize(path) / 1e6
+            for mode in modes:
+                out = _run(mode, path).split()
+                parsed, peak, seconds = int(out[0]), float(out[1]), float(out[2])
+                if mode != "idle" and parsed != count:
+                    raise SystemExit(f"{mode} parsed {parsed} of {count} orders")
+                print(f"{count:>7} {size:>8.1f} {mode:>12} {peak:>8.1f} {seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
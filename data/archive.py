@@ -0,0 +1,388 @@
+"""Move old completed orders out of the live database into monthly archives.
+
+An order is archived once every step has a timestamp and the last one is
+more than ``older_than_days`` old. Its steps, lead times and daily hours
+move to the archive file of the month of that last step
+(``orders-archive/2024-01.db`` next to ``orders.db``); the small ``orders``
+row stays in the live file with the month in ``orders.archived``, so order
+numbers stay unique and searchable. The ``data.db`` load functions attach
+archives read-only when they need them: per order through
+``orders.archived``, and for date ranges only the archives whose stored
+range of lead time starts (kept in the ``archives`` table) overlaps it.
+
+A chunk of orders is written to its archive and committed there before it
+is deleted from the live file, so an interrupted run loses nothing. Archive
+rows of orders that are not marked as archived yet are never read, and the
+next run copies those orders again.
+
+Archived orders are final: logging them again changes nothing. A lead time
+recompute still rebuilds their hours inside the archive files, so reports
+spanning archived and live months use one calendar.
+
+The pages freed in the live file are given back to the file system with
+incremental vacuum. New databases use it from the start; an existing file
+needs one full ``VACUUM`` first (``--enable-incremental-vacuum``).
+
+Run headless with::
+
+    python -m data.archive orders.db --days 365
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config.settings import load_config
+from data import db as db_module
+
+DEFAULT_ARCHIVE_DAYS = 365
+DEFAULT_CHUNK_SIZE = 500
+# Pages freed per step of incremental vacuum; the lock is released between steps
+DEFAULT_VACUUM_PAGES = 2000
+
+# The tables moved to the archives, with the indexes data.db reads them by
+_ARCHIVE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS steps (order_id INTEGER NOT NULL, "
+    "workstation_id INTEGER NOT NULL, timestamp INTEGER)",
+    "CREATE TABLE IF NOT EXISTS lead_times (order_id INTEGER NOT NULL, "
+    "workstation_id INTEGER NOT NULL, start INTEGER, end INTEGER, hours REAL)",
+    "CREATE TABLE IF NOT EXISTS daily_workstation_hours (day INTEGER NOT NULL, "
+    "workstation_id INTEGER NOT NULL, order_id INTEGER NOT NULL, "
+    "business_hours REAL NOT NULL, PRIMARY KEY (day, workstation_id, order_id)"
+    ") WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS idx_steps_order ON steps(order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_lead_times_order_start ON lead_times(order_id, start)",
+    "CREATE INDEX IF NOT EXISTS idx_lead_times_start ON lead_times(start, order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_daily_hours_order ON daily_workstation_hours(order_id)",
+)
+
+# Live orders whose steps all have a timestamp, the last one before the cutoff
+_COMPLETED = (
+    "SELECT s.order_id, MAX(s.timestamp) FROM steps s JOIN orders o ON o.id = s.order_id "
+    "WHERE o.archived IS NULL{ids} GROUP BY s.order_id "
+    "HAVING COUNT(s.timestamp) = COUNT(*) AND MAX(s.timestamp) < ?"
+)
+
+_BOUNDS = ", ".join(
+    f"{column} = {func}(COALESCE({column}, excluded.{column}), "
+    f"COALESCE(excluded.{column}, {column}))"
+    for column, func in (
+        ("first_start", "MIN"),
+        ("last_start", "MAX"),
+        ("first_day", "MIN"),
+        ("last_day", "MAX"),
+    )
+)
+
+
+def _month(ts):
+    return db_module.from_epoch(ts).strftime("%Y-%m")
+
+
+def record_month(cur, month, orders, starts, days):
+    """Add ``orders`` to the ``archives`` row of ``month`` and widen its ranges.
+
+    ``starts`` and ``days`` are lead time starts and rollup days stored in
+    the archive file; the ranges only ever grow. Runs inside the caller's
+    transaction on the live file.
+    """
+    cur.execute(
+        "INSERT INTO archives(month, orders, first_start, last_start, first_day, "
+        "last_day) VALUES (?, ?, ?, ?, ?, ?) "
+        f"ON CONFLICT(month) DO UPDATE SET orders = orders + excluded.orders, {_BOUNDS}",
+        (
+            month,
+            orders,
+            min(starts, default=None),
+            max(starts, default=None),
+            min(days, default=None),
+            max(days, default=None),
+        ),
+    )
+
+
+def _open_archive(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    archive = sqlite3.connect(path)
+    for statement in _ARCHIVE_SCHEMA:
+        archive.execute(statement)
+    archive.commit()
+    return archive
+
+
+def _due(db, db_lock, cutoff):
+    """Map archive months to the ids of the orders due to move there."""
+    query = _COMPLETED.format(ids="")
+    pool = db.readers
+    if pool is not None:
+        # Scans every step; a WAL reader does that without blocking writers
+        with pool.connection() as reader:
+            rows = reader.execute(query, (cutoff,)).fetchall()
+    else:
+        with db_lock:
+            rows = db.execute(query, (cutoff,)).fetchall()
+    due = {}
+    for order_id, last in rows:
+        due.setdefault(_month(last), []).append(order_id)
+    return due
+
+
+def _move(db, db_lock, archive, month, order_ids, cutoff):
+    """Move the rows of ``order_ids`` to ``archive``; return how many orders moved."""
+    with db_lock:
+        try:
+            cur = db.cursor()
+            marks = ",".join("?" * len(order_ids))
+            # Checked again under the lock: an order may have changed since
+            cur.execute(
+                _COMPLETED.format(ids=f" AND s.order_id IN ({marks})"), order_ids + [cutoff]
+            )
+            order_ids = [order_id for order_id, last in cur.fetchall() if _month(last) == month]
+            if not order_ids:
+                return 0
+            marks = ",".join("?" * len(order_ids))
+            cur.execute(
+                "SELECT rowid, order_id, workstation_id, timestamp FROM steps "
+                f"WHERE order_id IN ({marks})",
+                order_ids,
+            )
+            steps = cur.fetchall()
+            cur.execute(
+                "SELECT rowid, order_id, workstation_id, start, end, hours FROM lead_times "
+                f"WHERE order_id IN ({marks})",
+                order_ids,
+            )
+            lead_times = cur.fetchall()
+            cur.execute(
+                "SELECT day, workstation_id, order_id, business_hours "
+                f"FROM daily_workstation_hours WHERE order_id IN ({marks})",
+                order_ids,
+            )
+            days = cur.fetchall()
+
+            # Rows left by an interrupted run are replaced
+            for table in ("steps", "lead_times", "daily_workstation_hours"):
+                archive.execute(f"DELETE FROM {table} WHERE order_id IN ({marks})", order_ids)
+            archive.executemany(
+                "INSERT INTO steps(rowid, order_id, workstation_id, timestamp) "
+                "VALUES (?, ?, ?, ?)",
+                steps,
+            )
+            archive.executemany(
+                "INSERT INTO lead_times(rowid, order_id, workstation_id, start, end, hours) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                lead_times,
+            )
+            archive.executemany(
+                "INSERT INTO daily_workstation_hours VALUES (?, ?, ?, ?)", days
+            )
+            archive.commit()
+
+            starts = [r[3] for r in lead_times if r[3] is not None]
+            day_values = [r[0] for r in days]
+            cur.execute(
+                f"UPDATE orders SET archived=? WHERE id IN ({marks})", [month] + order_ids
+            )
+            for table in ("steps", "lead_times", "daily_workstation_hours"):
+                cur.execute(f"DELETE FROM {table} WHERE order_id IN ({marks})", order_ids)
+            record_month(cur, month, len(order_ids), starts, day_values)
+            db.commit()
+        except BaseException:
+            archive.rollback()
+            db.rollback()
+            raise
+    return len(order_ids)
+
+
+def archive_orders(
+    db,
+    db_lock,
+    older_than_days=DEFAULT_ARCHIVE_DAYS,
+    now=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    progress=None,
+    stop_event=None,
+):
+    """Move the orders completed more than ``older_than_days`` ago to their archives.
+
+    ``progress`` is called as ``progress(done, total)`` after each chunk of
+    ``chunk_size`` orders and setting ``stop_event`` stops the run after the
+    current chunk; the next run carries on. Returns a dict mapping each
+    archive month to the number of orders moved there.
+    """
+    if db.archive_dir is None:
+        raise ValueError("Only database files can be archived")
+    cutoff = db_module.to_epoch((now or datetime.now()) - timedelta(days=older_than_days))
+    due = _due(db, db_lock, cutoff)
+    total = sum(len(order_ids) for order_ids in due.values())
+    done = 0
+    moved = {}
+    for month, order_ids in sorted(due.items()):
+        archive = _open_archive(db_module.archive_path(db.archive_dir, month))
+        try:
+            for i in range(0, len(order_ids), chunk_size):
+                if stop_event is not None and stop_event.is_set():
+                    return moved
+                chunk = order_ids[i : i + chunk_size]
+                count = _move(db, db_lock, archive, month, chunk, cutoff)
+                if count:
+                    moved[month] = moved.get(month, 0) + count
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, total)
+        finally:
+            archive.close()
+    return moved
+
+
+def incremental_vacuum(db, db_lock, pages=DEFAULT_VACUUM_PAGES, stop_event=None):
+    """Give the free pages of the live file back to the file system.
+
+    Frees ``pages`` at a time, releasing the lock in between. Does nothing
+    unless the database uses incremental auto-vacuum (see
+    :func:`enable_incremental_vacuum`). Returns the number of pages freed.
+    """
+    freed = 0
+    while stop_event is None or not stop_event.is_set():
+        with db_lock:
+            if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                break
+            free = db.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            # Stepped to the end by executescript; execute frees one page per call.
+            # PRAGMA does not accept bound parameters.
+            db.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            freed += free - db.execute("PRAGMA freelist_count").fetchone()[0]
+    return freed
+
+
+def enable_incremental_vacuum(db, db_lock):
+    """Switch an existing database to incremental auto-vacuum.
+
+    Takes one full ``VACUUM``, which rewrites the whole file while holding
+    the lock, so run it once when the database is not busy.
+    """
+    with db_lock:
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute("VACUUM")
+
+
+class ArchiveWorker:
+    """Run :func:`archive_orders` and then :func:`incremental_vacuum` on a background thread.
+
+    Like :class:`data.recompute.RecomputeWorker`, the latest
+    ``(done, total)`` is available from :attr:`progress`; :attr:`moved`
+    holds the result once the run finished.
+    """
+
+    def __init__(self, db, db_lock, older_than_days, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.progress = (0, 0)
+        self.moved = None
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(db, db_lock, older_than_days, chunk_size),
+            name="order-archive",
+            daemon=True,
+        )
+
+    def _set_progress(self, done, total):
+        self.progress = (done, total)
+
+    def _run(self, db, db_lock, older_than_days, chunk_size):
+        try:
+            moved = archive_orders(
+                db,
+                db_lock,
+                older_than_days,
+                chunk_size=chunk_size,
+                progress=self._set_progress,
+                stop_event=self._stop,
+            )
+            incremental_vacuum(db, db_lock, stop_event=self._stop)
+            self.moved = moved
+        except Exception as exc:  # surfaced to the caller via ``error``
+            self.error = exc
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Ask the worker to stop after its current chunk and wait for it."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Move old completed orders into monthly archive files"
+    )
+    parser.add_argument("db_path", help="Path to the SQLite database")
+    parser.add_argument(
+        "--days",
+        type=int,
+        help="Archive orders finished more than this many days ago "
+        f"(default: archive_after_days from the config, else {DEFAULT_ARCHIVE_DAYS})",
+    )
+    parser.add_argument(
+        "--config", help="JSON config file (defaults to the GUI config)"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Orders per transaction"
+    )
+    parser.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        help="First switch an existing database to incremental vacuum (one full VACUUM)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    else:
+        config = load_config()
+    days = args.days
+    if days is None:
+        days = int(config.get("archive_after_days") or DEFAULT_ARCHIVE_DAYS)
+    db, db_lock = db_module.connect_db(args.db_path)
+    started = time.monotonic()
+
+    def report(done, total):
+        rate = done / max(time.monotonic() - started, 1e-9)
+        print(f"\r{done}/{total} orders ({rate:.0f}/s)", end="", file=sys.stderr)
+
+    try:
+        if args.enable_incremental_vacuum:
+            enable_incremental_vacuum(db, db_lock)
+        moved = archive_orders(db, db_lock, days, chunk_size=args.chunk_size, progress=report)
+        freed = incremental_vacuum(db, db_lock)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again to resume.", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    print(file=sys.stderr)
+    for month, count in sorted(moved.items()):
+        print(f"{month}: {count} orders archived", file=sys.stderr)
+    print(f"{freed} pages freed.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,152 +1,1121 @@
+import os
+import queue
 import sqlite3
 import threading
-from datetime import datetime, timedelta
+from bisect import bisect_left
+from calendar import timegm
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from operator import itemgetter
+from pathlib import Path
+from time import perf_counter
+from urllib.parse import quote
 
+from data import metrics
+from data.migrations import has_order_search, migrate
 from manage_html_report import compute_lead_times
+from time_utils import business_hours_by_day
 
+DEFAULT_READERS = 4
+DEFAULT_PAGE_SIZE = 1000
+# SQLite attaches at most 10 databases to a connection by default
+MAX_ATTACHED_ARCHIVES = 8
 
-def connect_db(path):
-    """Connect to SQLite database and ensure required tables exist."""
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_DAY_SECONDS = 86400
+# "HH:MM" for every minute of the day and "YYYY-MM-DD " per day seen so far
+_HHMM = [f"{h:02d}:{m:02d}" for h in range(24) for m in range(60)]
+_DAY_PREFIX = {}
+
+# Applied to the writer and every reader connection
+_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class ReaderConnection(sqlite3.Connection):
+    """Pooled read-only connection; keeps per-connection state such as attached archives."""
+
+
+class ReaderPool:
+    """Small pool of read-only connections to a WAL database.
+
+    Connections are opened lazily up to ``size``; callers beyond that wait
+    for one to be returned. In WAL mode readers see the last committed
+    state and never block, or are blocked by, the writer connection.
+    """
+
+    def __init__(self, path, size=DEFAULT_READERS):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, factory=ReaderConnection, uri=True
+        )
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if len(self._opened) < self.size:
+                    conn = self._open()
+                    self._opened.append(conn)
+            if conn is None:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._opened:
+                conn.close()
+            self._opened = []
+        self._idle = queue.LifoQueue()
+
+
+class NameCache:
+    """In-process interning of a lookup table (``workstations`` or ``companies``).
+
+    ``ids`` maps names to their integer ids and ``names`` ids to names, so
+    rows are written and decoded without a query per row and every loaded
+    row shares one string object per name. Ids are never changed or
+    reused, so the maps only grow and are reloaded from the table when a
+    name or id is not known yet.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.ids = {}
+        self.names = {}
+
+    def _load(self, conn):
+        rows = conn.execute(f"SELECT id, name FROM {self.table}").fetchall()
+        self.names = dict(rows)
+        self.ids = {name: id_ for id_, name in rows}
+
+    def lookup(self, conn, ids):
+        """Return the id -> name map, reloaded through ``conn`` if any of ``ids`` is missing."""
+        if not self.names.keys() >= ids:
+            self._load(conn)
+        return self.names
+
+    def intern(self, cur, names):
+        """Return a dict mapping each of ``names`` to its id, inserting new names.
+
+        Runs in the caller's write transaction, before anything else is
+        written to this table in it. Inserted names are not cached here;
+        the next call loads them once committed, so a rolled back
+        transaction leaves no ids behind in the cache.
+        """
+        names = dict.fromkeys(names)
+        if not self.ids.keys() >= names.keys():
+            self._load(cur.connection)
+        ids = self.ids
+        for name in names:
+            id_ = ids.get(name)
+            if id_ is None:
+                cur.execute(f"INSERT INTO {self.table}(name) VALUES (?)", (name,))
+                id_ = cur.lastrowid
+            names[name] = id_
+        return names
+
+
+class Connection(sqlite3.Connection):
+    """Writer connection that owns the pool of reader connections.
+
+    ``readers`` is ``None`` when the database could not be switched to WAL
+    mode (in-memory databases, network shares), in which case reads share
+    the writer connection under the lock as before. ``workstations`` and
+    ``companies`` are the :class:`NameCache` of the two lookup tables,
+    shared by the writer and the readers. ``archive_dir`` is the directory
+    of the monthly archive files (see :mod:`data.archive`), ``None`` for
+    in-memory databases.
+    """
+
+    readers = None
+    archive_dir = None
+    # Whether the order_search trigram index exists (see search_orders)
+    order_search = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workstations = NameCache("workstations")
+        self.companies = NameCache("companies")
+
+    def close(self):
+        if self.readers is not None:
+            self.readers.close()
+        super().close()
+
+
+def to_epoch(ts):
+    """Return ``ts`` as whole epoch seconds for the INTEGER time columns.
+
+    Naive datetimes are stored as if they were UTC, so the wall-clock time
+    read back by :func:`from_epoch` is the one that was written.
+    """
+    return timegm(ts.utctimetuple()) if ts else None
+
+
+def from_epoch(value):
+    """Inverse of :func:`to_epoch`, returning a naive datetime or ``None``."""
+    return _EPOCH + timedelta(0, value) if value is not None else None
+
+
+def _day_epoch(day):
+    """Epoch seconds of midnight on ``day`` (a date or datetime)."""
+    return (day.toordinal() - _EPOCH_ORDINAL) * _DAY_SECONDS
+
+
+def _minutes(value):
+    """Format an epoch column as ``YYYY-MM-DD HH:MM`` for report tables."""
+    if value is None:
+        return ""
+    day, seconds = divmod(value, _DAY_SECONDS)
+    prefix = _DAY_PREFIX.get(day)
+    if prefix is None:
+        prefix = date.fromordinal(_EPOCH_ORDINAL + day).isoformat() + " "
+        _DAY_PREFIX[day] = prefix
+    return prefix + _HHMM[seconds // 60]
+
+
+def _is_network_path(path):
+    # WAL relies on shared memory, which network file systems do not provide
+    return str(path).startswith(("\\\\", "//"))
+
+
+def default_archive_dir(path):
+    """Directory of the archive files of the database file ``path``.
+
+    ``orders-archive`` next to ``orders.db``; ``None`` for in-memory databases.
+    """
+    path = os.fspath(path)
+    if not path or path == ":memory:":
+        return None
+    return os.path.splitext(path)[0] + "-archive"
+
+
+def archive_path(archive_dir, month):
+    """Path of the archive file of ``month`` (``YYYY-MM``)."""
+    return os.path.join(archive_dir, f"{month}.db")
+
+
+def archive_uri(path, mode="ro"):
+    """``file:`` URI of the archive file ``path``, read-only by default.
+
+    ``mode`` is the SQLite open mode; ``"rw"`` fails instead of creating a
+    missing file. SQLite only accepts an empty or ``localhost`` authority,
+    so UNC paths (``\\\\server\\share\\...``) become
+    ``file:////server/share/...``.
+    """
+    if _is_network_path(path):
+        unc = "//" + os.fspath(path).replace("\\", "/").lstrip("/")
+        return "file://" + quote(unc) + f"?mode={mode}"
+    return Path(path).resolve().as_uri() + f"?mode={mode}"
+
+
+def connect_db(path, wal=True, readers=DEFAULT_READERS, archive_dir=None):
+    """Connect to SQLite database and bring its schema up to date.
+
+    Pending migrations from :mod:`data.migrations` are applied on connect.
+
+    Local database files are switched to WAL journaling with a single
+    writer connection (returned together with its lock) and a pool of
+    ``readers`` read-only connections used by the ``load_*`` functions, so
+    long reports run in parallel with order logging. Pass ``wal=False`` to
+    keep the rollback journal and a single shared connection.
+
+    New database files use incremental auto-vacuum. Archived orders are
+    read from ``archive_dir``, by default :func:`default_archive_dir`.
+    """
     db_lock = threading.Lock()
-    db = sqlite3.connect(path, check_same_thread=False)
+    db = sqlite3.connect(path, check_same_thread=False, factory=Connection, uri=True)
+    db.archive_dir = archive_dir or default_archive_dir(path)
     cur = db.cursor()
-    cur.execute(
-        "CREATE TABLE IF NOT EXISTS orders (order_number TEXT PRIMARY KEY, company TEXT)"
-    )
-    cur.execute(
-        "CREATE TABLE IF NOT EXISTS steps (order_number TEXT, step TEXT, timestamp TEXT)"
-    )
-    cur.execute(
-        "CREATE TABLE IF NOT EXISTS lead_times (order_number TEXT, workstation TEXT, start TEXT, end TEXT, hours REAL)"
-    )
-    db.commit()
+    if not cur.execute("PRAGMA page_count").fetchone()[0]:
+        # Only possible before the first table is created
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    if wal and readers and not _is_network_path(path):
+        cur.execute("PRAGMA journal_mode=WAL")
+        row = cur.fetchone()
+        if row and str(row[0]).lower() == "wal":
+            for pragma in _PRAGMAS:
+                cur.execute(pragma)
+            db.readers = ReaderPool(path, readers)
+    migrate(db)
+    db.order_search = has_order_search(db)
     return db, db_lock
 
 
+@metrics.instrumented
 def record_print_file_start(db, db_lock, order_number):
-    with db_lock:
-        cur = db.cursor()
+    with _locked(db, db_lock):
+        try:
+            cur = db.cursor()
+            order_id, month = _order_sources(cur, [order_number]).get(
+                order_number, (None, None)
+            )
+            if month is not None:
+                # Archived orders are complete; their steps are final
+                return
+            workstation_id = db.workstations.intern(cur, ["Print File"])["Print File"]
+            if order_id is None:
+                cur.execute("INSERT INTO orders(order_number) VALUES (?)", (order_number,))
+                order_id = cur.lastrowid
+            else:
+                cur.execute(
+                    "SELECT 1 FROM steps WHERE order_id=? AND workstation_id=?",
+                    (order_id, workstation_id),
+                )
+                if cur.fetchone():
+                    return
+            ts = to_epoch(datetime.now())
+            cur.execute(
+                "INSERT INTO steps(order_id, workstation_id, timestamp) VALUES (?, ?, ?)",
+                (order_id, workstation_id, ts),
+            )
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+
+
+def _chunks(items, size=500):
+    """Yield ``items`` in lists of at most ``size`` for ``IN (...)`` queries."""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _order_ids(cur, order_numbers):
+    """Map the stored ones of ``order_numbers`` to their ``orders.id``."""
+    ids = {}
+    for chunk in _chunks(order_numbers):
+        marks = ",".join("?" * len(chunk))
         cur.execute(
-            "SELECT 1 FROM steps WHERE order_number=? AND step=?",
-            (order_number, "Print File"),
+            f"SELECT order_number, id FROM orders WHERE order_number IN ({marks})", chunk
         )
-        if cur.fetchone():
-            return
-        ts = datetime.now().isoformat(sep=" ")
+        ids.update(cur.fetchall())
+    return ids
+
+
+def _order_sources(cur, order_numbers):
+    """Map the stored ones of ``order_numbers`` to ``(orders.id, archive month)``.
+
+    The month is ``None`` for orders whose rows are in the live file.
+    """
+    sources = {}
+    for chunk in _chunks(order_numbers):
+        marks = ",".join("?" * len(chunk))
         cur.execute(
-            "INSERT INTO steps(order_number, step, timestamp) VALUES (?, ?, ?)",
-            (order_number, "Print File", ts),
+            "SELECT order_number, id, archived FROM orders "
+            f"WHERE order_number IN ({marks})",
+            chunk,
         )
-        db.commit()
+        sources.update((n, (order_id, month)) for n, order_id, month in cur.fetchall())
+    return sources
 
 
-def log_order(db, db_lock, order_number, company, steps):
-    with db_lock:
-        cur = db.cursor()
+def _archived_order(cur, order_number):
+    """Return ``(orders.id, month)`` if ``order_number`` is archived, else ``None``."""
+    cur.execute(
+        "SELECT id, archived FROM orders WHERE order_number=? AND archived IS NOT NULL",
+        (order_number,),
+    )
+    return cur.fetchone()
+
+
+def _archive_schema(conn, db, month):
+    """Attach the archive file of ``month`` to ``conn`` read-only; return its schema.
+
+    Each connection keeps the last :data:`MAX_ATTACHED_ARCHIVES` archives
+    it used attached and detaches the least recently used beyond that.
+    """
+    attached = getattr(conn, "attached_archives", None)
+    if attached is None:
+        attached = conn.attached_archives = OrderedDict()
+    schema = attached.get(month)
+    if schema is not None:
+        attached.move_to_end(month)
+        return schema
+    if db.archive_dir is None:
+        raise sqlite3.OperationalError(f"No archive directory for archived month {month}")
+    if len(attached) >= MAX_ATTACHED_ARCHIVES:
+        _, oldest = attached.popitem(last=False)
+        conn.execute(f"DETACH DATABASE {oldest}")
+    schema = "archive_" + month.replace("-", "_")
+    uri = archive_uri(archive_path(db.archive_dir, month))
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (uri,))
+    attached[month] = schema
+    return schema
+
+
+def _archive_months(conn, lo, hi, by_day=False):
+    """Months of the archives with lead times starting in ``[lo, hi)``, oldest first.
+
+    With ``by_day`` the range is matched against the rollup days instead.
+    ``lo`` and ``hi`` are epoch seconds, ``None`` when unbounded. The
+    ``archives`` table has one row per month and is read whole.
+    """
+    rows = conn.execute(
+        "SELECT month, first_start, last_start, first_day, last_day FROM archives"
+    ).fetchall()
+    months = []
+    for month, first_start, last_start, first_day, last_day in sorted(rows):
+        first, last = (first_day, last_day) if by_day else (first_start, last_start)
+        if first is None:
+            continue
+        if (lo is None or last >= lo) and (hi is None or first < hi):
+            months.append(month)
+    return months
+
+
+def _source(conn, db, month):
+    """Schema name and ``orders`` filter for reading the rows stored in ``month``.
+
+    ``month`` is ``None`` for the live file. An order lives in exactly one
+    file and ``orders.archived`` says which, so archive rows are limited to
+    the orders marked as archived there.
+    """
+    if month is None:
+        return "main", "", []
+    return _archive_schema(conn, db, month), " AND o.archived = ?", [month]
+
+
+def _encode_steps(steps):
+    return [(step, to_epoch(ts)) for step, ts in steps]
+
+
+def refresh_daily_hours(cur, order_ids, calendar=None):
+    """Rebuild the ``daily_workstation_hours`` rows of the orders ``order_ids``.
+
+    Every stored lead time of the orders is split into the business hours
+    of each calendar day it spans. Runs inside the caller's transaction.
+    """
+    order_ids = list(order_ids)
+    rollup = {}
+    for chunk in _chunks(order_ids):
+        marks = ",".join("?" * len(chunk))
         cur.execute(
-            "INSERT OR REPLACE INTO orders(order_number, company) VALUES (?, ?)",
-            (order_number, company),
+            f"DELETE FROM daily_workstation_hours WHERE order_id IN ({marks})", chunk
         )
         cur.execute(
-            "SELECT timestamp FROM steps WHERE order_number=? AND step=?",
-            (order_number, "Print File"),
+            "SELECT order_id, workstation_id, start, end FROM lead_times "
+            f"WHERE order_id IN ({marks})",
+            chunk,
         )
-        existing_pf = cur.fetchone()
-        cur.execute("DELETE FROM steps WHERE order_number=?", (order_number,))
-        cur.execute("DELETE FROM lead_times WHERE order_number=?", (order_number,))
-        if existing_pf and not any(s[0] == "Print File" for s in steps):
-            ts_pf = datetime.fromisoformat(existing_pf[0]) if existing_pf[0] else None
-            steps = [("Print File", ts_pf)] + steps
-        for step, ts in steps:
-            ts_str = ts.isoformat(sep=" ") if ts else None
-            cur.execute(
-                "INSERT INTO steps(order_number, step, timestamp) VALUES (?, ?, ?)",
-                (order_number, step, ts_str),
+        for order_id, workstation_id, start, end in cur.fetchall():
+            if start is None or end is None:
+                continue
+            for day, hours in business_hours_by_day(
+                from_epoch(start), from_epoch(end), calendar
+            ):
+                key = (_day_epoch(day), workstation_id, order_id)
+                rollup[key] = rollup.get(key, 0.0) + hours
+    cur.executemany(
+        "INSERT INTO daily_workstation_hours(day, workstation_id, order_id, business_hours) "
+        "VALUES (?, ?, ?, ?)",
+        [key + (hours,) for key, hours in rollup.items()],
+    )
+
+
+def _sync_orders(db, cur, companies, jobs, calendar=None):
+    """Bring the stored rows of every order in ``jobs`` up to date.
+
+    ``companies`` maps order numbers to company names and ``jobs`` maps
+    them to ``(step, timestamp)`` lists. A company of ``None`` keeps the
+    stored one. A previously recorded "Print File" timestamp is kept when
+    the new step list does not contain one.
+
+    The incoming steps are compared position by position with the stored
+    ones. Only new, changed or removed step rows are written, and lead
+    times are recomputed only for the adjacent step pairs touching them.
+    Orders whose company and steps are unchanged are not written at all.
+    Archived orders are complete and are left as they are.
+    The caller holds the lock and commits; the return value tells whether
+    anything was written.
+    """
+    stored = {}
+    stored_steps = {}
+    archived = set()
+    for chunk in _chunks(jobs):
+        marks = ",".join("?" * len(chunk))
+        cur.execute(
+            "SELECT order_number, id, company_id, archived FROM orders "
+            f"WHERE order_number IN ({marks})",
+            chunk,
+        )
+        found = []
+        for order_number, order_id, company_id, month in cur.fetchall():
+            if month is not None:
+                archived.add(order_number)
+                continue
+            stored[order_number] = (order_id, company_id)
+            stored_steps[order_id] = []
+            found.append(order_id)
+        if not found:
+            continue
+        marks = ",".join("?" * len(found))
+        cur.execute(
+            "SELECT order_id, rowid, workstation_id, timestamp FROM steps "
+            f"WHERE order_id IN ({marks}) ORDER BY rowid",
+            found,
+        )
+        for order_id, rowid, workstation_id, ts in cur.fetchall():
+            stored_steps[order_id].append((rowid, workstation_id, ts))
+    if archived:
+        jobs = {n: steps for n, steps in jobs.items() if n not in archived}
+    workstation_names = db.workstations.lookup(
+        cur.connection, {w for steps in stored_steps.values() for _, w, _ in steps}
+    )
+
+    company_ids = db.companies.intern(cur, (c for c in companies.values() if c is not None))
+    company_ids[None] = None
+    workstation_ids = db.workstations.intern(
+        cur, (step for steps in jobs.values() for step, _ in steps)
+    )
+    new_orders = [
+        (order_number, company_ids[companies[order_number]])
+        for order_number in jobs
+        if order_number not in stored
+    ]
+    if new_orders:
+        cur.executemany(
+            "INSERT INTO orders(order_number, company_id) VALUES (?, ?)", new_orders
+        )
+        for order_number, order_id in _order_ids(cur, [n for n, _ in new_orders]).items():
+            stored[order_number] = (order_id, company_ids[companies[order_number]])
+            stored_steps[order_id] = []
+
+    company_rows = []
+    step_deletes = []
+    step_updates = []
+    step_inserts = []
+    lead_time_deletes = []
+    pairs = {}
+    order_ids = {}
+    for order_number, steps in jobs.items():
+        order_id, stored_company = stored[order_number]
+        order_ids[order_number] = order_id
+        company_id = company_ids[companies[order_number]]
+        if company_id is not None and stored_company != company_id:
+            company_rows.append((company_id, order_id))
+        old = stored_steps[order_id]
+        old_enc = [(workstation_names[w], ts) for _, w, ts in old]
+        new = list(steps)
+        new_enc = _encode_steps(new)
+        if not any(step == "Print File" for step, _ in new_enc):
+            pf = next(
+                ((w, ts) for _, w, ts in old if workstation_names[w] == "Print File"), None
             )
-        results = compute_lead_times({order_number: steps})
-        for item in results.get(order_number, []):
-            cur.execute(
-                "INSERT INTO lead_times(order_number, workstation, start, end, hours) VALUES (?, ?, ?, ?, ?)",
-                (
-                    order_number,
-                    item["workstation"],
-                    item["start"].isoformat(sep=" "),
-                    item["end"].isoformat(sep=" "),
-                    item["hours"],
-                ),
+            if pf is not None:
+                pf_id, ts = pf
+                workstation_ids.setdefault("Print File", pf_id)
+                new_enc.insert(0, ("Print File", ts))
+                new.insert(0, ("Print File", from_epoch(ts)))
+        if new_enc == old_enc:
+            continue
+
+        changed = set()
+        for i in range(max(len(old_enc), len(new_enc))):
+            if i >= len(new_enc):
+                step_deletes.append((old[i][0],))
+            elif i >= len(old_enc):
+                step, ts = new_enc[i]
+                step_inserts.append((order_id, workstation_ids[step], ts))
+            elif old_enc[i] != new_enc[i]:
+                step, ts = new_enc[i]
+                step_updates.append((workstation_ids[step], ts, old[i][0]))
+            else:
+                continue
+            changed.add(i)
+        # A step takes part in the pair ending at it and the one starting at it
+        for p in sorted({p for i in changed for p in (i - 1, i) if p >= 0}):
+            if p + 1 < len(old):
+                (_, _, start), (_, workstation_id, end) = old[p], old[p + 1]
+                if start is not None and end is not None:
+                    lead_time_deletes.append((order_id, workstation_id, start, end))
+            if p + 1 < len(new):
+                pairs[(order_number, p)] = new[p : p + 2]
+
+    if not (
+        new_orders or company_rows or step_deletes or step_updates or step_inserts or pairs
+    ):
+        return False
+    cur.executemany("UPDATE orders SET company_id=? WHERE id=?", company_rows)
+    cur.executemany(
+        "DELETE FROM lead_times WHERE rowid IN (SELECT rowid FROM lead_times "
+        "WHERE order_id=? AND workstation_id=? AND start=? AND end=? LIMIT 1)",
+        lead_time_deletes,
+    )
+    cur.executemany("DELETE FROM steps WHERE rowid=?", step_deletes)
+    cur.executemany(
+        "UPDATE steps SET workstation_id=?, timestamp=? WHERE rowid=?", step_updates
+    )
+    cur.executemany(
+        "INSERT INTO steps(order_id, workstation_id, timestamp) VALUES (?, ?, ?)",
+        step_inserts,
+    )
+    results = compute_lead_times(pairs, calendar=calendar)
+    cur.executemany(
+        "INSERT INTO lead_times(order_id, workstation_id, start, end, hours) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                order_ids[order_number],
+                workstation_ids[item["workstation"]],
+                to_epoch(item["start"]),
+                to_epoch(item["end"]),
+                item["hours"],
             )
-        db.commit()
+            for (order_number, _), items in results.items()
+            for item in items
+        ],
+    )
+    refresh_daily_hours(
+        cur,
+        {order_id for order_id, *_ in lead_time_deletes}
+        | {order_ids[order_number] for order_number, _ in pairs},
+        calendar,
+    )
+    return True
 
 
-def load_steps(db, db_lock, order_number):
+@metrics.instrumented
+def log_order(db, db_lock, order_number, company, steps, calendar=None):
+    """Store the current company and steps of one order.
+
+    Only rows that differ from what is stored are written and nothing is
+    committed when the order is unchanged. Returns whether anything was
+    written.
+    """
+    with _locked(db, db_lock):
+        try:
+            changed = _sync_orders(
+                db,
+                db.cursor(),
+                {order_number: company},
+                {order_number: list(steps)},
+                calendar,
+            )
+            if changed:
+                db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+    return changed
+
+
+@metrics.instrumented
+def log_orders(db, db_lock, orders, calendar=None, unchanged=()):
+    """Log a whole scraped page of orders in a single transaction.
+
+    ``orders`` is the list of :class:`parsers.manage_html.Order` objects
+    returned by :func:`parsers.manage_html.parse_orders`. Each order is
+    stored exactly as :func:`log_order` would, but all statements are
+    batched with ``executemany`` and committed once, or not at all when no
+    order changed. Orders whose numbers are in ``unchanged`` are known to
+    be stored already (see :class:`parsers.row_cache.RowCache`) and are
+    skipped without being read back. Returns whether anything was written.
+    """
+    companies = {}
+    jobs = {}
+    for order in orders:
+        if order.number in unchanged:
+            continue
+        companies[order.number] = order.company
+        jobs[order.number] = [(s.name, s.timestamp) for s in order.steps]
+    if not jobs:
+        return False
+    with _locked(db, db_lock):
+        try:
+            changed = _sync_orders(db, db.cursor(), companies, jobs, calendar)
+            if changed:
+                db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+    return changed
+
+
+@contextmanager
+def _locked(db, db_lock):
+    """Hold ``db_lock``, adding the time spent waiting for it to the current call.
+
+    ``db`` times its statements for the current call while the lock is held.
+    """
+    call = metrics.current()
+    if call is None:
+        with db_lock:
+            yield
+        return
+    started = perf_counter()
     with db_lock:
-        cur = db.cursor()
+        call.lock_wait += perf_counter() - started
+        with metrics.timed(db):
+            yield
+
+
+@contextmanager
+def _reading(db, db_lock):
+    """Yield a connection for read-only queries.
+
+    Uses a pooled reader when ``db`` has one, without taking ``db_lock``;
+    otherwise the shared connection is used while holding the lock.
+    """
+    pool = db.readers if isinstance(db, Connection) else None
+    call = metrics.current()
+    if pool is None:
+        with _locked(db, db_lock):
+            yield db
+    elif call is None:
+        with pool.connection() as conn:
+            yield conn
+    else:
+        started = perf_counter()
+        with pool.connection() as conn:
+            call.lock_wait += perf_counter() - started
+            with metrics.timed(conn):
+                yield conn
+
+
+@metrics.instrumented
+def load_steps(db, db_lock, order_number):
+    with _reading(db, db_lock) as conn:
+        cur = conn.cursor()
         cur.execute(
-            "SELECT step, timestamp FROM steps WHERE order_number=? ORDER BY rowid",
+            "SELECT s.workstation_id, s.timestamp FROM steps s "
+            "JOIN orders o ON o.id = s.order_id WHERE o.order_number=? ORDER BY s.rowid",
             (order_number,),
         )
-        steps = []
-        for step, ts_str in cur.fetchall():
-            ts = datetime.fromisoformat(ts_str) if ts_str else None
-            steps.append((step, ts))
+        rows = cur.fetchall()
+        # Archived orders have no rows left in the live file
+        archived = _archived_order(cur, order_number) if not rows else None
+        if archived is not None:
+            order_id, month = archived
+            schema = _archive_schema(conn, db, month)
+            cur.execute(
+                f"SELECT workstation_id, timestamp FROM {schema}.steps "
+                "WHERE order_id=? ORDER BY rowid",
+                (order_id,),
+            )
+            rows = cur.fetchall()
+        names = db.workstations.lookup(conn, {w for w, _ in rows})
+    return [(names[w], from_epoch(ts)) for w, ts in rows]
+
+
+@metrics.instrumented
+def load_steps_many(db, db_lock, order_numbers):
+    """Load the steps of several orders with one chunked ``IN`` query each.
+
+    Returns a dict mapping every requested order number to its
+    ``(step, timestamp)`` list, empty for unknown orders.
+    """
+    steps = {order_number: [] for order_number in order_numbers}
+    with _reading(db, db_lock) as conn:
+        cur = conn.cursor()
+        by_id = {}
+        by_month = {}
+        for n, (order_id, month) in _order_sources(cur, steps).items():
+            by_id[order_id] = steps[n]
+            by_month.setdefault(month, []).append(order_id)
+        rows = []
+        for month, order_ids in by_month.items():
+            schema = _source(conn, db, month)[0]
+            for chunk in _chunks(order_ids):
+                marks = ",".join("?" * len(chunk))
+                cur.execute(
+                    f"SELECT order_id, workstation_id, timestamp FROM {schema}.steps "
+                    f"WHERE order_id IN ({marks}) ORDER BY rowid",
+                    chunk,
+                )
+                rows.extend(cur.fetchall())
+        names = db.workstations.lookup(conn, {w for _, w, _ in rows})
+    for order_id, w, ts in rows:
+        by_id[order_id].append((names[w], from_epoch(ts)))
     return steps
 
 
+@metrics.instrumented
+def search_orders(db, db_lock, term):
+    """Return the order numbers whose number or company contains ``term``.
+
+    Matching ignores case and covers every stored order. Terms of three or
+    more characters are looked up in the ``order_search`` trigram index;
+    shorter ones are too short for trigrams and scan ``orders`` instead,
+    as do all terms when SQLite is too old for the index (before 3.34).
+    """
+    term = term.strip()
+    if not term:
+        return set()
+    if len(term) >= 3 and getattr(db, "order_search", True):
+        query = "SELECT order_number FROM order_search WHERE order_search MATCH ?"
+        params = ['"' + term.replace('"', '""') + '"']
+    else:
+        pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = (
+            "SELECT o.order_number FROM orders o "
+            "LEFT JOIN companies c ON c.id = o.company_id "
+            "WHERE o.order_number LIKE ? ESCAPE '\\' OR c.name LIKE ? ESCAPE '\\'"
+        )
+        params = [pattern, pattern]
+    with _reading(db, db_lock) as conn:
+        return {row[0] for row in conn.execute(query, params).fetchall()}
+
+
+def _lead_time_filter(start_date, end_date):
+    query = ""
+    params = []
+    if start_date:
+        query += " AND start >= ?"
+        params.append(to_epoch(start_date))
+    if end_date:
+        query += " AND end <= ?"
+        params.append(to_epoch(end_date))
+    return query, params
+
+
+@metrics.instrumented
 def load_lead_times(db, db_lock, order_number, start_date=None, end_date=None):
     """Load precomputed lead times optionally filtered by date range."""
-    with db_lock:
-        cur = db.cursor()
-        query = "SELECT workstation, start, end, hours FROM lead_times WHERE order_number=?"
-        params = [order_number]
-        if start_date:
-            query += " AND start >= ?"
-            params.append(start_date.isoformat(sep=" "))
-        if end_date:
-            query += " AND end <= ?"
-            params.append(end_date.isoformat(sep=" "))
-        query += " ORDER BY start"
-        cur.execute(query, params)
-        rows = [
+    with _reading(db, db_lock) as conn:
+        cur = conn.cursor()
+        filter_sql, filter_params = _lead_time_filter(start_date, end_date)
+        cur.execute(
+            "SELECT workstation_id, start, end, hours FROM lead_times "
+            "WHERE order_id = (SELECT id FROM orders WHERE order_number=?)"
+            f"{filter_sql} ORDER BY start",
+            [order_number] + filter_params,
+        )
+        rows = cur.fetchall()
+        archived = _archived_order(cur, order_number) if not rows else None
+        if archived is not None:
+            order_id, month = archived
+            schema = _archive_schema(conn, db, month)
+            cur.execute(
+                f"SELECT workstation_id, start, end, hours FROM {schema}.lead_times "
+                f"WHERE order_id=?{filter_sql} ORDER BY start",
+                [order_id] + filter_params,
+            )
+            rows = cur.fetchall()
+        names = db.workstations.lookup(conn, {r[0] for r in rows})
+    return [
+        {
+            "workstation": names[r[0]],
+            "start": from_epoch(r[1]),
+            "end": from_epoch(r[2]),
+            "hours": r[3],
+        }
+        for r in rows
+    ]
+
+
+@metrics.instrumented
+def load_lead_times_many(db, db_lock, order_numbers, start_date=None, end_date=None):
+    """Load precomputed lead times of several orders, optionally filtered.
+
+    Returns a dict mapping every requested order number to its rows as
+    returned by :func:`load_lead_times`, empty when nothing matches.
+    """
+    lead_times = {order_number: [] for order_number in order_numbers}
+    filter_sql, filter_params = _lead_time_filter(start_date, end_date)
+    with _reading(db, db_lock) as conn:
+        cur = conn.cursor()
+        by_id = {}
+        by_month = {}
+        for n, (order_id, month) in _order_sources(cur, lead_times).items():
+            by_id[order_id] = lead_times[n]
+            by_month.setdefault(month, []).append(order_id)
+        rows = []
+        for month, order_ids in by_month.items():
+            schema = _source(conn, db, month)[0]
+            for chunk in _chunks(order_ids):
+                marks = ",".join("?" * len(chunk))
+                cur.execute(
+                    "SELECT order_id, workstation_id, start, end, hours "
+                    f"FROM {schema}.lead_times WHERE order_id IN ({marks}){filter_sql} "
+                    "ORDER BY order_id, start",
+                    chunk + filter_params,
+                )
+                rows.extend(cur.fetchall())
+        names = db.workstations.lookup(conn, {r[1] for r in rows})
+    for order_id, workstation_id, start, end, hours in rows:
+        by_id[order_id].append(
             {
-                "workstation": r[0],
-                "start": datetime.fromisoformat(r[1]),
-                "end": datetime.fromisoformat(r[2]),
-                "hours": r[3],
+                "workstation": names[workstation_id],
+                "start": from_epoch(start),
+                "end": from_epoch(end),
+                "hours": hours,
             }
-            for r in cur.fetchall()
-        ]
-    return rows
+        )
+    return lead_times
+
 
+@metrics.instrumented
+def load_order_hours(db, db_lock, start=None, end=None):
+    """Return business hours per order falling on the days ``start``..``end``.
 
+    Summed from ``daily_workstation_hours``, so only the part of each lead
+    time inside the range is counted. ``end`` is inclusive.
+    """
+    query = (
+        "SELECT o.order_number, SUM(d.business_hours) FROM {schema}.daily_workstation_hours d "
+        "JOIN orders o ON o.id = d.order_id WHERE 1=1"
+    )
+    params = []
+    lo = hi = None
+    if start:
+        lo = _day_epoch(start)
+        query += " AND d.day >= ?"
+        params.append(lo)
+    if end:
+        hi = _day_epoch(end) + _DAY_SECONDS
+        query += " AND d.day < ?"
+        params.append(hi)
+    hours = {}
+    with _reading(db, db_lock) as conn:
+        cur = conn.cursor()
+        for month in _archive_months(conn, lo, hi, by_day=True) + [None]:
+            schema, archived_sql, archived_params = _source(conn, db, month)
+            cur.execute(
+                query.format(schema=schema) + archived_sql + " GROUP BY d.order_id",
+                params + archived_params,
+            )
+            hours.update(cur.fetchall())
+    return hours
+
+
+def _start_bounds(start, end):
+    """Epoch bounds ``[lo, hi)`` of the lead times starting on the days ``start``..``end``."""
+    return (
+        to_epoch(start) if start else None,
+        to_epoch(end + timedelta(days=1)) if end else None,
+    )
+
+
+def _start_range_filter(start, end):
+    """SQL filter for lead times starting on the days ``start``..``end``."""
+    lo, hi = _start_bounds(start, end)
+    query = ""
+    params = []
+    if lo is not None:
+        query += " AND lt.start >= ?"
+        params.append(lo)
+    if hi is not None:
+        query += " AND lt.start < ?"
+        params.append(hi)
+    return query, params
+
+
+@metrics.instrumented
 def load_jobs_by_date_range(db, db_lock, start, end):
     """Fetch jobs within start/end dates from the database."""
-    with db_lock:
-        cur = db.cursor()
-        query = (
-            "SELECT lt.order_number, COALESCE(o.company,''), lt.workstation, lt.hours, lt.start, lt.end "
-            "FROM lead_times lt LEFT JOIN orders o ON o.order_number = lt.order_number WHERE 1=1"
+    filter_sql, params = _start_range_filter(start, end)
+    fetched = []
+    with _reading(db, db_lock) as conn:
+        cur = conn.cursor()
+        for month in _archive_months(conn, *_start_bounds(start, end)) + [None]:
+            schema, archived_sql, archived_params = _source(conn, db, month)
+            cur.execute(
+                "SELECT o.order_number, o.company_id, lt.workstation_id, lt.hours, "
+                f"lt.start, lt.end FROM {schema}.lead_times lt "
+                f"JOIN orders o ON o.id = lt.order_id WHERE 1=1{filter_sql}{archived_sql}",
+                params + archived_params,
+            )
+            fetched.extend(cur.fetchall())
+        companies = db.companies.lookup(conn, {r[1] for r in fetched} - {None})
+        workstations = db.workstations.lookup(conn, {r[2] for r in fetched})
+    rows = []
+    for order, company_id, ws, hours, s, e in fetched:
+        rows.append(
+            {
+                "order": order,
+                "company": companies.get(company_id, ""),
+                "workstation": workstations[ws],
+                "hours": hours or 0.0,
+                "status": "Completed" if e is not None else "In Progress",
+                "start": _minutes(s),
+                "end": _minutes(e),
+            }
         )
-        params = []
-        if start:
-            query += " AND lt.start >= ?"
-            params.append(start.isoformat(sep=" "))
-        if end:
-            end_excl = end + timedelta(days=1)
-            query += " AND lt.start < ?"
-            params.append(end_excl.isoformat(sep=" "))
-        cur.execute(query, params)
-        rows = []
-        for order, company, ws, hours, s, e in cur.fetchall():
-            status = "Completed" if e else "In Progress"
-            rows.append(
+    return rows
+
+
+_BY_ORDER = itemgetter("order")
+
+
+@metrics.instrumented
+def load_order_groups_by_date_range(db, db_lock, start, end):
+    """Per-order totals of the lead times starting on the days ``start``..``end``.
+
+    Returns one dict per order, ordered by order number, with ``order``,
+    ``company``, the summed ``hours`` and ``status``: "In Progress" if one
+    of its lead times is open or one of its steps has no timestamp yet.
+    Summing and the status are worked out in SQLite, so only one row per
+    order reaches Python; the workstation rows of an order are loaded with
+    :func:`load_lead_times_many` and :func:`load_steps_many` when needed.
+    """
+    filter_sql, params = _start_range_filter(start, end)
+    groups = []
+    with _reading(db, db_lock) as conn:
+        cur = conn.cursor()
+        months = _archive_months(conn, *_start_bounds(start, end))
+        for month in months + [None]:
+            schema, archived_sql, archived_params = _source(conn, db, month)
+            # Archived orders are complete and have no live steps
+            cur.execute(
+                "SELECT o.order_number, o.company_id, TOTAL(lt.hours), "
+                "MAX(lt.end IS NULL) OR EXISTS (SELECT 1 FROM main.steps s "
+                "WHERE s.order_id = lt.order_id AND s.timestamp IS NULL) "
+                f"FROM {schema}.lead_times lt JOIN orders o ON o.id = lt.order_id "
+                f"WHERE 1=1{filter_sql}{archived_sql} "
+                "GROUP BY lt.order_id ORDER BY o.order_number",
+                params + archived_params,
+            )
+            groups.extend(
                 {
                     "order": order,
-                    "company": company,
-                    "workstation": ws,
-                    "hours": hours or 0.0,
-                    "status": status,
-                    "start": s[:16] if s else "",
-                    "end": e[:16] if e else "",
+                    "company": company_id,
+                    "hours": hours,
+                    "status": "In Progress" if open_ else "Completed",
                 }
+                for order, company_id, hours, open_ in cur.fetchall()
             )
-    return rows
+        companies = db.companies.lookup(conn, {g["company"] for g in groups} - {None})
+    if months:
+        # Each file is ordered on its own; an order is stored in only one
+        groups.sort(key=_BY_ORDER)
+    for g in groups:
+        g["company"] = companies.get(g["company"], "")
+    return groups
+
+
+JobRow = namedtuple("JobRow", "order company workstation hours start end")
+
+
+def iter_jobs_by_date_range(db, db_lock, start, end, page_size=DEFAULT_PAGE_SIZE):
+    """Yield the lead times starting on the days ``start``..``end`` as :class:`JobRow`.
+
+    The rows of one order arrive together, ordered by start. Archived
+    orders come first, an archive month at a time, then the orders in the
+    live file; within each file orders come in the order they were first
+    stored. The ids of the orders with lead times in the range are looked
+    up once per file on the ``start`` index, then their rows are read
+    ``page_size`` at a time with keyset pagination on the
+    ``(order_id, start)`` index, so the cost follows the size of the range
+    rather than of the table. The lock or pooled reader is only held while
+    a page is read, so writers can proceed between pages, and only the
+    order ids of the current file are kept in memory.
+    """
+    filter_sql, filter_params = _start_range_filter(start, end)
+    # Without a bound every row matches and a scan is the cheapest way
+    by_start = " INDEXED BY idx_lead_times_start" if filter_params else ""
+    # Sorted and deduplicated in Python, which is cheaper than a temporary
+    # b-tree; the orders join is only needed to filter archive files
+    ids_query = (
+        f"SELECT lt.order_id FROM {{schema}}.lead_times lt{by_start}{{join}} "
+        f"WHERE 1=1{filter_sql}{{archived}}"
+    )
+    query = (
+        "SELECT lt.rowid, lt.order_id, o.order_number, o.company_id, lt.workstation_id, "
+        "lt.hours, lt.start, lt.end "
+        "FROM {schema}.lead_times lt INDEXED BY idx_lead_times_order_start "
+        "JOIN orders o ON o.id = lt.order_id "
+        f"WHERE {{orders}}{filter_sql}{{archived}}{{after}} "
+        "ORDER BY lt.order_id, lt.start, lt.rowid LIMIT ?"
+    )
+    after = " AND (lt.order_id, lt.start, lt.rowid) > (?, ?, ?)"
+    months = None
+    ids = None
+    pos = 0
+    key = None
+    while True:
+        # Timed per page so the time the caller spends between rows is left out
+        with metrics.CallTimer("iter_jobs_by_date_range"):
+            with _reading(db, db_lock) as conn:
+                if months is None:
+                    months = _archive_months(conn, *_start_bounds(start, end)) + [None]
+                schema, archived_sql, archived_params = _source(conn, db, months[0])
+                cur = conn.cursor()
+                if ids is None:
+                    join = " JOIN orders o ON o.id = lt.order_id" if archived_sql else ""
+                    cur.execute(
+                        ids_query.format(schema=schema, join=join, archived=archived_sql),
+                        filter_params + archived_params,
+                    )
+                    ids = sorted({order_id for order_id, in cur.fetchall()})
+                # Every order in the window but the one the page resumes in
+                # has a row left in the range, so page_size + 1 orders fill a page
+                window = ids[pos : pos + min(page_size + 1, 500)]
+                page = []
+                if window:
+                    if window[-1] - window[0] < 2 * len(window):
+                        # Mostly consecutive ids, as in wide ranges: one index range
+                        orders_sql = "lt.order_id BETWEEN ? AND ?"
+                        window_params = [window[0], window[-1]]
+                    else:
+                        orders_sql = f"lt.order_id IN ({','.join('?' * len(window))})"
+                        window_params = window
+                    cur.execute(
+                        query.format(
+                            schema=schema,
+                            orders=orders_sql,
+                            archived=archived_sql,
+                            after=after if key else "",
+                        ),
+                        window_params
+                        + filter_params
+                        + archived_params
+                        + list(key or ())
+                        + [page_size],
+                    )
+                    page = cur.fetchall()
+                companies = db.companies.lookup(conn, {r[3] for r in page} - {None})
+                workstations = db.workstations.lookup(conn, {r[4] for r in page})
+            rows = [
+                JobRow(
+                    order,
+                    companies.get(company_id, ""),
+                    workstations[ws],
+                    hours or 0.0,
+                    from_epoch(s),
+                    from_epoch(e),
+                )
+                for _, _, order, company_id, ws, hours, s, e in page
+            ]
+        yield from rows
+        if len(page) == page_size:
+            rowid, order_id, _, _, _, _, s, _ = page[-1]
+            key = (order_id, s, rowid)
+            pos = bisect_left(ids, order_id, pos)
+            continue
+        # Every order in the window is done
+        pos += len(window)
+        key = None
+        if pos < len(ids):
+            continue
+        # This file is done; go on with the next one
+        months.pop(0)
+        if not months:
+            return
+        ids = None
+        pos = 0
@@ -0,0 +1,455 @@
+"""In-process timing of the :mod:`data.db` functions.
+
+Every public ``data.db`` function runs inside a :class:`CallTimer`. While
+:data:`registry` is enabled, each call records how long it waited for the
+database lock or a pooled reader, how long SQLite spent executing its
+statements, fetching their rows and committing, how many statements it
+ran and rows it fetched, and the rest of its time, which is spent in
+Python decoding rows (or, for writes, diffing them).
+:meth:`MetricsRegistry.snapshot` returns the totals per function.
+
+Statements whose execution and fetching take longer than
+``registry.slow_threshold`` seconds are logged as warnings to the
+``data.slow_queries`` logger together with their ``EXPLAIN QUERY PLAN``.
+
+The registry is enabled by default, so timing has to be cheap next to a
+single-order lookup of about 15 µs. Calls are therefore sampled: after a
+timed call shorter than ``registry.sample_below`` seconds, the calls of
+the same function in the next ``registry.sample_interval`` seconds are
+only counted, and its totals are extrapolated from the timed calls
+(``sampled`` says how many there were). Slower functions are timed on
+every call, which keeps their slow statements logged.
+
+Statements are timed by a :class:`TimedConnection` subclass that
+:func:`timed` swaps in while a timed call holds the connection; other
+calls use the plain class and do not pay for its Python-level
+``cursor()``. A timed call costs a few microseconds plus one or two per
+statement, and its cursors and the swap also slow the calls right after
+it while Python re-optimises the code they share, which is why cheap
+calls are sampled by time rather than one in so many.
+"""
+
+import functools
+import logging
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from itertools import chain
+from time import perf_counter
+
+slow_log = logging.getLogger("data.slow_queries")
+
+DEFAULT_SLOW_THRESHOLD = 0.25
+DEFAULT_SAMPLE_INTERVAL = 1.0
+DEFAULT_SAMPLE_BELOW = 0.005
+
+
+class _Local(threading.local):
+    # A class default is much cheaper to read than a missing attribute
+    call = None
+
+
+_local = _Local()
+
+
+class FunctionStats:
+    """Running totals of the timed calls of one function; times are in seconds."""
+
+    __slots__ = ("sampled", "statements", "rows", "total", "lock_wait", "sql", "decode", "max")
+
+    def __init__(self):
+        self.sampled = 0
+        self.statements = 0
+        self.rows = 0
+        self.total = 0.0
+        self.lock_wait = 0.0
+        self.sql = 0.0
+        self.decode = 0.0
+        self.max = 0.0
+
+    def as_dict(self, skipped=0):
+        """The totals of all ``sampled + skipped`` calls, extrapolated."""
+        calls = self.sampled + skipped
+        scale = calls / self.sampled
+        return {
+            "calls": calls,
+            "sampled": self.sampled,
+            "statements": round(self.statements * scale),
+            "rows": round(self.rows * scale),
+            "total": self.total * scale,
+            "lock_wait": self.lock_wait * scale,
+            "sql": self.sql * scale,
+            "decode": self.decode * scale,
+            "max": self.max,
+        }
+
+
+class _Sampler:
+    """Which calls of one function are timed; see :func:`instrumented`."""
+
+    __slots__ = ("next_at", "skipped")
+
+    def __init__(self):
+        # The first call is always timed
+        self.next_at = 0.0
+        self.skipped = 0
+
+
+class MetricsRegistry:
+    """Thread-safe collection of :class:`FunctionStats` keyed by function name.
+
+    :meth:`record` only appends the call to a queue, without locking; the
+    queue is folded into the totals when they are read or once
+    ``MAX_QUEUED`` calls are waiting.
+    """
+
+    MAX_QUEUED = 10000
+
+    def __init__(
+        self,
+        enabled=True,
+        slow_threshold=DEFAULT_SLOW_THRESHOLD,
+        sample_interval=DEFAULT_SAMPLE_INTERVAL,
+        sample_below=DEFAULT_SAMPLE_BELOW,
+    ):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.sample_interval = sample_interval
+        self.sample_below = sample_below
+        self._stats = {}
+        self._samplers = {}
+        self._queued = deque()
+        self._lock = threading.Lock()
+
+    def sampler(self, name):
+        """Return the :class:`_Sampler` of the function ``name``."""
+        with self._lock:
+            return self._samplers.setdefault(name, _Sampler())
+
+    def record(self, name, total, lock_wait, sql, statements, rows):
+        self._queued.append((name, total, lock_wait, sql, statements, rows))
+        if len(self._queued) >= self.MAX_QUEUED:
+            self._fold()
+
+    def _fold(self):
+        with self._lock:
+            queued = self._queued
+            while queued:
+                name, total, lock_wait, sql, statements, rows = queued.popleft()
+                stats = self._stats.get(name)
+                if stats is None:
+                    stats = self._stats[name] = FunctionStats()
+                stats.sampled += 1
+                stats.statements += statements
+                stats.rows += rows
+                stats.total += total
+                stats.lock_wait += lock_wait
+                stats.sql += sql
+                stats.decode += max(total - lock_wait - sql, 0.0)
+                if total > stats.max:
+                    stats.max = total
+
+    def snapshot(self):
+        """Return ``{function: {"calls", "sampled", "statements", "rows", ...}}``.
+
+        ``calls`` counts every call and ``sampled`` the timed ones; the
+        statements, rows and times (``total``, ``lock_wait``, ``sql`` and
+        ``decode``) are extrapolated from them to all calls, while
+        ``max`` is the slowest timed call. Times are in seconds.
+        """
+        self._fold()
+        with self._lock:
+            return {
+                name: stats.as_dict(
+                    self._samplers[name].skipped if name in self._samplers else 0
+                )
+                for name, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._queued.clear()
+            self._stats = {}
+            for sampler in self._samplers.values():
+                sampler.next_at = 0.0
+                sampler.skipped = 0
+
+    def summary(self):
+        """Format the snapshot as a table, slowest functions first."""
+        lines = [
+            f"{'function':<32} {'calls':>7} {'sampled':>7} {'stmts':>7} {'rows':>9} "
+            f"{'total_ms':>10} {'lock_ms':>9} {'sql_ms':>9} {'decode_ms':>9}"
+        ]
+        stats = sorted(self.snapshot().items(), key=lambda item: -item[1]["total"])
+        for name, s in stats:
+            lines.append(
+                f"{name:<32} {s['calls']:>7} {s['sampled']:>7} {s['statements']:>7} "
+                f"{s['rows']:>9} "
+                f"{s['total'] * 1e3:>10.1f} "
+                f"{s['lock_wait'] * 1e3:>9.1f} {s['sql'] * 1e3:>9.1f} {s['decode'] * 1e3:>9.1f}"
+            )
+        return "\n".join(lines)
+
+
+registry = MetricsRegistry()
+
+
+def current():
+    """Return the :class:`CallTimer` active in this thread, if any."""
+    return _local.call
+
+
+class CallTimer:
+    """Record the database work done in a ``with`` block as one call of ``name``.
+
+    Blocks nested in an active timer are counted as part of the outer call.
+    """
+
+    __slots__ = (
+        "name",
+        "lock_wait",
+        "sql",
+        "statements",
+        "rows",
+        "cursors",
+        "threshold",
+        "total",
+        "_started",
+    )
+
+    def __init__(self, name):
+        self.name = name
+        self.total = 0.0
+        self._started = None
+
+    def __enter__(self):
+        if registry.enabled and _local.call is None:
+            self.lock_wait = 0.0
+            self.sql = 0.0
+            self.statements = 0
+            self.rows = 0
+            self.cursors = []
+            threshold = registry.slow_threshold
+            self.threshold = float("inf") if threshold is None else threshold
+            _local.call = self
+            self._started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._started is None:
+            return
+        total = self.total = perf_counter() - self._started
+        self._started = None
+        _local.call = None
+        for cur in self.cursors:
+            if cur._plan is not None:
+                cur._log_slow()
+        # The cursors keep a reference to this timer, not the other way round
+        self.cursors = None
+        registry.record(
+            self.name, total, self.lock_wait, self.sql, self.statements, self.rows
+        )
+
+
+def instrumented(func):
+    """Time calls of ``func`` in a :class:`CallTimer` named after it.
+
+    After a timed call shorter than ``registry.sample_below`` the calls
+    in the next ``registry.sample_interval`` seconds are only counted;
+    after a longer one the next call is timed again.
+    """
+    name = func.__name__
+    sampler = registry.sampler(name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if registry.enabled:
+            if perf_counter() < sampler.next_at:
+                sampler.skipped += 1
+            elif _local.call is None:
+                timer = CallTimer(name)
+                try:
+                    with timer:
+                        return func(*args, **kwargs)
+                finally:
+                    if timer.total < registry.sample_below:
+                        sampler.next_at = perf_counter() + registry.sample_interval
+                    else:
+                        sampler.next_at = 0.0
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor adding the time and rows of its statements to a :class:`CallTimer`.
+
+    A statement is timed from ``execute`` until its rows are fetched or the
+    next statement starts.
+    """
+
+    call = None
+    _sql = None
+    _params = ()
+    _elapsed = 0.0
+    _rows = 0
+    _plan = None
+
+    def _explain(self):
+        # Run right away, while this thread still owns the connection
+        try:
+            plan = sqlite3.Cursor(self.connection).execute(
+                "EXPLAIN QUERY PLAN " + self._sql, self._params
+            ).fetchall()
+        except sqlite3.Error as exc:
+            self._plan = f"  (no plan: {exc})"
+        else:
+            self._plan = "\n".join(f"  {detail}" for _, _, _, detail in plan) or "  (no plan)"
+
+    def _log_slow(self):
+        slow_log.warning(
+            "Slow query in %s (%.1f ms, %d rows): %s\n%s",
+            self.call.name,
+            self._elapsed * 1e3,
+            self._rows,
+            " ".join(self._sql.split()),
+            self._plan,
+        )
+        # Logged once, however many rows are fetched after this
+        self._plan = self._sql = None
+
+    def _fetched(self, elapsed, rows):
+        call = self.call
+        call.sql += elapsed
+        call.rows += rows
+        self._rows += rows
+        self._elapsed += elapsed
+        if self._elapsed >= call.threshold and self._plan is None and self._sql is not None:
+            self._explain()
+
+    def execute(self, sql, parameters=()):
+        if self._plan is not None:
+            self._log_slow()
+        self._sql = sql
+        self._params = parameters
+        self._rows = 0
+        started = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = self._elapsed = perf_counter() - started
+            call = self.call
+            call.sql += elapsed
+            call.statements += 1
+            if elapsed >= call.threshold:
+                self._explain()
+
+    def executemany(self, sql, seq_of_parameters):
+        if self._plan is not None:
+            self._log_slow()
+        # The first parameters are kept for EXPLAIN; iterators are put back together
+        rest = iter(seq_of_parameters)
+        first = next(rest, None)
+        self._sql = sql
+        self._params = () if first is None else first
+        self._rows = 0
+        started = perf_counter()
+        try:
+            return super().executemany(sql, rest if first is None else chain((first,), rest))
+        finally:
+            elapsed = self._elapsed = perf_counter() - started
+            call = self.call
+            call.sql += elapsed
+            call.statements += 1
+            if elapsed >= call.threshold:
+                self._explain()
+
+    def fetchone(self):
+        started = perf_counter()
+        row = super().fetchone()
+        self._fetched(perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = perf_counter()
+        rows = super().fetchall()
+        self._fetched(perf_counter() - started, len(rows))
+        if self._plan is not None:
+            self._log_slow()
+        return rows
+
+    def __next__(self):
+        started = perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(perf_counter() - started, 0)
+            raise
+        self._fetched(perf_counter() - started, 1)
+        return row
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors are timed while a :class:`CallTimer` is active.
+
+    Mixed into the class of a connection by :func:`timed`.
+    """
+
+    def cursor(self, factory=sqlite3.Cursor):
+        call = _local.call
+        if call is None or factory is not sqlite3.Cursor:
+            return super().cursor(factory)
+        cur = super().cursor(TimedCursor)
+        cur.call = call
+        call.cursors.append(cur)
+        return cur
+
+    def execute(self, sql, parameters=()):
+        # sqlite3.Connection.execute does not go through cursor()
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        call = _local.call
+        if call is None:
+            return super().commit()
+        started = perf_counter()
+        try:
+            return super().commit()
+        finally:
+            call.sql += perf_counter() - started
+
+
+_timed_classes = {}
+
+
+@contextmanager
+def timed(conn):
+    """Time the statements run on ``conn`` by the active :class:`CallTimer`.
+
+    The class of ``conn`` is swapped for a :class:`TimedConnection`
+    subclass of it until the block ends, so the caller must hold ``conn``
+    on its own meanwhile (under the database lock or as a pooled reader).
+    Other threads using it anyway are not timed. Connections of the
+    built-in class and those already timed are left as they are.
+    """
+    plain = type(conn)
+    if _local.call is None or plain is sqlite3.Connection or issubclass(plain, TimedConnection):
+        yield conn
+        return
+    timed_class = _timed_classes.get(plain)
+    if timed_class is None:
+        timed_class = _timed_classes[plain] = type(
+            f"Timed{plain.__name__}", (TimedConnection, plain), {"__module__": plain.__module__}
+        )
+    conn.__class__ = timed_class
+    try:
+        yield conn
+    finally:
+        conn.__class__ = plain
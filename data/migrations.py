@@ -0,0 +1,394 @@
+"""Versioned schema migrations for the orders database.
+
+The schema version is stored in SQLite's ``PRAGMA user_version``. Each
+entry in :data:`MIGRATIONS` upgrades the schema by one version and runs in
+its own transaction together with the version bump, so an existing
+``orders.db`` is either fully upgraded to a version or left untouched.
+
+To change the schema, append a new function to :data:`MIGRATIONS`; never
+edit or reorder the existing ones.
+"""
+
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+from time_utils import DEFAULT_CALENDAR, business_hours_by_day
+
+
+def _base_tables(cur):
+    """Version 1: the original tables, as created before versioning."""
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS orders (order_number TEXT PRIMARY KEY, company TEXT)"
+    )
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS steps (order_number TEXT, step TEXT, timestamp TEXT)"
+    )
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS lead_times (order_number TEXT, workstation TEXT, start TEXT, end TEXT, hours REAL)"
+    )
+
+
+def _lookup_indexes(cur):
+    """Version 2: indexes for per-order lookups and date range filters."""
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_steps_order_step ON steps(order_number, step)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lead_times_order_start "
+        "ON lead_times(order_number, start)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lead_times_start ON lead_times(start)"
+    )
+
+
+def _rebuild(cur, table, columns):
+    """Recreate ``table`` with new column definitions, keeping rowids.
+
+    ``columns`` maps each column definition to the expression that fills it
+    from the old table.
+    """
+    names = ", ".join(c.split()[0] for c in columns)
+    cur.execute(f"CREATE TABLE {table}_new ({', '.join(columns)})")
+    cur.execute(
+        f"INSERT INTO {table}_new(rowid, {names}) "
+        f"SELECT rowid, {', '.join(columns.values())} FROM {table}"
+    )
+    cur.execute(f"DROP TABLE {table}")
+    cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+def _epoch(column):
+    return f"CAST(strftime('%s', {column}) AS INTEGER)"
+
+
+def _epoch_timestamps(cur):
+    """Version 3: store step and lead time timestamps as INTEGER epoch seconds.
+
+    Existing ISO text is converted in place; empty or unparsable values
+    become NULL. Dropping the tables drops their indexes, so those are
+    created again.
+    """
+    _rebuild(
+        cur,
+        "steps",
+        {
+            "order_number TEXT": "order_number",
+            "step TEXT": "step",
+            "timestamp INTEGER": _epoch("timestamp"),
+        },
+    )
+    _rebuild(
+        cur,
+        "lead_times",
+        {
+            "order_number TEXT": "order_number",
+            "workstation TEXT": "workstation",
+            "start INTEGER": _epoch("start"),
+            "end INTEGER": _epoch("end"),
+            "hours REAL": "hours",
+        },
+    )
+    _lookup_indexes(cur)
+
+
+def _daily_workstation_hours(cur):
+    """Version 4: per-day business hours of every order and workstation.
+
+    Existing lead times are split with the default business hours, the
+    only calendar known here, and a lead time recompute is queued so the
+    GUI (or ``python -m data.recompute``) rebuilds them with the
+    configured one.
+    """
+    cur.execute(
+        "CREATE TABLE daily_workstation_hours ("
+        "day INTEGER NOT NULL, workstation TEXT NOT NULL, order_number TEXT NOT NULL, "
+        "business_hours REAL NOT NULL, PRIMARY KEY (day, workstation, order_number)"
+        ") WITHOUT ROWID"
+    )
+    cur.execute(
+        "CREATE INDEX idx_daily_hours_order ON daily_workstation_hours(order_number)"
+    )
+    cur.execute(
+        "SELECT order_number, workstation, start, end FROM lead_times "
+        "WHERE start IS NOT NULL AND end IS NOT NULL"
+    )
+    lead_times = cur.fetchall()
+    rollup = {}
+    epoch = datetime(1970, 1, 1)
+    for order_number, workstation, start, end in lead_times:
+        for day, hours in business_hours_by_day(
+            epoch + timedelta(seconds=start), epoch + timedelta(seconds=end)
+        ):
+            key = ((day - epoch.date()).days * 86400, workstation, order_number)
+            rollup[key] = rollup.get(key, 0.0) + hours
+    cur.executemany(
+        "INSERT INTO daily_workstation_hours VALUES (?, ?, ?, ?)",
+        [key + (hours,) for key, hours in rollup.items()],
+    )
+    if lead_times:
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS recompute_state (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        cur.execute("DELETE FROM recompute_state")
+        cur.executemany(
+            "INSERT INTO recompute_state(key, value) VALUES (?, ?)",
+            [
+                ("calendar", json.dumps(DEFAULT_CALENDAR.to_config(), sort_keys=True)),
+                ("last_order", ""),
+            ],
+        )
+
+
+def trigram_supported(cur):
+    """Whether SQLite has FTS5 with the ``trigram`` tokenizer (SQLite 3.34+)."""
+    try:
+        cur.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(x, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    cur.execute("DROP TABLE temp.trigram_probe")
+    return True
+
+
+def has_order_search(db):
+    """Whether the ``order_search`` index exists in ``db``."""
+    row = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='order_search'"
+    ).fetchone()
+    return row is not None
+
+
+def _order_search(cur):
+    """Version 5: trigram full-text index over order numbers and companies.
+
+    ``order_search`` keeps its own copy of both columns; triggers on
+    ``orders`` keep it in sync with every write. Without the trigram
+    tokenizer no index is created and searches scan ``orders``.
+    """
+    if not trigram_supported(cur):
+        return
+    cur.execute(
+        "CREATE VIRTUAL TABLE order_search USING fts5("
+        "order_number, company, tokenize='trigram')"
+    )
+    cur.execute(
+        "CREATE TRIGGER orders_search_insert AFTER INSERT ON orders BEGIN "
+        "INSERT INTO order_search(order_number, company) "
+        "VALUES (new.order_number, new.company); END"
+    )
+    # Orders are rarely deleted or renamed, so matching by column is fine here
+    cur.execute(
+        "CREATE TRIGGER orders_search_delete AFTER DELETE ON orders BEGIN "
+        "DELETE FROM order_search WHERE order_number = old.order_number; END"
+    )
+    cur.execute(
+        "CREATE TRIGGER orders_search_update AFTER UPDATE ON orders "
+        "WHEN old.order_number IS NOT new.order_number OR old.company IS NOT new.company "
+        "BEGIN "
+        "DELETE FROM order_search WHERE order_number = old.order_number; "
+        "INSERT INTO order_search(order_number, company) "
+        "VALUES (new.order_number, new.company); END"
+    )
+    cur.execute(
+        "INSERT INTO order_search(order_number, company) "
+        "SELECT order_number, company FROM orders"
+    )
+
+
+def _search_triggers(cur):
+    """Keep ``order_search`` in sync with ``orders``, keyed by order id."""
+    company = "(SELECT name FROM companies WHERE id = new.company_id)"
+    cur.execute(
+        "CREATE TRIGGER orders_search_insert AFTER INSERT ON orders BEGIN "
+        "INSERT INTO order_search(rowid, order_number, company) "
+        f"VALUES (new.id, new.order_number, {company}); END"
+    )
+    cur.execute(
+        "CREATE TRIGGER orders_search_delete AFTER DELETE ON orders BEGIN "
+        "DELETE FROM order_search WHERE rowid = old.id; END"
+    )
+    cur.execute(
+        "CREATE TRIGGER orders_search_update AFTER UPDATE ON orders "
+        "WHEN old.order_number IS NOT new.order_number "
+        "OR old.company_id IS NOT new.company_id "
+        "BEGIN "
+        "DELETE FROM order_search WHERE rowid = old.id; "
+        "INSERT INTO order_search(rowid, order_number, company) "
+        f"VALUES (new.id, new.order_number, {company}); END"
+    )
+
+
+def _create_order_search(cur):
+    """Create and fill ``order_search`` over the integer-keyed ``orders``."""
+    cur.execute(
+        "CREATE VIRTUAL TABLE order_search USING fts5("
+        "order_number, company, tokenize='trigram')"
+    )
+    _search_triggers(cur)
+    cur.execute(
+        "INSERT INTO order_search(rowid, order_number, company) "
+        "SELECT o.id, o.order_number, c.name FROM orders o "
+        "LEFT JOIN companies c ON c.id = o.company_id"
+    )
+
+
+def _integer_keys(cur):
+    """Version 6: integer keys for orders, companies and workstations.
+
+    Company and workstation (step) names move to the ``companies`` and
+    ``workstations`` lookup tables and orders get an ``id``; ``steps``,
+    ``lead_times`` and ``daily_workstation_hours`` refer to all three by
+    integer. Orders that only had steps or lead times get an ``orders``
+    row without a company. Step and lead time rowids are kept.
+    """
+    cur.execute("CREATE TABLE companies (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    cur.execute(
+        "CREATE TABLE workstations (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)"
+    )
+    cur.execute(
+        "INSERT OR IGNORE INTO companies(name) SELECT company FROM orders "
+        "WHERE company IS NOT NULL ORDER BY rowid"
+    )
+    cur.execute(
+        "INSERT OR IGNORE INTO workstations(name) "
+        "SELECT step FROM steps WHERE step IS NOT NULL "
+        "UNION ALL SELECT workstation FROM lead_times WHERE workstation IS NOT NULL "
+        "UNION ALL SELECT workstation FROM daily_workstation_hours"
+    )
+    cur.execute(
+        "CREATE TABLE orders_new (id INTEGER PRIMARY KEY, "
+        "order_number TEXT NOT NULL UNIQUE, company_id INTEGER REFERENCES companies(id))"
+    )
+    cur.execute(
+        "INSERT INTO orders_new(order_number, company_id) "
+        "SELECT o.order_number, c.id FROM orders o "
+        "LEFT JOIN companies c ON c.name = o.company "
+        "WHERE o.order_number IS NOT NULL ORDER BY o.rowid"
+    )
+    cur.execute(
+        "INSERT OR IGNORE INTO orders_new(order_number) "
+        "SELECT order_number FROM steps WHERE order_number IS NOT NULL "
+        "UNION ALL SELECT order_number FROM lead_times WHERE order_number IS NOT NULL"
+    )
+    cur.execute(
+        "CREATE TABLE steps_new (order_id INTEGER NOT NULL REFERENCES orders(id), "
+        "workstation_id INTEGER NOT NULL REFERENCES workstations(id), timestamp INTEGER)"
+    )
+    cur.execute(
+        "INSERT INTO steps_new(rowid, order_id, workstation_id, timestamp) "
+        "SELECT s.rowid, o.id, w.id, s.timestamp FROM steps s "
+        "JOIN orders_new o ON o.order_number = s.order_number "
+        "JOIN workstations w ON w.name = s.step"
+    )
+    cur.execute(
+        "CREATE TABLE lead_times_new (order_id INTEGER NOT NULL REFERENCES orders(id), "
+        "workstation_id INTEGER NOT NULL REFERENCES workstations(id), "
+        "start INTEGER, end INTEGER, hours REAL)"
+    )
+    cur.execute(
+        "INSERT INTO lead_times_new(rowid, order_id, workstation_id, start, end, hours) "
+        "SELECT lt.rowid, o.id, w.id, lt.start, lt.end, lt.hours FROM lead_times lt "
+        "JOIN orders_new o ON o.order_number = lt.order_number "
+        "JOIN workstations w ON w.name = lt.workstation"
+    )
+    cur.execute(
+        "CREATE TABLE daily_workstation_hours_new ("
+        "day INTEGER NOT NULL, workstation_id INTEGER NOT NULL, order_id INTEGER NOT NULL, "
+        "business_hours REAL NOT NULL, PRIMARY KEY (day, workstation_id, order_id)"
+        ") WITHOUT ROWID"
+    )
+    cur.execute(
+        "INSERT INTO daily_workstation_hours_new "
+        "SELECT d.day, w.id, o.id, d.business_hours FROM daily_workstation_hours d "
+        "JOIN orders_new o ON o.order_number = d.order_number "
+        "JOIN workstations w ON w.name = d.workstation"
+    )
+    for table in ("orders", "steps", "lead_times", "daily_workstation_hours"):
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    # Ordered by rowid within an order, which is how steps are read back
+    cur.execute("CREATE INDEX idx_steps_order ON steps(order_id)")
+    cur.execute("CREATE INDEX idx_lead_times_order_start ON lead_times(order_id, start)")
+    cur.execute("CREATE INDEX idx_lead_times_start ON lead_times(start)")
+    cur.execute("CREATE INDEX idx_daily_hours_order ON daily_workstation_hours(order_id)")
+
+    cur.execute("DROP TABLE IF EXISTS order_search")
+    if trigram_supported(cur):
+        _create_order_search(cur)
+
+
+def _archives(cur):
+    """Version 7: monthly archive files for old completed orders.
+
+    ``orders.archived`` names the month (``YYYY-MM``) whose archive file
+    holds the order's steps, lead times and daily hours; the ``orders``
+    row itself stays in the live file. ``archives`` has one row per month
+    with the number of orders and the range of lead time starts and
+    rollup days stored in it.
+    """
+    cur.execute("ALTER TABLE orders ADD COLUMN archived TEXT")
+    cur.execute(
+        "CREATE TABLE archives (month TEXT PRIMARY KEY, orders INTEGER NOT NULL, "
+        "first_start INTEGER, last_start INTEGER, first_day INTEGER, last_day INTEGER)"
+    )
+
+
+def _covering_start_index(cur):
+    """Version 8: the start index also covers ``order_id``.
+
+    Date range reads look up the orders with lead times in the range on
+    this index before reading their rows, which no longer needs the table.
+    """
+    cur.execute("DROP INDEX idx_lead_times_start")
+    cur.execute("CREATE INDEX idx_lead_times_start ON lead_times(start, order_id)")
+
+
+MIGRATIONS = [
+    _base_tables,
+    _lookup_indexes,
+    _epoch_timestamps,
+    _daily_workstation_hours,
+    _order_search,
+    _integer_keys,
+    _archives,
+    _covering_start_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db):
+    """Apply all pending migrations to ``db`` and return the new version.
+
+    A database migrated by an SQLite without the trigram tokenizer gets its
+    ``order_search`` index once it is opened by one that has it.
+    """
+    version = schema_version(db)
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cur = db.cursor()
+        cur.execute("BEGIN")
+        try:
+            migration(cur)
+            # PRAGMA does not accept bound parameters
+            cur.execute(f"PRAGMA user_version = {int(target)}")
+        except Exception:
+            db.rollback()
+            raise
+        db.commit()
+        version = target
+    if version >= 6 and not has_order_search(db):
+        cur = db.cursor()
+        cur.execute("BEGIN")
+        try:
+            if trigram_supported(cur):
+                _create_order_search(cur)
+        except Exception:
+            db.rollback()
+            raise
+        db.commit()
+    return version
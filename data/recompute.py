@@ -0,0 +1,323 @@
+"""Rebuild ``lead_times`` and ``daily_workstation_hours`` after hours change.
+
+Rows in ``lead_times`` are computed by :func:`data.db.log_order` with the
+business calendar active at the time. When the hours change, the stored
+rows would mix two definitions, so :func:`recompute_lead_times` rebuilds
+them for the whole database.
+
+Orders are processed in ``order_number`` order, ``chunk_size`` orders per
+transaction, and the database lock is released between chunks so the GUI
+and order logging keep running. The last finished order is stored in the
+``recompute_state`` table together with the calendar being applied, so an
+interrupted run resumes where it stopped.
+
+Archived orders are rebuilt in the archive file of their month, which is
+opened for writing for their chunk only. The archive is committed first,
+so a chunk that fails before the live commit is simply rebuilt again.
+
+Run headless with::
+
+    python -m data.recompute orders.db
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+from config.settings import load_config
+from data import archive as archive_module
+from data import db as db_module
+from manage_html_report import compute_lead_times
+from time_utils import BusinessCalendar, DEFAULT_CALENDAR
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Orders without steps have no lead times to recompute; archived orders
+# keep theirs in the archive file
+_HAS_STEPS = (
+    "(o.archived IS NOT NULL OR EXISTS (SELECT 1 FROM steps WHERE order_id = o.id))"
+)
+
+
+def _calendar_key(calendar):
+    return json.dumps(calendar.to_config(), sort_keys=True)
+
+
+def _ensure_state_table(cur):
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS recompute_state (key TEXT PRIMARY KEY, value TEXT)"
+    )
+
+
+def pending_recompute(db, db_lock):
+    """Return the calendar of an interrupted recompute, or ``None``."""
+    with db_lock:
+        cur = db.cursor()
+        _ensure_state_table(cur)
+        cur.execute("SELECT value FROM recompute_state WHERE key='calendar'")
+        row = cur.fetchone()
+    if not row:
+        return None
+    return BusinessCalendar.from_config(json.loads(row[0]))
+
+
+def _load_steps(db, cur, order_ids):
+    marks = ",".join("?" * len(order_ids))
+    cur.execute(
+        "SELECT order_id, workstation_id, timestamp FROM steps "
+        f"WHERE order_id IN ({marks}) ORDER BY order_id, rowid",
+        order_ids,
+    )
+    rows = cur.fetchall()
+    names = db.workstations.lookup(db, {w for _, w, _ in rows})
+    jobs = {order_id: [] for order_id in order_ids}
+    for order_id, w, ts in rows:
+        jobs[order_id].append((names[w], db_module.from_epoch(ts)))
+    return jobs
+
+
+def _rebuild(db, cur, order_ids, calendar):
+    """Replace the lead times and daily hours of ``order_ids`` from their steps.
+
+    ``cur`` is on the file holding the orders: the live one or an archive.
+    """
+    jobs = _load_steps(db, cur, order_ids)
+    results = compute_lead_times(jobs, calendar=calendar)
+    # Every workstation of a lead time is one of the order's steps
+    workstation_ids = db.workstations.ids
+    cur.executemany(
+        "DELETE FROM lead_times WHERE order_id=?",
+        [(order_id,) for order_id in order_ids],
+    )
+    cur.executemany(
+        "INSERT INTO lead_times(order_id, workstation_id, start, end, hours) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                order_id,
+                workstation_ids[item["workstation"]],
+                db_module.to_epoch(item["start"]),
+                db_module.to_epoch(item["end"]),
+                item["hours"],
+            )
+            for order_id in order_ids
+            for item in results.get(order_id, [])
+        ],
+    )
+    db_module.refresh_daily_hours(cur, order_ids, calendar)
+
+
+def _rebuild_archived(db, cur, month, order_ids, calendar):
+    """Rebuild the archived ``order_ids`` in the archive file of ``month``.
+
+    The archive is committed here; the ranges of its ``archives`` row are
+    widened through the live cursor ``cur`` for the caller to commit.
+    """
+    path = db_module.archive_path(db.archive_dir, month)
+    archive = sqlite3.connect(db_module.archive_uri(path, "rw"), uri=True)
+    try:
+        archive_cur = archive.cursor()
+        _rebuild(db, archive_cur, order_ids, calendar)
+        marks = ",".join("?" * len(order_ids))
+        archive_cur.execute(
+            f"SELECT start FROM lead_times WHERE order_id IN ({marks}) AND start IS NOT NULL",
+            order_ids,
+        )
+        starts = [start for start, in archive_cur.fetchall()]
+        archive_cur.execute(
+            f"SELECT day FROM daily_workstation_hours WHERE order_id IN ({marks})",
+            order_ids,
+        )
+        days = [day for day, in archive_cur.fetchall()]
+        archive.commit()
+    except BaseException:
+        archive.rollback()
+        raise
+    finally:
+        archive.close()
+    archive_module.record_month(cur, month, 0, starts, days)
+
+
+def recompute_lead_times(
+    db,
+    db_lock,
+    calendar=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    progress=None,
+    stop_event=None,
+):
+    """Rebuild every ``lead_times`` row from ``steps`` using ``calendar``.
+
+    The per-day rollup in ``daily_workstation_hours`` is rebuilt with it,
+    in the live file and in the archives.
+
+    ``progress`` is called as ``progress(done, total)`` after each chunk
+    with the number of orders processed so far. Setting ``stop_event``
+    stops the run after the current chunk; calling the function again with
+    the same calendar resumes from there, while a different calendar
+    starts over. Returns ``True`` when every order was recomputed.
+    """
+
+    calendar = calendar or DEFAULT_CALENDAR
+    key = _calendar_key(calendar)
+    with db_lock:
+        cur = db.cursor()
+        _ensure_state_table(cur)
+        cur.execute("SELECT key, value FROM recompute_state")
+        state = dict(cur.fetchall())
+        last_order = state.get("last_order", "") if state.get("calendar") == key else ""
+        cur.execute("DELETE FROM recompute_state")
+        cur.executemany(
+            "INSERT INTO recompute_state(key, value) VALUES (?, ?)",
+            [("calendar", key), ("last_order", last_order)],
+        )
+        db.commit()
+        cur.execute(f"SELECT COUNT(*) FROM orders o WHERE {_HAS_STEPS}")
+        total = cur.fetchone()[0]
+        cur.execute(
+            f"SELECT COUNT(*) FROM orders o WHERE order_number <= ? AND {_HAS_STEPS}",
+            (last_order,),
+        )
+        done = cur.fetchone()[0]
+
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            return False
+        with db_lock:
+            try:
+                cur = db.cursor()
+                cur.execute(
+                    "SELECT id, order_number, archived FROM orders o "
+                    f"WHERE order_number > ? AND {_HAS_STEPS} ORDER BY order_number LIMIT ?",
+                    (last_order, chunk_size),
+                )
+                orders = cur.fetchall()
+                if not orders:
+                    cur.execute("DELETE FROM recompute_state")
+                    db.commit()
+                    break
+                live = []
+                archived = {}
+                for order_id, _, month in orders:
+                    if month is None:
+                        live.append(order_id)
+                    else:
+                        archived.setdefault(month, []).append(order_id)
+                for month, order_ids in sorted(archived.items()):
+                    _rebuild_archived(db, cur, month, order_ids, calendar)
+                if live:
+                    _rebuild(db, cur, live, calendar)
+                last_order = orders[-1][1]
+                cur.execute(
+                    "UPDATE recompute_state SET value=? WHERE key='last_order'",
+                    (last_order,),
+                )
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+        done += len(orders)
+        if progress is not None:
+            progress(done, total)
+    return True
+
+
+class RecomputeWorker:
+    """Run :func:`recompute_lead_times` on a background thread.
+
+    The latest ``(done, total)`` progress is available from
+    :attr:`progress` so a GUI can poll it without touching widgets from
+    the worker thread.
+    """
+
+    def __init__(self, db, db_lock, calendar=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.progress = (0, 0)
+        self.finished = False
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(db, db_lock, calendar, chunk_size),
+            name="lead-time-recompute",
+            daemon=True,
+        )
+
+    def _set_progress(self, done, total):
+        self.progress = (done, total)
+
+    def _run(self, db, db_lock, calendar, chunk_size):
+        try:
+            self.finished = recompute_lead_times(
+                db,
+                db_lock,
+                calendar,
+                chunk_size,
+                progress=self._set_progress,
+                stop_event=self._stop,
+            )
+        except Exception as exc:  # surfaced to the caller via ``error``
+            self.error = exc
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Ask the worker to stop after its current chunk and wait for it."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Recompute stored lead times with the configured business hours"
+    )
+    parser.add_argument("db_path", help="Path to the SQLite database")
+    parser.add_argument(
+        "--config",
+        help="JSON config file with business hours (defaults to the GUI config)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Orders per transaction",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    else:
+        config = load_config()
+    calendar = BusinessCalendar.from_config(config)
+    db, db_lock = db_module.connect_db(args.db_path)
+    started = time.monotonic()
+
+    def report(done, total):
+        rate = done / max(time.monotonic() - started, 1e-9)
+        print(f"\r{done}/{total} orders ({rate:.0f}/s)", end="", file=sys.stderr)
+
+    try:
+        recompute_lead_times(db, db_lock, calendar, args.chunk_size, progress=report)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again to resume.", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    print("\nLead times recomputed.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
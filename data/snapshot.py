@@ -0,0 +1,185 @@
+"""Point-in-time copies of the database for long reports.
+
+:class:`ReportingSnapshot` copies the live database with
+:meth:`sqlite3.Connection.backup` into a database of its own, in memory
+or in a temporary file. Reports read the copy through
+:meth:`ReportingSnapshot.reading` with the usual ``data.db`` load
+functions, so however long they run they never take the writer's lock
+nor keep a read transaction open on the live file.
+
+The copy shows the data as of :attr:`ReportingSnapshot.taken_at`; call
+:meth:`ReportingSnapshot.refresh` for a new one, or pass ``interval`` to
+refresh it every ``interval`` seconds from a background thread. A copy
+that is replaced while reports still read it is closed by the last of
+them.
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from data import db as db_module
+
+logger = logging.getLogger(__name__)
+
+
+class _Copy:
+    __slots__ = ("conn", "lock", "path", "readers", "retired")
+
+    def __init__(self, conn, path):
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.path = path
+        self.readers = 0
+        self.retired = False
+
+    def close(self):
+        self.conn.close()
+        if self.path is not None:
+            os.remove(self.path)
+
+
+class ReportingSnapshot:
+    """Copy of ``db`` that reports read without touching the live database.
+
+    With ``in_memory=False`` every copy is written to a temporary file
+    instead, which is deleted once the copy is replaced and no longer
+    read; use it when the database is too large to hold in memory.
+    """
+
+    def __init__(self, db, db_lock, interval=None, in_memory=True):
+        self.db = db
+        self.db_lock = db_lock
+        self.interval = interval
+        self.in_memory = in_memory
+        self.taken_at = None
+        self.duration = None
+        self.error = None
+        self._current = None
+        self._closed = False
+        self._swap = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(
+                target=self._run, name="reporting-snapshot", daemon=True
+            )
+            self._thread.start()
+
+    def _copy(self):
+        path = None
+        if not self.in_memory:
+            fd, path = tempfile.mkstemp(prefix="orders-snapshot-", suffix=".db")
+            os.close(fd)
+        conn = sqlite3.connect(
+            path or ":memory:", check_same_thread=False, factory=db_module.Connection, uri=True
+        )
+        # Archived orders stay in the live database's archive files
+        conn.archive_dir = getattr(self.db, "archive_dir", None)
+        conn.order_search = getattr(self.db, "order_search", True)
+        copy = _Copy(conn, path)
+        try:
+            pool = self.db.readers if isinstance(self.db, db_module.Connection) else None
+            if pool is not None:
+                # A WAL reader sees one committed state for the whole copy
+                # and never blocks the writer
+                with pool.connection() as reader:
+                    reader.backup(conn)
+            else:
+                with self.db_lock:
+                    self.db.backup(conn)
+        except BaseException:
+            copy.close()
+            raise
+        return copy
+
+    def _retire(self, copy):
+        # Called with ``_swap`` held
+        copy.retired = True
+        if not copy.readers:
+            copy.close()
+
+    def refresh(self):
+        """Copy the live database now and point later reports at the copy.
+
+        Returns the new :attr:`taken_at`. Concurrent calls copy once.
+        """
+        with self._refreshing:
+            if self._closed:
+                raise RuntimeError("ReportingSnapshot is closed")
+            started = time.perf_counter()
+            taken_at = datetime.now()
+            copy = self._copy()
+            with self._swap:
+                old, self._current = self._current, copy
+                self.taken_at = taken_at
+                self.duration = time.perf_counter() - started
+                if old is not None:
+                    self._retire(old)
+            return taken_at
+
+    @contextmanager
+    def reading(self):
+        """Yield ``(db, db_lock)`` of the current copy, taking one if needed.
+
+        The copy stays open until the block exits, even if it is replaced
+        meanwhile, so a report reads one consistent state throughout.
+        """
+        if self._current is None:
+            self.refresh()
+        with self._swap:
+            copy = self._current
+            if copy is None:
+                raise RuntimeError("ReportingSnapshot is closed")
+            copy.readers += 1
+        try:
+            yield copy.conn, copy.lock
+        finally:
+            with self._swap:
+                copy.readers -= 1
+                if copy.retired and not copy.readers:
+                    copy.close()
+
+    def age(self):
+        """Seconds since the current copy was taken, or ``None`` before the first."""
+        taken_at = self.taken_at
+        if taken_at is None:
+            return None
+        return (datetime.now() - taken_at).total_seconds()
+
+    def describe(self):
+        """Staleness note for the GUI, e.g. ``Snapshot of 14:05:10 (3 min old)``."""
+        age = self.age()
+        if age is None:
+            return "No snapshot yet"
+        old = "just taken" if age < 60 else f"{int(age // 60)} min old"
+        return f"Snapshot of {self.taken_at:%H:%M:%S} ({old})"
+
+    def _run(self):
+        wait = 0
+        while not self._stop.wait(wait):
+            wait = self.interval
+            try:
+                self.refresh()
+                self.error = None
+            except Exception as exc:  # surfaced to the caller via ``error``
+                # Reports keep reading the previous copy
+                logger.exception("Refreshing the reporting snapshot failed")
+                self.error = exc
+
+    def close(self):
+        """Stop refreshing and release the current copy."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._refreshing, self._swap:
+            self._closed = True
+            old, self._current = self._current, None
+            if old is not None:
+                self._retire(old)
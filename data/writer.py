@@ -0,0 +1,206 @@
+"""Write-behind persistence of scraped orders.
+
+:class:`OrderWriter` decouples whoever fetches orders from the database.
+:meth:`OrderWriter.submit` only puts the order into a bounded in-memory
+buffer and returns; a dedicated thread stores the buffered orders with
+:func:`data.db.log_orders`, one transaction per group. A group is written
+once ``batch_size`` orders are waiting, ``max_delay`` seconds after the
+oldest of them arrived, or when :meth:`OrderWriter.flush` is called.
+
+Each update is a full snapshot of an order, so a newer update of an order
+that is still waiting replaces the older one instead of taking another
+slot. Call :meth:`OrderWriter.close` before exiting; it writes everything
+still buffered.
+
+A group that fails to write goes back into the buffer, behind any newer
+update of the same orders, and is retried after a delay that doubles with
+every failure. :meth:`OrderWriter.flush` and :meth:`OrderWriter.close`
+return ``False`` while the last write failed.
+"""
+
+import logging
+import threading
+import time
+
+from data import db as db_module
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 5000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_DELAY = 0.5
+DEFAULT_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+class OrderWriter:
+    """Buffer order updates and store them from a background thread.
+
+    ``calendar`` is used for the lead times of every group written after
+    it is assigned, so the GUI can update it when the hours change.
+    """
+
+    def __init__(
+        self,
+        db,
+        db_lock,
+        calendar=None,
+        max_pending=DEFAULT_MAX_PENDING,
+        batch_size=DEFAULT_BATCH_SIZE,
+        max_delay=DEFAULT_MAX_DELAY,
+        retry_delay=DEFAULT_RETRY_DELAY,
+    ):
+        self.db = db
+        self.db_lock = db_lock
+        self.calendar = calendar
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.submitted = 0
+        self.coalesced = 0
+        self.written = 0
+        self.commits = 0
+        self.failures = 0
+        self.error = None
+        self._pending = {}
+        self._oldest = None
+        self._retry_at = None
+        self._backoff = retry_delay
+        self._writing = 0
+        self._flushing = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """Number of orders buffered or being written."""
+        with self._cond:
+            return len(self._pending) + self._writing
+
+    def submit(self, order, timeout=None):
+        """Queue ``order`` (a :class:`parsers.manage_html.Order`) for writing.
+
+        Replaces a queued update of the same order. When the buffer is full
+        the call waits for the writer to make room, up to ``timeout``
+        seconds; returns ``False`` if the order could not be queued.
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("OrderWriter is closed")
+            self.submitted += 1
+            if order.number in self._pending:
+                self._pending[order.number] = order
+                self.coalesced += 1
+                return True
+            if not self._cond.wait_for(
+                lambda: len(self._pending) < self.max_pending or self._closed, timeout
+            ) or self._closed:
+                self.submitted -= 1
+                return False
+            self._pending[order.number] = order
+            if self._oldest is None:
+                # Wake the writer so it starts timing ``max_delay``
+                self._oldest = time.monotonic()
+                self._cond.notify_all()
+            elif len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def submit_many(self, orders, timeout=None):
+        """Queue every order in ``orders``; returns ``False`` if one timed out."""
+        return all([self.submit(order, timeout) for order in orders])
+
+    def flush(self, timeout=None):
+        """Write everything queued so far and wait until it is committed.
+
+        Returns ``False`` if ``timeout`` expired first or a write failed;
+        the orders of a failed write stay queued and are retried.
+        """
+        with self._cond:
+            failures = self.failures
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                done = self._cond.wait_for(
+                    lambda: (not self._pending and not self._writing)
+                    or self.failures != failures,
+                    timeout,
+                )
+                return done and self.error is None
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout=None):
+        """Write the remaining orders and stop the writer thread.
+
+        A failing write is tried once more without waiting for its retry
+        delay. Returns ``False`` if the thread did not stop within
+        ``timeout`` or that write failed; the orders that could not be
+        written are then still counted in :attr:`pending`.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive() and self.error is None
+
+    def _due_at(self):
+        """Monotonic time the buffered orders are due, ``None`` when nothing is buffered."""
+        if not self._pending:
+            return None
+        if self._closed:
+            return 0
+        if self._retry_at is not None:
+            return self._retry_at
+        if self._flushing or len(self._pending) >= self.batch_size:
+            return 0
+        return self._oldest + self.max_delay
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    due = self._due_at()
+                    if due is None and self._closed:
+                        return
+                    wait = None if due is None else due - time.monotonic()
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                batch = list(self._pending.values())
+                self._pending = {}
+                self._oldest = None
+                self._writing = len(batch)
+                self._cond.notify_all()
+            try:
+                changed = db_module.log_orders(self.db, self.db_lock, batch, self.calendar)
+            except Exception as exc:  # surfaced to the caller via ``error``
+                logger.exception("Writing %d orders failed", len(batch))
+                with self._cond:
+                    self.error = exc
+                    self.failures += 1
+                    # A newer update queued meanwhile replaces the failed one;
+                    # requeued orders may briefly exceed ``max_pending``
+                    for order in batch:
+                        self._pending.setdefault(order.number, order)
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+                    self._retry_at = time.monotonic() + self._backoff
+                    self._backoff = min(self._backoff * 2, MAX_RETRY_DELAY)
+                    self._writing = 0
+                    self._cond.notify_all()
+                    if self._closed:
+                        return
+                continue
+            with self._cond:
+                if changed:
+                    self.commits += 1
+                self.written += len(batch)
+                self.error = None
+                self._retry_at = None
+                self._backoff = self.retry_delay
+                self._writing = 0
+                self._cond.notify_all()
@@ -3,7 +3,7 @@ from datetime import datetime
 from collections import defaultdict
 import argparse
 
-from time_utils import business_hours_delta, business_hours_breakdown
+from time_utils import business_hours_breakdown, business_hours_delta_many
 
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
@@ -34,32 +34,42 @@ def load_rows(path):
             }
 
 
-def compute_lead_times(rows, start_date=None, end_date=None, show_breakdown=False):
+def compute_lead_times(
+    rows, start_date=None, end_date=None, show_breakdown=False, calendar=None
+):
     results = defaultdict(list)
     breakdowns = defaultdict(list) if show_breakdown else None
-    for row in rows:
-        if start_date and row["time_in"] < start_date:
-            continue
-        if end_date and row["time_out"] > end_date:
-            continue
-
-        if show_breakdown:
-            segments = business_hours_breakdown(row["time_in"], row["time_out"])
+    selected = [
+        row
+        for row in rows
+        if not (start_date and row["time_in"] < start_date)
+        and not (end_date and row["time_out"] > end_date)
+    ]
+
+    if show_breakdown:
+        for row in selected:
+            segments = business_hours_breakdown(
+                row["time_in"], row["time_out"], calendar
+            )
             total_seconds = sum(
                 (seg_end - seg_start).total_seconds() for seg_start, seg_end in segments
             )
             breakdowns[row["job_number"]].append(
                 {"workstation": row["workstation"], "segments": segments}
             )
-        else:
-            delta = business_hours_delta(row["time_in"], row["time_out"])
-            total_seconds = delta.total_seconds()
+            hours = total_seconds / 3600.0
+            results[row["job_number"]].append(
+                {"workstation": row["workstation"], "hours": hours}
+            )
+        return results, breakdowns
 
-        hours = total_seconds / 3600.0
+    all_hours = business_hours_delta_many(
+        [row["time_in"] for row in selected],
+        [row["time_out"] for row in selected],
+        calendar,
+    )
+    for row, hours in zip(selected, all_hours.tolist()):
         results[row["job_number"]].append({"workstation": row["workstation"], "hours": hours})
-
-    if show_breakdown:
-        return results, breakdowns
     return results
 
 
@@ -1,72 +1,235 @@
 import argparse
 import csv
+import glob
+import os
 import re
+import json
 import logging
+import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-from bs4 import BeautifulSoup
-
-from time_utils import business_hours_delta
+from config.settings import load_config
+from parsers import manage_html, rows
+from time_utils import BusinessCalendar, business_hours_delta_many
 
 HTML_DATE_FORMAT = "%m/%d/%y %H:%M"
+_JOB_NUMBER = re.compile(r"\b(\d+)\b")
+# Snapshot files handed to a worker at once; each worker merges its own
+# files before sending the result back
+BATCH_FILES = 32
+SNAPSHOT_PATTERNS = ("*.html", "*.htm")
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Generate lead time report from manage.html"
     )
-    parser.add_argument("html_file", help="Path to manage.html")
+    parser.add_argument(
+        "html_file",
+        help="Path to manage.html, or a directory or glob of archived snapshots",
+    )
     parser.add_argument(
         "--output", default="lead_time_report.csv", help="Output CSV path"
     )
     parser.add_argument("--start", help="Start date (YYYY-MM-DD)")
     parser.add_argument("--end", help="End date (YYYY-MM-DD)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes parsing snapshots (default: one per core)",
+    )
+    parser.add_argument(
+        "--db", help="Load the merged orders into this database instead of writing a report"
+    )
+    parser.add_argument(
+        "--config",
+        help="JSON config file with the business hours used with --db (defaults to the GUI config)",
+    )
     return parser.parse_args()
 
 
 def parse_manage_html(path):
-    with open(path, "r", encoding="utf-8") as f:
-        soup = BeautifulSoup(f, "html.parser")
+    """Return ``{job_number: [(workstation, timestamp), ...]}`` from ``path``.
+
+    The file is read a table row at a time, so memory does not grow with
+    the size of the page.
+    """
     jobs = {}
-    for tr in soup.select("tbody#table tr"):
-        move_td = tr.find("td", class_="move")
-        if not move_td:
-            continue
-        job_text = move_td.get_text(strip=True)
-        match = re.search(r"\b(\d+)\b", job_text)
-        if not match:
-            logging.warning("Could not find job ID in row: %s", job_text)
+    with open(path, "rb") as f:
+        for row in manage_html.iter_table_rows(f):
+            for tr in row.iter("tr"):
+                job = _job_from_row(tr)
+                if job:
+                    jobs[job[0]] = job[1]
+    return jobs
+
+
+def _job_from_row(tr):
+    move_td = rows.find_class(tr, "td", "move")
+    if move_td is None:
+        return None
+    job_text = rows.element_text(move_td)
+    match = _JOB_NUMBER.search(job_text)
+    if not match:
+        logging.warning("Could not find job ID in row: %s", job_text)
+        return None
+    steps = []
+    for li in rows.workplace_items(tr):
+        name_text, time_text = rows.step_texts(li)
+        if name_text is None:
             continue
-        job_number = match.group(1)
-        steps = []
-        for li in tr.select("ul.workplaces li"):
-            step_p = li.find("p")
-            if not step_p:
-                continue
-            step_name = re.sub(r"^\d+", "", step_p.get_text(strip=True))
-            time_p = li.find("p", class_="np")
-            timestamp = None
-            if time_p:
-                text = time_p.get_text(strip=True).replace("\xa0", "").strip()
-                if text:
-                    try:
-                        timestamp = datetime.strptime(text, HTML_DATE_FORMAT)
-                    except ValueError:
-                        pass
-            steps.append((step_name.strip(), timestamp))
-        jobs[job_number] = steps
+        timestamp = rows.parse_timestamp(time_text) if time_text is not None else None
+        steps.append((rows.step_name(name_text).strip(), timestamp))
+    return match.group(1), steps
+
+
+def snapshot_paths(pattern):
+    """The files named by ``pattern``: one file, a directory or a glob, sorted."""
+    if os.path.isdir(pattern):
+        paths = [
+            path
+            for name in SNAPSHOT_PATTERNS
+            for path in glob.glob(os.path.join(glob.escape(pattern), name))
+        ]
+    elif glob.has_magic(pattern):
+        paths = glob.glob(pattern, recursive=True)
+    else:
+        return [pattern]
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def merge_steps(steps, more):
+    """Merge two step lists of one job, keeping the earliest timestamp of each step.
+
+    Steps are matched by workstation and by how many times that workstation
+    came before in the list, so a job that visits a station twice keeps
+    both visits. Steps only ``more`` has are added at the end.
+    """
+    merged = list(steps)
+    position = {}
+    seen = defaultdict(int)
+    for i, (name, _) in enumerate(merged):
+        position[(name, seen[name])] = i
+        seen[name] += 1
+    seen.clear()
+    for name, timestamp in more:
+        key = (name, seen[name])
+        seen[name] += 1
+        i = position.get(key)
+        if i is None:
+            position[key] = len(merged)
+            merged.append((name, timestamp))
+        elif timestamp is not None:
+            earliest = merged[i][1]
+            if earliest is None or timestamp < earliest:
+                merged[i] = (name, timestamp)
+    return merged
+
+
+def merge_jobs(jobs, more):
+    """Merge the ``{job_number: steps}`` mapping ``more`` into ``jobs`` in place."""
+    for job, steps in more.items():
+        jobs[job] = merge_steps(jobs[job], steps) if job in jobs else list(steps)
     return jobs
 
 
-def compute_lead_times(jobs, start_date=None, end_date=None):
+def _read_snapshot(path, with_companies):
+    if not with_companies:
+        return parse_manage_html(path), {}
+    jobs = {}
+    companies = {}
+    with open(path, "rb") as f:
+        for order in manage_html.iter_orders(f):
+            if not order.number:
+                continue
+            jobs[order.number] = [(s.name, s.timestamp) for s in order.steps]
+            if order.company:
+                companies[order.number] = order.company
+    return jobs, companies
+
+
+def _read_snapshots(paths, with_companies=False):
+    jobs = {}
+    companies = {}
+    failed = []
+    for path in paths:
+        try:
+            found, named = _read_snapshot(path, with_companies)
+        except (OSError, ValueError) as exc:
+            logging.warning("Could not read %s: %s", path, exc)
+            failed.append(path)
+            continue
+        merge_jobs(jobs, found)
+        companies.update(named)
+    return jobs, companies, failed
+
+
+def parse_snapshots(paths, workers=1, with_companies=False):
+    """Parse many ``manage.html`` snapshots and merge their jobs.
+
+    Returns ``(jobs, companies, failed)``: ``jobs`` maps job numbers to
+    step lists merged with :func:`merge_steps` in the order of ``paths``,
+    ``companies`` holds the last company seen for each job when
+    ``with_companies`` is set (pages are then read with
+    :func:`parsers.manage_html.iter_orders`, as they are when polling)
+    and ``failed`` lists the files that could not be read. Files are
+    parsed in batches of :data:`BATCH_FILES` across ``workers`` processes.
+    """
+    batches = [paths[i : i + BATCH_FILES] for i in range(0, len(paths), BATCH_FILES)]
+    workers = max(1, min(workers, len(batches)))
+    if workers == 1:
+        results = [_read_snapshots(batch, with_companies) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(
+                pool.map(_read_snapshots, batches, [with_companies] * len(batches))
+            )
+    jobs = {}
+    companies = {}
+    failed = []
+    for found, named, bad in results:
+        merge_jobs(jobs, found)
+        companies.update(named)
+        failed.extend(bad)
+    return jobs, companies, failed
+
+
+def load_jobs(db, db_lock, jobs, companies, calendar=None):
+    """Store merged jobs with :func:`data.db.log_orders` in one transaction.
+
+    Jobs missing from ``companies`` keep the company already stored.
+    """
+    # data.db imports this module for compute_lead_times
+    from data import db as store
+
+    orders = [
+        manage_html.Order(
+            job,
+            companies.get(job),
+            "",
+            "",
+            [manage_html.Step(name, timestamp) for name, timestamp in steps],
+        )
+        for job, steps in jobs.items()
+    ]
+    return store.log_orders(db, db_lock, orders, calendar)
+
+
+def compute_lead_times(jobs, start_date=None, end_date=None, calendar=None):
     """Return hours spent in each workstation including timestamps.
 
     Only include steps where the start timestamp is on or after ``start_date``
-    and the end timestamp is on or before ``end_date``.
+    and the end timestamp is on or before ``end_date``. Hours are measured
+    with ``calendar`` (a :class:`time_utils.BusinessCalendar`), defaulting
+    to the standard 08:00–16:30 weekday hours.
     """
 
     results = defaultdict(list)
+    entries = []
     for job, steps in jobs.items():
         for (name, start), (next_name, end) in zip(steps, steps[1:]):
             if not start or not end:
@@ -75,16 +238,20 @@ def compute_lead_times(jobs, start_date=None, end_date=None):
                 continue
             if end_date and end > end_date:
                 continue
-            delta = business_hours_delta(start, end)
-            hours = delta.total_seconds() / 3600.0
-            results[job].append(
-                {
-                    "workstation": next_name,
-                    "hours": hours,
-                    "start": start,
-                    "end": end,
-                }
-            )
+            entry = {
+                "workstation": next_name,
+                "hours": 0.0,
+                "start": start,
+                "end": end,
+            }
+            results[job].append(entry)
+            entries.append(entry)
+    # Compute every pair in one vectorized call instead of per step
+    hours = business_hours_delta_many(
+        [e["start"] for e in entries], [e["end"] for e in entries], calendar
+    )
+    for entry, value in zip(entries, hours.tolist()):
+        entry["hours"] = value
     return results
 
 
@@ -163,21 +330,31 @@ def write_realtime_report(report, csv_path, html_path):
 
 def write_report(results, path):
     """Write lead time data to ``path`` including timestamps."""
+    write_report_rows(
+        ((job, step) for job, steps in results.items() for step in steps), path
+    )
+
+
+def write_report_rows(rows, path):
+    """Write ``(job, step)`` pairs to ``path`` as they are produced.
+
+    ``rows`` may be any iterable, so a report can be streamed from the
+    database without collecting it first.
+    """
     with open(path, "w", newline="") as f:
         fieldnames = ["job_number", "workstation", "hours_in_queue", "start", "end"]
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
-        for job, steps in results.items():
-            for step in steps:
-                writer.writerow(
-                    {
-                        "job_number": job,
-                        "workstation": step["workstation"],
-                        "hours_in_queue": f"{step['hours']:.2f}",
-                        "start": step["start"].isoformat(sep=" "),
-                        "end": step["end"].isoformat(sep=" "),
-                    }
-                )
+        for job, step in rows:
+            writer.writerow(
+                {
+                    "job_number": job,
+                    "workstation": step["workstation"],
+                    "hours_in_queue": f"{step['hours']:.2f}",
+                    "start": step["start"].isoformat(sep=" "),
+                    "end": step["end"].isoformat(sep=" "),
+                }
+            )
 
 
 def main():
@@ -186,11 +363,45 @@ def main():
     end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else None
     if start and end and end < start:
         raise argparse.ArgumentTypeError("--end must be on or after --start")
-    jobs = parse_manage_html(args.html_file)
-    results = compute_lead_times(jobs, start, end)
-    write_report(results, args.output)
-    print(f"Report written to {args.output}")
+    paths = snapshot_paths(args.html_file)
+    started = time.perf_counter()
+    if os.path.isdir(args.html_file) or glob.has_magic(args.html_file):
+        jobs, companies, failed = parse_snapshots(paths, args.workers, bool(args.db))
+    else:
+        # A single page that cannot be read is an error, not an empty report
+        jobs, companies = _read_snapshot(args.html_file, bool(args.db))
+        failed = []
+    elapsed = time.perf_counter() - started
+    if len(paths) > 1:
+        parsed = len(paths) - len(failed)
+        print(
+            f"Parsed {parsed} of {len(paths)} files in {elapsed:.1f} s "
+            f"({parsed / elapsed if elapsed else 0:.1f} files/s)"
+        )
+    if args.db:
+        from data import db
+
+        if args.config:
+            with open(args.config, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        else:
+            config = load_config()
+        calendar = BusinessCalendar.from_config(config)
+        conn, lock = db.connect_db(args.db)
+        try:
+            load_jobs(conn, lock, jobs, companies, calendar)
+        finally:
+            conn.close()
+        print(f"Loaded {len(jobs)} orders into {args.db}")
+    else:
+        results = compute_lead_times(jobs, start, end)
+        write_report(results, args.output)
+        print(f"Report written to {args.output}")
+    if failed:
+        print(f"Could not read {len(failed)} of {len(paths)} files", file=sys.stderr)
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
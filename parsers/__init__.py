@@ -1,3 +1,4 @@
-from .manage_html import parse_orders, parse_queue, Order, Step
+from .manage_html import iter_orders, parse_orders, parse_queue, Order, Step
+from .row_cache import RowCache
 
-__all__ = ["parse_orders", "parse_queue", "Order", "Step"]
+__all__ = ["iter_orders", "parse_orders", "parse_queue", "Order", "RowCache", "Step"]
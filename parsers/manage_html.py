@@ -4,16 +4,40 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional, Set
+from html.parser import HTMLParser
+from typing import IO, Any, Iterator, List, Optional, Set
+from xml.etree import ElementTree
+import codecs
 import logging
 import re
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+from . import rows
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover - optional speedup
+    etree = None
+    lxml_html = None
 
 logger = logging.getLogger(__name__)
 
 HTML_DATE_FORMAT = "%m/%d/%y %H:%M"
 
+BACKENDS = ("lxml", "html.parser")
+# lxml's C parser builds the tree far faster, but it repairs malformed
+# markup like a browser (closing an open <p> at the next one), which
+# html.parser does not; lxml is only used when asked for
+DEFAULT_BACKEND = "html.parser"
+# Bytes read from a stream at a time by iter_orders
+CHUNK_SIZE = 64 * 1024
+
+_ORDER_TABLE = SoupStrainer("tbody", id="table")
+_TABLE_BODIES = SoupStrainer("tbody")
+_JOB_NUMBER = re.compile(r"([A-Za-z0-9_-]*\d+[A-Za-z0-9_-]*)")
+
 
 @dataclass
 class Step:
@@ -30,9 +54,46 @@ class Order:
     steps: List[Step]
 
 
-def parse_orders(html: str) -> List[Order]:
-    """Parse an orders HTML page into ``Order`` objects."""
-    soup = BeautifulSoup(html, "html.parser")
+def _step(name_text: Optional[str], time_text: Optional[str]) -> Step:
+    """Build a step from its name and ``np`` paragraph texts (``None`` if absent)."""
+    return Step(
+        rows.step_name(name_text) if name_text is not None else "",
+        rows.parse_timestamp(time_text) if time_text is not None else None,
+    )
+
+
+def _backend(backend: Optional[str]) -> str:
+    if backend is None:
+        return DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend: {backend!r}")
+    if backend == "lxml" and lxml_html is None:
+        raise ValueError("The lxml backend needs the lxml package")
+    return backend
+
+
+def parse_orders(html: str, backend: Optional[str] = None) -> List[Order]:
+    """Parse an orders HTML page into ``Order`` objects.
+
+    ``backend`` is ``"html.parser"`` (the default) or ``"lxml"``, which
+    needs the lxml package. Both return the same orders for well-formed
+    pages; on malformed markup such as an unclosed ``<p>`` they can differ.
+    """
+    if _backend(backend) == "lxml":
+        return _parse_orders_lxml(html)
+    return _parse_orders_soup(html)
+
+
+def parse_queue(html: str, backend: Optional[str] = None) -> Set[str]:
+    """Parse the queue HTML page and return a set of job numbers."""
+    if _backend(backend) == "lxml":
+        return _parse_queue_lxml(html)
+    return _parse_queue_soup(html)
+
+
+def _parse_orders_soup(html: str) -> List[Order]:
+    # Only the order table is built into a tree
+    soup = BeautifulSoup(html, "html.parser", parse_only=_ORDER_TABLE)
     tbody = soup.find("tbody", id="table")
     orders: List[Order] = []
     if not tbody:
@@ -41,16 +102,7 @@ def parse_orders(html: str) -> List[Order]:
         tds = tr.find_all("td")
         try:
             cell_parts = list(tds[0].stripped_strings) if tds else []
-            order_num = ""
-            company = ""
-            for part in cell_parts:
-                if not order_num and re.search(r"\d", part):
-                    match = re.search(r"([A-Za-z0-9_-]+)$", part)
-                    order_num = (
-                        match.group(1) if match else re.sub(r"[^A-Za-z0-9_-]", "", part)
-                    )
-                elif not company and re.search(r"[A-Za-z]", part):
-                    company = part
+            order_num, company = rows.number_and_company(cell_parts)
             if (not company or company == "?") and len(tds) > 1:
                 for text in tds[1].stripped_strings:
                     company = text
@@ -65,35 +117,226 @@ def parse_orders(html: str) -> List[Order]:
             steps: List[Step] = []
             for li in tr.select("ul.workplaces li"):
                 step_p = li.find("p")
-                step_name = (
-                    re.sub(r"^\d+", "", step_p.get_text(strip=True)) if step_p else ""
-                )
                 time_p = li.find("p", class_="np")
-                ts = None
-                if time_p:
-                    text = time_p.get_text(strip=True).replace("\xa0", "").strip()
-                    if text:
-                        try:
-                            ts = datetime.strptime(text, HTML_DATE_FORMAT)
-                        except ValueError:
-                            pass
-                steps.append(Step(step_name, ts))
+                steps.append(
+                    _step(
+                        step_p.get_text(strip=True) if step_p else None,
+                        time_p.get_text(strip=True) if time_p else None,
+                    )
+                )
             orders.append(Order(order_num, company, status, priority, steps))
         except Exception:
             logger.exception("Error parsing row")
     return orders
 
 
-def parse_queue(html: str) -> Set[str]:
-    """Parse the queue HTML page and return a set of job numbers."""
-    soup = BeautifulSoup(html, "html.parser")
+def _parse_queue_soup(html: str) -> Set[str]:
+    soup = BeautifulSoup(html, "html.parser", parse_only=_TABLE_BODIES)
     tbody = soup.find("tbody")
     current: Set[str] = set()
     if not tbody:
         return current
     for tr in tbody.find_all("tr"):
         td_text = tr.get_text(" ", strip=True)
-        match = re.search(r"([A-Za-z0-9_-]*\d+[A-Za-z0-9_-]*)", td_text)
+        match = _JOB_NUMBER.search(td_text)
         if match:
             current.add(match.group(1))
     return current
+
+
+def _lxml_root(html: str):
+    """Parse ``html`` with lxml, dropping what BeautifulSoup never reports as text."""
+    if not html.strip():
+        return None
+    # Encode ourselves: lxml refuses str input with an encoding declaration
+    parser = lxml_html.HTMLParser(encoding="utf-8", remove_pis=True)
+    try:
+        root = lxml_html.document_fromstring(html.encode("utf-8"), parser=parser)
+    except etree.ParserError:
+        return None
+    # Emptied rather than removed, so the text on either side stays two
+    # strings, as it does for BeautifulSoup and _RowBuilder
+    for el in root.iter("script", "style", "template"):
+        for node in el.iter():
+            node.text = None
+            if node is not el:
+                node.tail = None
+    return root
+
+
+def _order_from_row(tr) -> Order:
+    """Read an order from a ``<tr>`` built by lxml or by :class:`_RowBuilder`."""
+    tds = list(tr.iter("td"))
+    cell_parts = rows.strings(tds[0]) if tds else []
+    order_num, company = rows.number_and_company(cell_parts)
+    if (not company or company == "?") and len(tds) > 1:
+        fallback = rows.strings(tds[1])
+        if fallback:
+            company = fallback[0]
+    status = rows.element_text(tds[2]) if len(tds) > 2 else ""
+    priority = ""
+    if len(tds) > 4:
+        pri_input = next(tds[4].iter("input"), None)
+        priority = (
+            pri_input.get("value") if pri_input is not None else rows.element_text(tds[4])
+        )
+    steps = [_step(*rows.step_texts(li)) for li in rows.workplace_items(tr)]
+    return Order(order_num, company, status, priority, steps)
+
+
+def _parse_orders_lxml(html: str) -> List[Order]:
+    orders: List[Order] = []
+    root = _lxml_root(html)
+    tbody = root.find(".//tbody[@id='table']") if root is not None else None
+    if tbody is None:
+        return orders
+    for tr in tbody.iter("tr"):
+        try:
+            orders.append(_order_from_row(tr))
+        except Exception:
+            logger.exception("Error parsing row")
+    return orders
+
+
+def _parse_queue_lxml(html: str) -> Set[str]:
+    current: Set[str] = set()
+    root = _lxml_root(html)
+    tbody = root.find(".//tbody") if root is not None else None
+    if tbody is None:
+        return current
+    for tr in tbody.iter("tr"):
+        td_text = " ".join(rows.strings(tr))
+        match = _JOB_NUMBER.search(td_text)
+        if match:
+            current.add(match.group(1))
+    return current
+
+
+# Elements BeautifulSoup closes as soon as they open
+_VOID_ELEMENTS = frozenset(
+    "area base basefont bgsound br col command embed frame hr image img input "
+    "isindex keygen link menuitem meta nextid param source spacer track wbr".split()
+)
+# Elements whose text BeautifulSoup leaves out of stripped_strings
+_NO_TEXT_ELEMENTS = frozenset(["script", "style", "template"])
+# Empty stand-in for a comment: it keeps the strings around it apart
+_COMMENT = "!--"
+
+
+class _RowBuilder(HTMLParser):
+    """Build each ``<tr>`` of ``tbody#table`` into an ElementTree element.
+
+    Tags are matched the way BeautifulSoup's html.parser tree builder does:
+    nothing is implied, void elements close at once and an end tag closes
+    every element opened after its start tag, or is ignored if it has none.
+    Finished rows are collected in ``rows``; ``done`` is set at the end of
+    the table.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.rows: List[Any] = []
+        self.done = False
+        self._open: List[str] = []
+        self._table_depth = 0
+        self._row_depth = 0
+        self._builder: Optional[ElementTree.TreeBuilder] = None
+        self._no_text = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        attrib = {k: "" if v is None else v for k, v in attrs}
+        if tag in _VOID_ELEMENTS:
+            if self._builder is not None:
+                self._builder.start(tag, attrib)
+                self._builder.end(tag)
+            return
+        self._open.append(tag)
+        if self._builder is not None:
+            self._builder.start(tag, attrib)
+            if tag in _NO_TEXT_ELEMENTS:
+                self._no_text += 1
+        elif not self._table_depth:
+            if tag == "tbody" and attrib.get("id") == "table":
+                self._table_depth = len(self._open)
+        elif tag == "tr":
+            self._builder = ElementTree.TreeBuilder()
+            self._builder.start(tag, attrib)
+            self._row_depth = len(self._open)
+
+    def handle_endtag(self, tag):
+        if self.done or tag not in self._open:
+            return
+        while True:
+            depth = len(self._open)
+            name = self._open.pop()
+            if self._builder is not None:
+                self._builder.end(name)
+                if name in _NO_TEXT_ELEMENTS:
+                    self._no_text -= 1
+                if depth == self._row_depth:
+                    self.rows.append(self._builder.close())
+                    self._builder = None
+            if depth == self._table_depth:
+                self.done = True
+            if name == tag:
+                return
+
+    def close(self):
+        super().close()
+        # The page ended: close everything still open, the last row included
+        if self._open:
+            self.handle_endtag(self._open[0])
+
+    def handle_data(self, data):
+        if self._builder is not None and not self._no_text:
+            self._builder.data(data)
+
+    def handle_comment(self, data):
+        if self._builder is not None:
+            self._builder.start(_COMMENT, {})
+            self._builder.end(_COMMENT)
+
+
+def iter_table_rows(stream: IO, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the ``<tr>`` elements of ``tbody#table`` as ``stream`` is read.
+
+    ``stream`` is a binary (UTF-8) or text file object, such as an open file
+    or a response body, read ``chunk_size`` at a time with the standard
+    library's incremental tokenizer. Each row is an ElementTree element
+    yielded once its end tag has been read; only the rows of the chunk in
+    hand are held, whatever the size of the page. Rows nested in a row come
+    inside it. Reading stops at the end of the table.
+    """
+    builder = _RowBuilder()
+    decode = codecs.getincrementaldecoder("utf-8")().decode
+    while not builder.done:
+        chunk = stream.read(chunk_size)
+        text = decode(chunk, final=not chunk) if isinstance(chunk, bytes) else chunk
+        if chunk:
+            builder.feed(text)
+        else:
+            builder.close()
+        rows, builder.rows = builder.rows, []
+        yield from rows
+        if not chunk:
+            break
+
+
+def iter_orders(stream: IO, chunk_size: int = CHUNK_SIZE) -> Iterator[Order]:
+    """Yield the orders of a manage page as it is read from ``stream``.
+
+    Each order is yielded as soon as its row has been read, so logging can
+    start before a download finishes and memory does not grow with the page
+    (see :func:`iter_table_rows`). The orders are those of
+    :func:`parse_orders` with the html.parser backend.
+    """
+    for tr in iter_table_rows(stream, chunk_size):
+        for row in tr.iter("tr"):
+            try:
+                order = _order_from_row(row)
+            except Exception:
+                logger.exception("Error parsing row")
+                continue
+            yield order
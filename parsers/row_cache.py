@@ -0,0 +1,130 @@
+"""Re-parse only the manage page rows that changed since the last poll.
+
+Most rows of the manage page are byte for byte the same from one poll to
+the next. :class:`RowCache` cuts the order table into its ``<tr>`` rows
+with a few regular expressions, fingerprints each row's raw HTML and keeps
+the :class:`~parsers.manage_html.Order` parsed from it under that
+fingerprint. A row seen on the last poll is not parsed again: its order
+is reused and reported in :attr:`RowCache.unchanged`, which
+:func:`data.db.log_orders` accepts so those orders are not compared with
+the database either.
+
+Pages the regular expressions cannot cut safely (comments, scripts or
+tables inside the order table, text between rows, unbalanced rows) are
+parsed whole, exactly as :func:`~parsers.manage_html.parse_orders` would.
+"""
+
+from __future__ import annotations
+
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Optional, Set
+import re
+
+from .manage_html import Order, parse_orders
+
+# The first tbody whose id is "table"; attribute values are case sensitive
+_TABLE_START = re.compile(
+    r"(?i:<tbody\b[^>]*?\sid\s*=\s*)(?:\"table\"|'table'|table(?=[\s/>]))[^>]*>"
+)
+_TABLE_END = re.compile(r"</tbody\s*>", re.I)
+_ROW_START = re.compile(r"<tr[\s/>]", re.I)
+_ROW_END = re.compile(r"</tr\s*>", re.I)
+_ROW_TAIL = re.compile(r"</tr\s*>\s*\Z", re.I)
+# Markup that can hide or nest rows: cut no page that has it in the table
+_UNSAFE = re.compile(
+    r"<(?:!--|!\[|/?table\b|/?tbody\b|script\b|style\b|template\b|textarea\b)",
+    re.I,
+)
+_TABLE_PREFIX = "<table><tbody id='table'>"
+_TABLE_SUFFIX = "</tbody></table>"
+
+
+def split_rows(html: str) -> Optional[List[str]]:
+    """Cut the order table of ``html`` into the raw HTML of its rows.
+
+    Returns ``None`` when the table is missing or its markup is not plain
+    enough to tell where each row ends without parsing it.
+    """
+    start = _TABLE_START.search(html)
+    if not start:
+        return None
+    end = _TABLE_END.search(html, start.end())
+    body = html[start.end() : end.start() if end else len(html)]
+    if _UNSAFE.search(body):
+        return None
+    bounds = [m.start() for m in _ROW_START.finditer(body)]
+    if body[: bounds[0] if bounds else len(body)].strip():
+        return None
+    rows = [body[a:b] for a, b in zip(bounds, bounds[1:] + [len(body)])]
+    for row in rows:
+        if not _ROW_TAIL.search(row) or len(_ROW_END.findall(row)) != 1:
+            return None
+    return rows
+
+
+def fingerprint(row: str) -> bytes:
+    """A digest of a row's raw HTML."""
+    return blake2b(row.encode("utf-8"), digest_size=16).digest()
+
+
+class RowCache:
+    """Parse successive polls of the manage page, reusing unchanged rows.
+
+    :meth:`parse` returns what :func:`~parsers.manage_html.parse_orders`
+    would for the page. Afterwards :attr:`unchanged` holds the numbers of
+    the orders whose rows are identical to the previous poll (their
+    ``Order`` objects are the very same ones) and :attr:`parsed` the
+    number of rows that had to be parsed. Orders that leave the page are
+    dropped from the cache.
+
+    When storing an order fails, call :meth:`forget` so the next poll
+    reports it as changed and it is written again.
+    """
+
+    def __init__(self, backend: Optional[str] = None) -> None:
+        self.backend = backend
+        self.unchanged: Set[str] = set()
+        self.parsed = 0
+        # The order parsed from each row, by the row's fingerprint
+        self._orders: Dict[bytes, Order] = {}
+
+    def parse(self, html: str) -> List[Order]:
+        rows = split_rows(html)
+        if rows is None:
+            return self._parse_whole(html)
+        prints = [fingerprint(row) for row in rows]
+        changed = [i for i, digest in enumerate(prints) if digest not in self._orders]
+        parsed: List[Order] = []
+        if changed:
+            page = _TABLE_PREFIX + "".join(rows[i] for i in changed) + _TABLE_SUFFIX
+            parsed = parse_orders(page, backend=self.backend)
+            if len(parsed) != len(changed):
+                # A row did not come back as one order; trust the whole page
+                return self._parse_whole(html)
+        known = self._orders
+        self._orders = dict(zip((prints[i] for i in changed), parsed))
+        reused = set()
+        for digest in prints:
+            if digest not in self._orders:
+                self._orders[digest] = known[digest]
+                reused.add(known[digest].number)
+        orders = [self._orders[digest] for digest in prints]
+        # An order with a changed row anywhere on the page has changed
+        self.unchanged = reused - {order.number for order in parsed}
+        self.parsed = len(changed)
+        return orders
+
+    def _parse_whole(self, html: str) -> List[Order]:
+        self.forget()
+        orders = parse_orders(html, backend=self.backend)
+        self.parsed = len(orders)
+        return orders
+
+    def forget(self, numbers: Optional[Iterable[str]] = None) -> None:
+        """Drop the cached rows of the orders in ``numbers``, or of every order."""
+        if numbers is None:
+            self._orders = {}
+        else:
+            drop = set(numbers)
+            self._orders = {d: o for d, o in self._orders.items() if o.number not in drop}
+        self.unchanged = set()
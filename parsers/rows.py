@@ -0,0 +1,107 @@
+"""Field extraction shared by every manage page parser.
+
+The helpers here turn the strings of a table row into order numbers,
+companies, step names and timestamps, and walk rows built by lxml or
+ElementTree the way BeautifulSoup's selectors would. Both
+:mod:`parsers.manage_html` and :mod:`manage_html_report` use them, so the
+rules live in one place.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, List, Optional, Set, Tuple
+import re
+
+_HAS_DIGIT = re.compile(r"\d")
+_HAS_LETTER = re.compile(r"[A-Za-z]")
+_TRAILING_NUMBER = re.compile(r"([A-Za-z0-9_-]+)$")
+_NOT_NUMBER = re.compile(r"[^A-Za-z0-9_-]")
+_LEADING_DIGITS = re.compile(r"^\d+")
+# %m/%d/%y %H:%M as strptime reads it; the ranges are checked by datetime
+_TIMESTAMP = re.compile(r"(\d\d?)/(\d\d?| \d)/(\d\d)\s+(\d\d?):(\d\d?)")
+# Distinct timestamps on a page; a poll sees the same ones again
+TIMESTAMP_CACHE_SIZE = 65536
+
+
+def number_and_company(cell_parts: List[str]) -> Tuple[str, str]:
+    """Pick the order number and company out of the first cell's strings."""
+    order_num = ""
+    company = ""
+    for part in cell_parts:
+        if not order_num and _HAS_DIGIT.search(part):
+            match = _TRAILING_NUMBER.search(part)
+            order_num = match.group(1) if match else _NOT_NUMBER.sub("", part)
+        elif not company and _HAS_LETTER.search(part):
+            company = part
+    return order_num, company
+
+
+def step_name(text: str) -> str:
+    """The workstation name in a step's first paragraph, without its position."""
+    return _LEADING_DIGITS.sub("", text)
+
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def parse_timestamp(text: str) -> Optional[datetime]:
+    """Read a step's ``np`` paragraph text as a ``%m/%d/%y %H:%M`` timestamp.
+
+    Non-breaking spaces are dropped first. Gives what ``datetime.strptime``
+    would, or ``None`` for an empty or invalid text, without going through
+    ``_strptime`` for every step.
+    """
+    text = text.replace("\xa0", "").strip()
+    match = _TIMESTAMP.fullmatch(text)
+    if not match:
+        return None
+    month, day, year, hour, minute = map(int, match.groups())
+    # %y: 69-99 are 1969-1999, 00-68 are 2000-2068
+    year += 1900 if year >= 69 else 2000
+    try:
+        return datetime(year, month, day, hour, minute)
+    except ValueError:
+        return None
+
+
+def strings(el) -> List[str]:
+    """Counterpart of BeautifulSoup's ``stripped_strings`` for lxml and ElementTree."""
+    return [s for s in (t.strip() for t in el.itertext()) if s]
+
+
+def element_text(el) -> str:
+    """Counterpart of BeautifulSoup's ``get_text(strip=True)`` for lxml and ElementTree."""
+    return "".join(strings(el))
+
+
+def has_class(el, name: str) -> bool:
+    """Whether ``name`` is one of the classes of element ``el``."""
+    return name in (el.get("class") or "").split()
+
+
+def find_class(el, tag: str, name: str) -> Any:
+    """The first ``tag`` element under ``el`` with class ``name``, or ``None``."""
+    return next((e for e in el.iter(tag) if has_class(e, name)), None)
+
+
+def workplace_items(tr) -> List[Any]:
+    """The ``<li>`` elements of ``ul.workplaces`` lists in row ``tr``, in order."""
+    items: List[Any] = []
+    seen: Set[Any] = set()
+    for ul in tr.iter("ul"):
+        if has_class(ul, "workplaces"):
+            for li in ul.iter("li"):
+                if li not in seen:
+                    seen.add(li)
+                    items.append(li)
+    return items
+
+
+def step_texts(li) -> Tuple[Optional[str], Optional[str]]:
+    """The texts of a step's first paragraph and of its ``p.np``, ``None`` if absent."""
+    name_p = next(li.iter("p"), None)
+    time_p = find_class(li, "p", "np")
+    return (
+        element_text(name_p) if name_p is not None else None,
+        element_text(time_p) if time_p is not None else None,
+    )
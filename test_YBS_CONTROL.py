@@ -1,12 +1,15 @@
 from unittest.mock import MagicMock, patch
 import requests
+import csv
 import os
+import tempfile
 import threading
 import unittest
-from datetime import time
+from datetime import datetime, time
 
 from ui.order_app import OrderScraperApp
 from login_dialog import LoginDialog
+from data import db
 import time_utils
 
 
@@ -63,6 +66,9 @@ class YBSControlTests(unittest.TestCase):
         self.app.export_time_var = SimpleVar("")
         self.app.export_job = None
         self.app.db_lock = threading.Lock()
+        self.app.db = None
+        self.app.snapshot = None
+        self.app.snapshot_status_var = SimpleVar("Live data")
         self.app.range_start_var = SimpleVar("")
         self.app.range_end_var = SimpleVar("")
         self.app.range_total_jobs_var = SimpleVar("")
@@ -70,7 +76,10 @@ class YBSControlTests(unittest.TestCase):
         self.app.date_tree = MagicMock()
         self.app.date_tree.get_children.return_value = []
         self.app.date_range_filter_var = SimpleVar("")
-        self.app.filtered_raw_date_range_rows = []
+        self.app.filtered_date_range_rows = []
+        self.app.date_range_order_hours = {}
+        self.app.date_range_workstations = {}
+        self.app.date_range_items = {}
         self.app._run_scheduled_export = OrderScraperApp._run_scheduled_export.__get__(self.app)
         self.app.run_date_range_report = OrderScraperApp.run_date_range_report.__get__(self.app)
         self.app.populate_date_range_table = OrderScraperApp.populate_date_range_table.__get__(self.app)
@@ -99,27 +108,43 @@ class YBSControlTests(unittest.TestCase):
         self.app.db_path_var = SimpleVar("orders.db")
         self.app.db = MagicMock()
         OrderScraperApp.connect_db(self.app, r"\\\\server\\share\\orders.db")
-        mock_connect.assert_called_with(r"\\\\server\\share\\orders.db", check_same_thread=False)
+        mock_connect.assert_called_with(
+            r"\\\\server\\share\\orders.db",
+            check_same_thread=False,
+            factory=db.Connection,
+            uri=True,
+        )
         self.assertEqual(self.app.config["db_path"], r"\\\\server\\share\\orders.db")
         expected_dir = os.path.dirname(r"\\\\server\\share\\orders.db") or os.getcwd()
         self.assertEqual(self.app.last_db_dir, expected_dir)
         self.app.save_config.assert_called_once()
 
+    def test_on_close_closes_database(self):
+        self.app.root = MagicMock()
+        self.app.recompute_worker = None
+        self.app.db = MagicMock()
+        OrderScraperApp.on_close(self.app)
+        self.app.db.close.assert_called_once()
+        self.app.root.destroy.assert_called_once()
+
     @patch("ui.order_app.messagebox")
     def test_update_business_hours_valid(self, mock_messagebox):
         self.app.business_start_var = SimpleVar("09:00")
         self.app.business_end_var = SimpleVar("17:00")
         self.app.save_config = MagicMock()
+        self.app.start_recompute = MagicMock()
         self.app.config = {}
         OrderScraperApp.update_business_hours(self.app)
-        self.assertEqual(time_utils.BUSINESS_START, time(9, 0))
-        self.assertEqual(time_utils.BUSINESS_END, time(17, 0))
+        # module defaults are never mutated
+        self.assertEqual(time_utils.BUSINESS_START, time(8, 0))
+        self.assertEqual(time_utils.BUSINESS_END, time(16, 30))
         self.assertEqual(self.app.config["business_start"], "09:00")
         self.assertEqual(self.app.config["business_end"], "17:00")
+        self.assertEqual(self.app.calendar.start, time(9, 0))
+        self.assertEqual(self.app.calendar.end, time(17, 0))
         self.app.save_config.assert_called_once()
+        self.app.start_recompute.assert_called_once()
         mock_messagebox.showinfo.assert_called_once()
-        time_utils.BUSINESS_START = time(8, 0)
-        time_utils.BUSINESS_END = time(16, 30)
 
     @patch("ui.order_app.filedialog.askopenfilename", return_value="/tmp/orders.db")
     def test_browse_db_uses_last_directory(self, mock_dialog):
@@ -170,25 +195,210 @@ class YBSControlTests(unittest.TestCase):
             {
                 "order": "1",
                 "company": "A",
-                "workstation": "WS1",
                 "hours": 2.0,
-                "start": "2024-01-01",
-                "end": "2024-01-01",
+                "status": "Completed",
             },
             {
                 "order": "2",
                 "company": "B",
-                "workstation": "WS2",
                 "hours": 3.0,
-                "start": "2024-01-02",
-                "end": "",
+                "status": "In Progress",
             },
         ]
-        self.app.load_jobs_by_date_range = MagicMock(return_value=rows)
-        self.app.load_steps = MagicMock(return_value=[])
+        self.app.load_order_groups_by_date_range = MagicMock(return_value=rows)
+        self.app.load_steps_many = MagicMock(return_value={})
+        self.app.load_order_hours = MagicMock(return_value={"1": 2.0, "2": 1.5})
         self.app.run_date_range_report()
         insert_calls = self.app.date_tree.insert.call_args_list
+        # Two orders with a placeholder child each, then the TOTAL row
         self.assertEqual(len(insert_calls), 5)
+        self.assertEqual(insert_calls[1].kwargs["tags"], ("placeholder",))
+        # Steps are only read once an order is opened
+        self.app.load_steps_many.assert_not_called()
+        self.assertEqual(self.app.range_total_jobs_var.get(), "2")
+        self.assertEqual(self.app.range_total_hours_var.get(), "3.50")
+        self.app.date_range_filter_var = SimpleVar("b")
+        self.app.search_orders = MagicMock(return_value={"2", "3"})
+        self.app.filter_date_range_rows()
+        self.app.search_orders.assert_called_once_with("b")
+        self.assertEqual(self.app.range_total_hours_var.get(), "1.50")
+
+    def _range_db(self):
+        conn, lock = db.connect_db(":memory:")
+        self.addCleanup(conn.close)
+        steps = [("Print", datetime(2024, 1, 8, 8, 0)), ("Cut", datetime(2024, 1, 8, 10, 0))]
+        for order in ("1003", "1001", "1002"):
+            db.log_order(conn, lock, order, "ACME", steps)
+        # Started after the range, so only its steps are known
+        db.log_order(conn, lock, "1004", "Other", [("Print", datetime(2024, 2, 8, 8, 0))])
+        self.app.db, self.app.db_lock = conn, lock
+        self.app.calendar = time_utils.DEFAULT_CALENDAR
+        self.app.range_start_var = SimpleVar("2024-01-01")
+        self.app.range_end_var = SimpleVar("2024-01-31")
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        self.app.export_path_var = SimpleVar(export_dir.name)
+        return conn
+
+    @patch("ui.order_app.messagebox")
+    def test_run_date_range_report_groups_in_sql(self, mock_messagebox):
+        conn = self._range_db()
+        db.log_order(
+            conn, self.app.db_lock, "1005", "ACME",
+            [("Print", datetime(2024, 1, 9, 8, 0)), ("Cut", datetime(2024, 1, 9, 9, 0)),
+             ("Ship", None)],
+        )
+        statements = []
+        conn.set_trace_callback(statements.append)
+        self.app.run_date_range_report()
+        conn.set_trace_callback(None)
+        self.assertEqual(
+            self.app.date_range_rows,
+            [
+                {"order": "1001", "company": "ACME", "hours": 2.0, "status": "Completed"},
+                {"order": "1002", "company": "ACME", "hours": 2.0, "status": "Completed"},
+                {"order": "1003", "company": "ACME", "hours": 2.0, "status": "Completed"},
+                # A step without a timestamp
+                {"order": "1005", "company": "ACME", "hours": 1.0, "status": "In Progress"},
+            ],
+        )
+        self.assertEqual(self.app.range_total_jobs_var.get(), "4")
+        # One row per order and the rollup hours; no steps or workstation
+        # rows, not counting the lookup of archives overlapping the range
+        selects = [
+            sql for sql in statements if sql.startswith("SELECT") and "FROM archives" not in sql
+        ]
+        self.assertEqual(len(selects), 2)
+
+    @patch("ui.order_app.messagebox")
+    def test_opened_orders_load_their_workstations(self, mock_messagebox):
+        conn = self._range_db()
+        # Its first lead time starts before the range
+        db.log_order(
+            conn, self.app.db_lock, "1006", "ACME",
+            [("Print", datetime(2023, 12, 29, 8, 0)), ("Cut", datetime(2024, 1, 2, 10, 0)),
+             ("Pack", datetime(2024, 1, 2, 12, 0))],
+        )
+        self.app.run_date_range_report()
+        workstations = self.app.load_date_range_workstations(["1001", "1006"])
+        # "Print" has no lead time and is added from the order's steps
+        self.assertEqual(
+            [(ws["workstation"], ws["start"], ws["end"]) for ws in workstations["1001"]],
+            [("Print", "", "2024-01-08 08:00"), ("Cut", "2024-01-08 08:00", "2024-01-08 10:00")],
+        )
+        # "Cut" started before the range: listed, but not in the order's total
+        self.assertEqual(
+            [(ws["workstation"], ws["hours"]) for ws in workstations["1006"]],
+            [("Print", 0.0), ("Cut", 19.0), ("Pack", 2.0)],
+        )
+        self.assertEqual(self.app.date_range_rows[-1]["hours"], 2.0)
+        self.assertIs(self.app.date_range_workstations["1006"], workstations["1006"])
+
+        # Opening a row swaps its placeholder for the loaded rows
+        self.app.date_tree = MagicMock()
+        self.app.date_range_items = {"I001": "1002"}
+        self.app.date_tree.get_children.return_value = ["I002"]
+        self.app.date_tree.item.return_value = ("placeholder",)
+        self.app.date_tree.focus.return_value = "I001"
+        self.app._on_date_row_open(None)
+        self.app.date_tree.delete.assert_called_once_with("I002")
+        inserted = [c.kwargs["values"][1] for c in self.app.date_tree.insert.call_args_list]
+        self.assertEqual(inserted, ["Print", "Cut"])
+
+    @patch("ui.order_app.messagebox")
+    def test_filter_date_range_rows_uses_search_index(self, mock_messagebox):
+        self._range_db()
+        self.app.run_date_range_report()
+        self.app.date_range_filter_var = SimpleVar("1002")
+        self.app.filter_date_range_rows()
+        self.assertEqual([r["order"] for r in self.app.filtered_date_range_rows], ["1002"])
+        # Orders outside the report are found but not shown
+        self.app.date_range_filter_var = SimpleVar("other")
+        self.assertEqual(self.app.search_orders("other"), {"1004"})
+        self.app.filter_date_range_rows()
+        self.assertEqual(self.app.filtered_date_range_rows, [])
+        self.assertEqual(self.app.range_total_jobs_var.get(), "0")
+
+    @patch("ui.order_app.messagebox")
+    def test_export_date_range_streams_rows(self, mock_messagebox):
+        conn = self._range_db()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        OrderScraperApp.export_date_range(self.app)
+        conn.set_trace_callback(None)
+        path = os.path.join(self.app.export_path_var.get(), "lead_time_20240101_20240131.csv")
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        # Grouped by order, in the order they were first stored
+        self.assertEqual([r["job_number"] for r in rows], ["1003", "1001", "1002"])
+        self.assertEqual(rows[0]["hours_in_queue"], "2.00")
+        # The order ids in the range, then one page of rows, not counting
+        # the lookup of archives overlapping the range
+        selects = [
+            sql for sql in statements if sql.startswith("SELECT") and "FROM archives" not in sql
+        ]
+        self.assertEqual(len(selects), 2)
+
+    @patch("ui.order_app.messagebox")
+    def test_export_date_range_csv_streams_groups(self, mock_messagebox):
+        self._range_db()
+        self.app.date_range_rows = []
+        OrderScraperApp.export_date_range_csv(self.app)
+        path = os.path.join(self.app.export_path_var.get(), "date_range_20240101_20240131.csv")
+        with open(path, newline="") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual([r[0] for r in rows[1:] if r[0]], ["1003", "1001", "1002"])
+        # The order row is followed by its steps, the missing "Print" added
+        self.assertEqual(rows[1][5:], ["2.00", "Completed"])
+        self.assertEqual([r[2] for r in rows[2:4]], ["Print", "Cut"])
+
+    @patch("ui.order_app.messagebox")
+    def test_reports_read_the_snapshot(self, mock_messagebox):
+        conn = self._range_db()
+        self.addCleanup(lambda: self.app.snapshot and self.app.snapshot.close())
+        OrderScraperApp.refresh_snapshot(self.app)
+        self.assertTrue(self.app.snapshot_status_var.get().startswith("Snapshot of"))
+        db.log_order(
+            conn, self.app.db_lock, "1005", "ACME",
+            [("Print", datetime(2024, 1, 9, 8, 0)), ("Cut", datetime(2024, 1, 9, 9, 0))],
+        )
+        # Neither the live connection nor the writer's lock is used
+        statements = []
+        conn.set_trace_callback(statements.append)
+        live_lock, self.app.db_lock = self.app.db_lock, MagicMock()
+        self.app.db_lock.__enter__.side_effect = AssertionError("writer lock taken")
+        self.app.run_date_range_report()
+        self.app.date_range_filter_var = SimpleVar("1005")
+        self.app.filter_date_range_rows()
+        self.app.db_lock = live_lock
+        conn.set_trace_callback(None)
+        self.assertEqual(statements, [])
+        self.assertEqual([r["order"] for r in self.app.date_range_rows], ["1001", "1002", "1003"])
+        # A refresh picks up the new order
+        OrderScraperApp.refresh_snapshot(self.app)
+        self.app.run_date_range_report()
+        self.assertIn("1005", [r["order"] for r in self.app.date_range_rows])
+
+    @patch("ui.order_app.messagebox")
+    def test_update_snapshot_settings(self, mock_messagebox):
+        self._range_db()
+        self.app.snapshot_minutes_var = SimpleVar("5")
+        OrderScraperApp.update_snapshot_settings(self.app)
+        self.addCleanup(lambda: self.app.snapshot and self.app.snapshot.close())
+        self.assertEqual(self.app.config["report_snapshot_minutes"], 5.0)
+        self.assertEqual(self.app.snapshot.interval, 300)
+        self.app.snapshot_minutes_var = SimpleVar("0")
+        OrderScraperApp.update_snapshot_settings(self.app)
+        self.assertIsNone(self.app.snapshot)
+        self.assertEqual(self.app.snapshot_status_var.get(), "Live data")
+        self.app.snapshot_minutes_var = SimpleVar("soon")
+        OrderScraperApp.update_snapshot_settings(self.app)
+        mock_messagebox.showerror.assert_called_once()
+
+    @patch("ui.order_app.messagebox")
+    def test_export_date_range_csv_requires_dates(self, mock_messagebox):
+        OrderScraperApp.export_date_range_csv(self.app)
+        mock_messagebox.showerror.assert_called_once()
 
 
 if __name__ == "__main__":
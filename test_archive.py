@@ -0,0 +1,250 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, time as clock_time, timedelta
+from unittest.mock import patch
+
+from data import archive, db
+from data.recompute import recompute_lead_times
+from data.snapshot import ReportingSnapshot
+from parsers.manage_html import Order, Step
+from time_utils import BusinessCalendar
+
+NOW = datetime(2024, 6, 1)
+YEAR = (datetime(2024, 1, 1), datetime(2024, 12, 31))
+
+
+def _order(number, day, done=True):
+    """Three steps on ``day``; the last two are pending unless ``done``."""
+    steps = [
+        Step("Print", day.replace(hour=8)),
+        Step("Cut", day.replace(hour=10) if done else None),
+        Step("Pack", day.replace(hour=12) if done else None),
+    ]
+    return Order(number, "ACME", "", "", steps)
+
+
+ORDERS = [
+    _order("1001", datetime(2024, 1, 8)),
+    _order("1002", datetime(2024, 1, 9)),
+    _order("1003", datetime(2024, 2, 12)),
+    _order("1004", datetime(2024, 1, 10), done=False),
+    _order("1005", datetime(2024, 5, 27)),
+]
+
+
+class ArchiveTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "orders.db")
+        self.conn, self.lock = db.connect_db(self.path)
+        self.addCleanup(self.conn.close)
+        db.log_orders(self.conn, self.lock, ORDERS)
+
+    def _loads(self):
+        conn, lock = self.conn, self.lock
+        numbers = [o.number for o in ORDERS]
+        return (
+            sorted(map(str, db.load_jobs_by_date_range(conn, lock, *YEAR))),
+            db.load_order_groups_by_date_range(conn, lock, *YEAR),
+            db.load_order_hours(conn, lock, *YEAR),
+            sorted(db.iter_jobs_by_date_range(conn, lock, *YEAR, page_size=2)),
+            db.load_steps_many(conn, lock, numbers),
+            db.load_lead_times_many(conn, lock, numbers),
+            [db.load_steps(conn, lock, n) for n in numbers],
+            [db.load_lead_times(conn, lock, n) for n in numbers],
+        )
+
+    def test_moves_old_completed_orders_to_monthly_files(self):
+        before = self._loads()
+        moved = archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        self.assertEqual(moved, {"2024-01": 2, "2024-02": 1})
+        archived = dict(self.conn.execute("SELECT order_number, archived FROM orders"))
+        self.assertEqual(
+            archived,
+            {
+                "1001": "2024-01",
+                "1002": "2024-01",
+                "1003": "2024-02",
+                "1004": None,
+                "1005": None,
+            },
+        )
+        live = {r[0] for r in self.conn.execute("SELECT DISTINCT order_id FROM steps")}
+        self.assertEqual(len(live), 2)
+        self.assertTrue(os.path.exists(os.path.join(self.path[:-3] + "-archive", "2024-01.db")))
+        self.assertEqual(self._loads(), before)
+        # Nothing left to do
+        self.assertEqual(archive.archive_orders(self.conn, self.lock, 30, now=NOW), {})
+
+    def test_ranges_only_read_overlapping_archives(self):
+        conn, lock = db.connect_db(self.path, wal=False)
+        self.addCleanup(conn.close)
+        archive.archive_orders(conn, lock, 30, now=NOW)
+        may = (datetime(2024, 5, 1), datetime(2024, 5, 31))
+        rows = db.load_jobs_by_date_range(conn, lock, *may)
+        self.assertEqual({r["order"] for r in rows}, {"1005"})
+        self.assertFalse(getattr(conn, "attached_archives", None))
+        february = (datetime(2024, 2, 1), datetime(2024, 2, 29))
+        rows = db.load_jobs_by_date_range(conn, lock, *february)
+        self.assertEqual({r["order"] for r in rows}, {"1003"})
+        self.assertEqual(list(conn.attached_archives), ["2024-02"])
+
+    def test_least_recently_used_archive_is_detached(self):
+        conn, lock = db.connect_db(self.path, wal=False)
+        self.addCleanup(conn.close)
+        archive.archive_orders(conn, lock, 30, now=NOW)
+        with patch.object(db, "MAX_ATTACHED_ARCHIVES", 1):
+            self.assertEqual(len(db.load_steps(conn, lock, "1001")), 3)
+            self.assertEqual(len(db.load_steps(conn, lock, "1003")), 3)
+            self.assertEqual(list(conn.attached_archives), ["2024-02"])
+            self.assertEqual(len(db.load_jobs_by_date_range(conn, lock, *YEAR)), 8)
+        schemas = {r[1] for r in conn.execute("PRAGMA database_list")}
+        self.assertEqual(schemas, {"main", "archive_2024_02"})
+
+    def test_unc_archive_dir_is_attached(self):
+        self.assertEqual(
+            db.archive_uri("\\\\server\\share\\orders-archive\\2024-01.db"),
+            "file:////server/share/orders-archive/2024-01.db?mode=ro",
+        )
+        self.assertEqual(
+            db.archive_uri("//server/share/my orders/2024-01.db"),
+            "file:////server/share/my%20orders/2024-01.db?mode=ro",
+        )
+        archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        # A POSIX path with two leading slashes goes through the UNC branch
+        unc_dir = "/" + os.path.abspath(self.conn.archive_dir)
+        conn, lock = db.connect_db(self.path, wal=False, archive_dir=unc_dir)
+        self.addCleanup(conn.close)
+        self.assertEqual(len(db.load_steps(conn, lock, "1001")), 3)
+        self.assertEqual(list(conn.attached_archives), ["2024-01"])
+
+    def test_archived_orders_are_final(self):
+        archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        changed = _order("1001", datetime(2024, 1, 9))
+        self.assertFalse(db.log_orders(self.conn, self.lock, [changed]))
+        db.record_print_file_start(self.conn, self.lock, "1001")
+        live = self.conn.execute(
+            "SELECT COUNT(*) FROM steps s JOIN orders o ON o.id = s.order_id "
+            "WHERE o.order_number='1001'"
+        ).fetchone()
+        self.assertEqual(live[0], 0)
+        steps = db.load_steps(self.conn, self.lock, "1001")
+        self.assertEqual(steps[0][1], datetime(2024, 1, 8, 8))
+
+    def test_changed_order_is_rechecked(self):
+        due = archive._due(self.conn, self.lock, db.to_epoch(NOW - timedelta(days=30)))
+        reopened = _order("1002", datetime(2024, 1, 9), done=False)
+        db.log_orders(self.conn, self.lock, [reopened])
+        with patch.object(archive, "_due", return_value=due):
+            moved = archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        self.assertEqual(moved, {"2024-01": 1, "2024-02": 1})
+
+    def test_interrupted_move_is_not_read_twice(self):
+        before = self._loads()
+        failing = patch.object(self.conn, "commit", side_effect=RuntimeError("crash"))
+        with failing, self.assertRaises(RuntimeError):
+            archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        # The rows reached the archive but the live file was rolled back
+        copy = db.sqlite3.connect(db.archive_path(self.conn.archive_dir, "2024-01"))
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute("SELECT COUNT(*) FROM steps").fetchone()[0], 6)
+        self.assertEqual(self._loads(), before)
+        archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        self.assertEqual(copy.execute("SELECT COUNT(*) FROM steps").fetchone()[0], 6)
+        self.assertEqual(self._loads(), before)
+
+    def test_recompute_rebuilds_archived_orders(self):
+        # Expected results: the same recompute without any archive
+        nine_to_five = BusinessCalendar(shifts=((clock_time(9, 0), clock_time(17, 0)),))
+        recompute_lead_times(self.conn, self.lock, nine_to_five)
+        expected = self._loads()
+        self.assertEqual(db.load_order_hours(self.conn, self.lock, *YEAR)["1001"], 3.0)
+        recompute_lead_times(self.conn, self.lock)
+
+        archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        progress = []
+        recompute_lead_times(
+            self.conn, self.lock, nine_to_five, chunk_size=2,
+            progress=lambda done, total: progress.append((done, total)),
+        )
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+        self.assertEqual(self._loads(), expected)
+        copy = db.sqlite3.connect(db.archive_path(self.conn.archive_dir, "2024-01"))
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute("SELECT COUNT(*) FROM lead_times").fetchone()[0], 4)
+        row = self.conn.execute("SELECT orders FROM archives WHERE month='2024-01'")
+        self.assertEqual(row.fetchone()[0], 2)
+
+    def test_snapshot_reads_archives(self):
+        archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        snapshot = ReportingSnapshot(self.conn, self.lock)
+        self.addCleanup(snapshot.close)
+        with snapshot.reading() as (conn, lock):
+            rows = db.load_jobs_by_date_range(conn, lock, *YEAR)
+        self.assertEqual(len(rows), 8)
+
+    def test_incremental_vacuum_shrinks_the_file(self):
+        db.log_orders(
+            self.conn,
+            self.lock,
+            [
+                _order(str(2000 + n), datetime(2024, 1, 1) + timedelta(days=n % 28))
+                for n in range(3000)
+            ],
+        )
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = os.path.getsize(self.path)
+        archive.archive_orders(self.conn, self.lock, 30, now=NOW)
+        freed = archive.incremental_vacuum(self.conn, self.lock, pages=10)
+        self.assertGreater(freed, 10)
+        self.assertEqual(self.conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.assertLess(os.path.getsize(self.path), size / 2)
+
+    def test_existing_database_needs_full_vacuum_first(self):
+        conn = db.sqlite3.connect(self.path + ".old")
+        conn.execute("CREATE TABLE t (x)")
+        conn.close()
+        conn, lock = db.connect_db(self.path + ".old")
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 0)
+        self.assertEqual(archive.incremental_vacuum(conn, lock), 0)
+        archive.enable_incremental_vacuum(conn, lock)
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+
+    def test_memory_database_cannot_be_archived(self):
+        conn, lock = db.connect_db(":memory:")
+        self.addCleanup(conn.close)
+        with self.assertRaises(ValueError):
+            archive.archive_orders(conn, lock, 30)
+
+    def test_worker_archives_in_background(self):
+        with patch.object(archive, "datetime") as clock:
+            clock.now.return_value = NOW
+            worker = archive.ArchiveWorker(self.conn, self.lock, 30).start()
+            deadline = time.monotonic() + 10
+            while worker.is_alive() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertIsNone(worker.error)
+        self.assertEqual(worker.progress, (3, 3))
+        self.assertEqual(worker.moved, {"2024-01": 2, "2024-02": 1})
+
+    def test_cli(self):
+        self.conn.close()
+        config = self.path + ".json"
+        with open(config, "w", encoding="utf-8") as f:
+            f.write('{"archive_after_days": 30}')
+        with patch("sys.stderr"):
+            self.assertEqual(archive.main([self.path, "--config", config]), 0)
+        conn, _ = db.connect_db(self.path)
+        self.addCleanup(conn.close)
+        count = conn.execute("SELECT COUNT(*) FROM orders WHERE archived IS NOT NULL").fetchone()
+        # Everything but the open order finished over 30 days before today
+        self.assertEqual(count[0], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
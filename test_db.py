@@ -0,0 +1,811 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch
+
+from hypothesis import given, settings, strategies as st
+
+import time_utils
+from data import db, migrations, recompute
+from parsers.manage_html import Order, Step
+
+
+STEPS = [
+    ("Print", datetime(2024, 1, 8, 8, 0)),
+    ("Cut", datetime(2024, 1, 8, 10, 0)),
+    ("Ship", None),
+]
+
+
+class ConnectionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "orders.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_file_database_uses_wal_and_reader_pool(self):
+        conn, lock = db.connect_db(self.path)
+        try:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            self.assertEqual(mode, "wal")
+            self.assertIsInstance(conn.readers, db.ReaderPool)
+            db.log_order(conn, lock, "1001", "ACME", STEPS)
+            # Reads go through the pool and do not wait for the writer lock
+            with lock:
+                steps = db.load_steps(conn, lock, "1001")
+                lead_times = db.load_lead_times(conn, lock, "1001")
+                jobs = db.load_jobs_by_date_range(
+                    conn, lock, datetime(2024, 1, 1), datetime(2024, 1, 31)
+                )
+            self.assertEqual(steps, STEPS)
+            self.assertEqual(lead_times[0]["hours"], 2.0)
+            self.assertEqual(jobs[0]["order"], "1001")
+        finally:
+            conn.close()
+
+    def test_readers_cannot_write(self):
+        conn, lock = db.connect_db(self.path)
+        try:
+            with conn.readers.connection() as reader:
+                with self.assertRaises(db.sqlite3.OperationalError):
+                    reader.execute("DELETE FROM orders")
+        finally:
+            conn.close()
+
+    def test_pool_limits_open_connections(self):
+        conn, lock = db.connect_db(self.path, readers=2)
+        results = []
+
+        def read():
+            for _ in range(20):
+                results.append(db.load_steps(conn, lock, "missing"))
+
+        try:
+            threads = [threading.Thread(target=read) for _ in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(len(results), 120)
+            self.assertLessEqual(len(conn.readers._opened), 2)
+        finally:
+            conn.close()
+
+    def test_rollback_journal_without_wal(self):
+        conn, lock = db.connect_db(self.path, wal=False)
+        try:
+            self.assertIsNone(conn.readers)
+            self.assertNotEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            db.log_order(conn, lock, "1001", "ACME", STEPS)
+            self.assertEqual(db.load_steps(conn, lock, "1001"), STEPS)
+        finally:
+            conn.close()
+
+    def test_memory_database_shares_connection(self):
+        conn, lock = db.connect_db(":memory:")
+        try:
+            self.assertIsNone(conn.readers)
+            db.log_order(conn, lock, "1001", "ACME", STEPS)
+            self.assertEqual(db.load_steps(conn, lock, "1001"), STEPS)
+        finally:
+            conn.close()
+
+
+class EpochTests(unittest.TestCase):
+    def test_round_trip(self):
+        ts = datetime(2024, 3, 10, 2, 30)
+        self.assertEqual(db.from_epoch(db.to_epoch(ts)), ts)
+        self.assertIsNone(db.to_epoch(None))
+        self.assertIsNone(db.from_epoch(None))
+
+    def test_aware_datetimes_are_converted_to_utc(self):
+        aware = datetime(2024, 1, 8, 10, 0, tzinfo=timezone(timedelta(hours=2)))
+        self.assertEqual(db.from_epoch(db.to_epoch(aware)), datetime(2024, 1, 8, 8, 0))
+
+
+class LoadManyTests(unittest.TestCase):
+    def setUp(self):
+        self.conn, self.lock = db.connect_db(":memory:")
+        self.orders = [
+            Order(str(n), "ACME", "Running", "", [Step(*s) for s in STEPS])
+            for n in range(1200)
+        ]
+        db.log_orders(self.conn, self.lock, self.orders)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_load_steps_many_matches_load_steps(self):
+        numbers = [o.number for o in self.orders] + ["missing"]
+        many = db.load_steps_many(self.conn, self.lock, numbers)
+        self.assertEqual(list(many), numbers)
+        self.assertEqual(many["missing"], [])
+        for number in ("0", "599", "1199"):
+            self.assertEqual(many[number], db.load_steps(self.conn, self.lock, number))
+
+    def test_load_lead_times_many_matches_load_lead_times(self):
+        numbers = [o.number for o in self.orders]
+        for start, end in ((None, None), (datetime(2024, 1, 8), datetime(2024, 1, 9))):
+            many = db.load_lead_times_many(self.conn, self.lock, numbers, start, end)
+            for number in ("0", "1199"):
+                self.assertEqual(
+                    many[number],
+                    db.load_lead_times(self.conn, self.lock, number, start, end),
+                )
+        outside = db.load_lead_times_many(
+            self.conn, self.lock, numbers[:3], datetime(2024, 2, 1)
+        )
+        self.assertEqual(outside, {"0": [], "1": [], "2": []})
+
+    def test_iter_jobs_by_date_range_matches_load_jobs(self):
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 31)
+        loaded = db.load_jobs_by_date_range(self.conn, self.lock, start, end)
+        streamed = list(db.iter_jobs_by_date_range(self.conn, self.lock, start, end, page_size=7))
+        self.assertEqual(len(streamed), len(loaded))
+        self.assertEqual(
+            sorted((r.order, r.workstation, r.hours, r.start, r.end) for r in streamed),
+            sorted(
+                (
+                    r["order"],
+                    r["workstation"],
+                    r["hours"],
+                    datetime.strptime(r["start"], "%Y-%m-%d %H:%M"),
+                    datetime.strptime(r["end"], "%Y-%m-%d %H:%M"),
+                )
+                for r in loaded
+            ),
+        )
+        # The rows of each order arrive together
+        orders = [r.order for r in streamed]
+        runs = [o for i, o in enumerate(orders) if i == 0 or orders[i - 1] != o]
+        self.assertEqual(len(runs), len(set(orders)))
+
+    def test_load_order_groups_matches_load_jobs(self):
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 31)
+        expected = {}
+        for r in db.load_jobs_by_date_range(self.conn, self.lock, start, end):
+            g = expected.setdefault(r["order"], {"company": r["company"], "hours": 0.0})
+            g["hours"] += r["hours"]
+        groups = db.load_order_groups_by_date_range(self.conn, self.lock, start, end)
+        self.assertEqual([g["order"] for g in groups], sorted(expected))
+        for g in groups:
+            want = expected[g["order"]]
+            self.assertEqual(g["company"], want["company"])
+            self.assertAlmostEqual(g["hours"], want["hours"])
+            # Ship has no timestamp yet
+            self.assertEqual(g["status"], "In Progress")
+        self.assertEqual(
+            db.load_order_groups_by_date_range(
+                self.conn, self.lock, datetime(2024, 2, 1), datetime(2024, 2, 2)
+            ),
+            [],
+        )
+
+    def test_iter_jobs_by_date_range_releases_lock_between_pages(self):
+        conn, lock = db.connect_db(":memory:")
+        self.addCleanup(conn.close)
+        db.log_orders(conn, lock, self.orders[:10])
+        rows = db.iter_jobs_by_date_range(
+            conn, lock, datetime(2024, 1, 1), datetime(2024, 1, 31), page_size=3
+        )
+        seen = 0
+        for _ in rows:
+            seen += 1
+            self.assertFalse(lock.locked())
+        self.assertGreater(seen, 3)
+
+
+class LogOrdersTests(unittest.TestCase):
+    def setUp(self):
+        self.conn, self.lock = db.connect_db(":memory:")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _order(self, number, steps, company="ACME"):
+        return Order(number, company, "Running", "", [Step(n, ts) for n, ts in steps])
+
+    def test_log_orders_matches_log_order(self):
+        other, other_lock = db.connect_db(":memory:")
+        try:
+            pages = [
+                self._order("1001", STEPS),
+                self._order("1002", STEPS[:2], company="Widgets"),
+                self._order("1003", []),
+            ]
+            db.log_orders(self.conn, self.lock, pages)
+            for order in pages:
+                db.log_order(
+                    other,
+                    other_lock,
+                    order.number,
+                    order.company,
+                    [(s.name, s.timestamp) for s in order.steps],
+                )
+            for table in ("orders", "steps", "lead_times"):
+                query = f"SELECT * FROM {table} ORDER BY rowid"
+                self.assertEqual(
+                    self.conn.execute(query).fetchall(), other.execute(query).fetchall()
+                )
+        finally:
+            other.close()
+
+    def test_log_orders_keeps_print_file(self):
+        db.record_print_file_start(self.conn, self.lock, "1001")
+        pf = db.load_steps(self.conn, self.lock, "1001")[0]
+        db.log_orders(self.conn, self.lock, [self._order("1001", STEPS)])
+        self.assertEqual(db.load_steps(self.conn, self.lock, "1001"), [pf] + STEPS)
+        # A page that does list "Print File" replaces the stored value
+        db.log_orders(
+            self.conn,
+            self.lock,
+            [self._order("1001", [("Print File", datetime(2024, 1, 5, 9, 0))] + STEPS)],
+        )
+        self.assertEqual(
+            db.load_steps(self.conn, self.lock, "1001")[0],
+            ("Print File", datetime(2024, 1, 5, 9, 0)),
+        )
+
+    def test_log_orders_commits_once(self):
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        db.log_orders(
+            self.conn, self.lock, [self._order(str(n), STEPS) for n in range(1200)]
+        )
+        self.conn.set_trace_callback(None)
+        self.assertEqual(statements.count("COMMIT"), 1)
+        self.assertEqual(
+            self.conn.execute("SELECT COUNT(*) FROM steps").fetchone()[0], 1200 * 3
+        )
+
+
+_STEP_LISTS = st.lists(
+    st.lists(
+        st.tuples(
+            st.sampled_from(["Print", "Cut", "Ship"]),
+            st.one_of(
+                st.none(),
+                st.integers(0, 20).map(lambda h: datetime(2024, 1, 8) + timedelta(hours=h)),
+            ),
+        ),
+        max_size=6,
+    ),
+    min_size=1,
+    max_size=5,
+)
+
+
+class IncrementalLogOrderTests(unittest.TestCase):
+    def setUp(self):
+        self.conn, self.lock = db.connect_db(":memory:")
+        db.log_order(self.conn, self.lock, "1001", "ACME", STEPS)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _rows(self, conn, table):
+        return conn.execute(f"SELECT rowid, * FROM {table} ORDER BY rowid").fetchall()
+
+    def _writes(self, statements):
+        return [
+            sql
+            for sql in statements
+            if sql.split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE", "COMMIT")
+        ]
+
+    def test_unchanged_order_is_not_written(self):
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        changed = db.log_order(self.conn, self.lock, "1001", "ACME", STEPS)
+        orders = [Order("1001", "ACME", "Running", "", [Step(*s) for s in STEPS])]
+        changed_many = db.log_orders(self.conn, self.lock, orders)
+        self.conn.set_trace_callback(None)
+        self.assertFalse(changed)
+        self.assertFalse(changed_many)
+        self.assertEqual(self._writes(statements), [])
+
+    def test_changed_step_rewrites_only_its_rows(self):
+        steps_before = self._rows(self.conn, "steps")
+        lead_times_before = self._rows(self.conn, "lead_times")
+        shipped = STEPS[:2] + [("Ship", datetime(2024, 1, 8, 13, 0))]
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        self.assertTrue(db.log_order(self.conn, self.lock, "1001", "ACME", shipped))
+        self.conn.set_trace_callback(None)
+
+        writes = self._writes(statements)
+        self.assertEqual(len([w for w in writes if w.startswith("UPDATE steps")]), 1)
+        self.assertFalse([w for w in writes if w.startswith("INSERT INTO steps")])
+        self.assertFalse([w for w in writes if w.startswith("INSERT OR REPLACE")])
+        self.assertEqual(writes.count("COMMIT"), 1)
+        steps_after = self._rows(self.conn, "steps")
+        self.assertEqual(steps_after[:2], steps_before[:2])
+        self.assertEqual(steps_after[2][0], steps_before[2][0])
+        # The existing Print -> Cut lead time is left alone, Cut -> Ship is added
+        lead_times_after = self._rows(self.conn, "lead_times")
+        self.assertEqual(lead_times_after[0], lead_times_before[0])
+        ship = self.conn.execute("SELECT id FROM workstations WHERE name='Ship'").fetchone()[0]
+        self.assertEqual(
+            lead_times_after[1][2:],
+            (
+                ship,
+                db.to_epoch(datetime(2024, 1, 8, 10, 0)),
+                db.to_epoch(datetime(2024, 1, 8, 13, 0)),
+                3.0,
+            ),
+        )
+
+    def test_company_change_keeps_steps(self):
+        steps_before = self._rows(self.conn, "steps")
+        self.assertTrue(db.log_order(self.conn, self.lock, "1001", "Widgets", STEPS))
+        self.assertEqual(self._rows(self.conn, "steps"), steps_before)
+        self.assertEqual(
+            self.conn.execute(
+                "SELECT c.name FROM orders o JOIN companies c ON c.id = o.company_id"
+            ).fetchall(),
+            [("Widgets",)],
+        )
+
+    @settings(max_examples=50, deadline=None)
+    @given(_STEP_LISTS)
+    def test_matches_full_rewrite(self, history):
+        conn, lock = db.connect_db(":memory:")
+        try:
+            for steps in history:
+                db.log_order(conn, lock, "2002", "ACME", steps)
+            fresh, fresh_lock = db.connect_db(":memory:")
+            try:
+                db.log_order(fresh, fresh_lock, "2002", "ACME", history[-1])
+                self.assertEqual(
+                    db.load_steps(conn, lock, "2002"), db.load_steps(fresh, fresh_lock, "2002")
+                )
+                # Workstation ids depend on the order names were first seen in
+                for query in (
+                    "SELECT w.name, start, end, hours FROM lead_times "
+                    "JOIN workstations w ON w.id = workstation_id ORDER BY start, end, w.name",
+                    "SELECT day, w.name, business_hours FROM daily_workstation_hours "
+                    "JOIN workstations w ON w.id = workstation_id ORDER BY day, w.name",
+                ):
+                    self.assertEqual(
+                        conn.execute(query).fetchall(), fresh.execute(query).fetchall()
+                    )
+            finally:
+                fresh.close()
+        finally:
+            conn.close()
+
+
+class DailyHoursTests(unittest.TestCase):
+    def setUp(self):
+        self.conn, self.lock = db.connect_db(":memory:")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _rollup(self, order_number):
+        rows = self.conn.execute(
+            "SELECT day, w.name, business_hours FROM daily_workstation_hours d "
+            "JOIN workstations w ON w.id = d.workstation_id "
+            "JOIN orders o ON o.id = d.order_id "
+            "WHERE o.order_number=? ORDER BY day, w.name",
+            (order_number,),
+        ).fetchall()
+        return [(db.from_epoch(day).date(), ws, hours) for day, ws, hours in rows]
+
+    def test_lead_times_are_split_per_day(self):
+        db.log_order(
+            self.conn,
+            self.lock,
+            "1001",
+            "ACME",
+            [
+                ("Print", datetime(2024, 1, 5, 15, 0)),  # Friday
+                ("Cut", datetime(2024, 1, 8, 10, 0)),
+                ("Cut", datetime(2024, 1, 8, 12, 0)),
+            ],
+        )
+        self.assertEqual(
+            self._rollup("1001"),
+            [(date(2024, 1, 5), "Cut", 1.5), (date(2024, 1, 8), "Cut", 4.0)],
+        )
+
+    def test_rollup_follows_changes(self):
+        db.log_order(self.conn, self.lock, "1001", "ACME", STEPS)
+        db.log_order(self.conn, self.lock, "1002", "ACME", STEPS)
+        other = self._rollup("1002")
+        db.log_order(
+            self.conn,
+            self.lock,
+            "1001",
+            "ACME",
+            STEPS[:2] + [("Ship", datetime(2024, 1, 9, 9, 0))],
+        )
+        self.assertEqual(
+            self._rollup("1001"),
+            [
+                (date(2024, 1, 8), "Cut", 2.0),
+                (date(2024, 1, 8), "Ship", 6.5),
+                (date(2024, 1, 9), "Ship", 1.0),
+            ],
+        )
+        self.assertEqual(self._rollup("1002"), other)
+
+    def test_order_hours_are_clipped_to_range(self):
+        db.log_order(
+            self.conn,
+            self.lock,
+            "1001",
+            "ACME",
+            [("Print", datetime(2024, 1, 8, 8, 0)), ("Cut", datetime(2024, 1, 10, 10, 0))],
+        )
+        db.log_order(self.conn, self.lock, "1002", "ACME", STEPS)
+        self.assertEqual(
+            db.load_order_hours(self.conn, self.lock),
+            {"1001": 19.0, "1002": 2.0},
+        )
+        self.assertEqual(
+            db.load_order_hours(
+                self.conn, self.lock, datetime(2024, 1, 9), datetime(2024, 1, 10)
+            ),
+            {"1001": 10.5},
+        )
+
+
+class NameCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.conn, self.lock = db.connect_db(":memory:")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_loaded_rows_share_names(self):
+        db.log_order(self.conn, self.lock, "1001", "ACME", STEPS)
+        db.log_order(self.conn, self.lock, "1002", "ACME", STEPS)
+        first = db.load_steps(self.conn, self.lock, "1001")
+        second = db.load_steps(self.conn, self.lock, "1002")
+        self.assertIs(first[0][0], second[0][0])
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        db.load_steps(self.conn, self.lock, "1001")
+        self.conn.set_trace_callback(None)
+        self.assertFalse([sql for sql in statements if "FROM workstations" in sql])
+
+    def test_rolled_back_names_are_not_cached(self):
+        with self.lock:
+            cur = self.conn.cursor()
+            self.conn.workstations.intern(cur, ["Laminate"])
+            self.conn.rollback()
+        db.log_order(self.conn, self.lock, "1001", "ACME", [("Pack", datetime(2024, 1, 8))])
+        self.assertEqual(
+            db.load_steps(self.conn, self.lock, "1001"), [("Pack", datetime(2024, 1, 8))]
+        )
+        self.assertNotIn("Laminate", self.conn.workstations.ids)
+
+    def test_failed_write_is_rolled_back(self):
+        with self.assertRaises(AttributeError):
+            db.log_order(self.conn, self.lock, "1001", "ACME", [("Print", "not a date")])
+        self.assertFalse(self.conn.in_transaction)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0], 0)
+
+
+class SearchOrdersTests(unittest.TestCase):
+    def setUp(self):
+        self.conn, self.lock = db.connect_db(":memory:")
+        for number, company in (("100123", "Acme Signs"), ("200456", "Zed_Print"), ("7", "O'Brien \"Big\" Co")):
+            db.log_order(self.conn, self.lock, number, company, STEPS)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def search(self, term):
+        return db.search_orders(self.conn, self.lock, term)
+
+    def test_matches_order_number_and_company_substrings(self):
+        self.assertEqual(self.search("0012"), {"100123"})
+        self.assertEqual(self.search("SIGN"), {"100123"})
+        self.assertEqual(self.search("00"), {"100123", "200456"})
+        self.assertEqual(self.search("7"), {"7"})
+        self.assertEqual(self.search("  "), set())
+        self.assertEqual(self.search("nothing"), set())
+
+    def test_special_characters_are_literal(self):
+        self.assertEqual(self.search('"Big"'), {"7"})
+        self.assertEqual(self.search("d_"), {"200456"})
+        self.assertEqual(self.search("%"), set())
+
+    def test_index_follows_company_changes(self):
+        db.log_order(self.conn, self.lock, "100123", "Globex", STEPS)
+        self.assertEqual(self.search("acme"), set())
+        self.assertEqual(self.search("globex"), {"100123"})
+        self.assertEqual(self.search("0012"), {"100123"})
+        count = self.conn.execute("SELECT COUNT(*) FROM order_search").fetchone()[0]
+        self.assertEqual(count, 3)
+
+
+class SearchWithoutTrigramTests(unittest.TestCase):
+    """SQLite before 3.34 has no trigram tokenizer."""
+
+    def test_search_scans_orders_until_trigrams_are_available(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "orders.db")
+            with patch.object(migrations, "trigram_supported", return_value=False):
+                conn, lock = db.connect_db(path)
+                try:
+                    self.assertFalse(conn.order_search)
+                    self.assertFalse(migrations.has_order_search(conn))
+                    db.log_order(conn, lock, "100123", "Acme Signs", STEPS)
+                    db.log_order(conn, lock, "200456", "Zed_Print", STEPS)
+                    self.assertEqual(db.search_orders(conn, lock, "0012"), {"100123"})
+                    self.assertEqual(db.search_orders(conn, lock, "sign"), {"100123"})
+                finally:
+                    conn.close()
+            conn, lock = db.connect_db(path)
+            try:
+                self.assertTrue(conn.order_search)
+                count = conn.execute("SELECT COUNT(*) FROM order_search").fetchone()[0]
+                self.assertEqual(count, 2)
+                db.log_order(conn, lock, "300789", "Acme Print", STEPS)
+                self.assertEqual(db.search_orders(conn, lock, "acme"), {"100123", "300789"})
+            finally:
+                conn.close()
+
+
+class MigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "orders.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _indexes(self, conn):
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%'"
+        ).fetchall()
+        return {r[0] for r in rows}
+
+    def test_new_database_is_current(self):
+        conn, lock = db.connect_db(self.path)
+        try:
+            self.assertEqual(migrations.schema_version(conn), migrations.SCHEMA_VERSION)
+            self.assertIn("idx_steps_order", self._indexes(conn))
+        finally:
+            conn.close()
+
+    def test_upgrades_unversioned_database(self):
+        legacy = db.sqlite3.connect(self.path)
+        legacy.execute("CREATE TABLE orders (order_number TEXT PRIMARY KEY, company TEXT)")
+        legacy.execute("CREATE TABLE steps (order_number TEXT, step TEXT, timestamp TEXT)")
+        legacy.execute(
+            "CREATE TABLE lead_times (order_number TEXT, workstation TEXT, start TEXT, end TEXT, hours REAL)"
+        )
+        legacy.executemany(
+            "INSERT INTO steps VALUES (?, ?, ?)",
+            [
+                ("1001", "Print", "2024-01-08 08:00:00"),
+                ("1001", "Cut", "2024-01-08T10:00:00.250000"),
+                ("1001", "Ship", ""),
+            ],
+        )
+        legacy.execute(
+            "INSERT INTO lead_times VALUES "
+            "('1001', 'Cut', '2024-01-08 08:00:00', '2024-01-08 10:00:00', 2.0)"
+        )
+        legacy.commit()
+        legacy.close()
+
+        conn, lock = db.connect_db(self.path)
+        try:
+            self.assertEqual(migrations.schema_version(conn), migrations.SCHEMA_VERSION)
+            self.assertEqual(
+                db.load_steps(conn, lock, "1001"),
+                [
+                    ("Print", datetime(2024, 1, 8, 8, 0)),
+                    ("Cut", datetime(2024, 1, 8, 10, 0)),
+                    ("Ship", None),
+                ],
+            )
+            self.assertEqual(
+                db.load_lead_times(conn, lock, "1001", datetime(2024, 1, 8)),
+                [
+                    {
+                        "workstation": "Cut",
+                        "start": datetime(2024, 1, 8, 8, 0),
+                        "end": datetime(2024, 1, 8, 10, 0),
+                        "hours": 2.0,
+                    }
+                ],
+            )
+            types = conn.execute(
+                "SELECT DISTINCT typeof(start), typeof(end) FROM lead_times"
+            ).fetchall()
+            self.assertEqual(types, [("integer", "integer")])
+            self.assertTrue(
+                {
+                    "idx_steps_order",
+                    "idx_lead_times_order_start",
+                    "idx_lead_times_start",
+                }
+                <= self._indexes(conn)
+            )
+        finally:
+            conn.close()
+
+    def test_rollup_backfill_queues_recompute(self):
+        conn = db.sqlite3.connect(self.path)
+        for migration in migrations.MIGRATIONS[:3]:
+            migration(conn.cursor())
+        conn.execute("PRAGMA user_version = 3")
+        conn.execute(
+            "INSERT INTO lead_times VALUES ('1001', 'Cut', ?, ?, 2.0)",
+            (db.to_epoch(datetime(2024, 1, 8, 8, 0)), db.to_epoch(datetime(2024, 1, 8, 10, 0))),
+        )
+        conn.commit()
+        conn.close()
+
+        conn, lock = db.connect_db(self.path)
+        try:
+            self.assertEqual(db.load_order_hours(conn, lock), {"1001": 2.0})
+            self.assertEqual(
+                recompute.pending_recompute(conn, lock), time_utils.DEFAULT_CALENDAR
+            )
+        finally:
+            conn.close()
+
+    def test_search_index_backfill(self):
+        conn = db.sqlite3.connect(self.path)
+        for migration in migrations.MIGRATIONS[:4]:
+            migration(conn.cursor())
+        conn.execute("PRAGMA user_version = 4")
+        conn.execute("INSERT INTO orders VALUES ('1001', 'Acme Signs')")
+        conn.commit()
+        conn.close()
+
+        conn, lock = db.connect_db(self.path)
+        try:
+            self.assertEqual(db.search_orders(conn, lock, "acme"), {"1001"})
+        finally:
+            conn.close()
+
+    def test_failed_migration_rolls_back(self):
+        conn = db.sqlite3.connect(self.path)
+
+        def broken(cur):
+            cur.execute("CREATE TABLE extra (x)")
+            raise RuntimeError("boom")
+
+        original = list(migrations.MIGRATIONS)
+        migrations.MIGRATIONS.append(broken)
+        try:
+            with self.assertRaises(RuntimeError):
+                migrations.migrate(conn)
+            self.assertEqual(migrations.schema_version(conn), len(original))
+            tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master")}
+            self.assertNotIn("extra", tables)
+        finally:
+            migrations.MIGRATIONS[:] = original
+            conn.close()
+
+
+class QueryPlanTests(unittest.TestCase):
+    """Every statement issued by the hot data.db functions uses an index."""
+
+    def setUp(self):
+        self.conn, self.lock = db.connect_db(":memory:")
+        db.log_order(self.conn, self.lock, "1001", "ACME", STEPS)
+        self.statements = []
+        self.conn.set_trace_callback(self.statements.append)
+
+    def tearDown(self):
+        self.conn.close()
+
+    # Loading a whole lookup table into the name cache is meant to scan it,
+    # as is reading the archives table (one row per month)
+    CACHE_LOADS = (
+        "SELECT id, name FROM workstations",
+        "SELECT id, name FROM companies",
+        "SELECT month, first_start, last_start, first_day, last_day FROM archives",
+    )
+
+    def assert_statements_use_indexes(self):
+        self.conn.set_trace_callback(None)
+        checked = 0
+        for sql in self.statements:
+            verb = sql.lstrip().split(None, 1)[0].upper()
+            if verb not in ("SELECT", "DELETE", "UPDATE") or sql in self.CACHE_LOADS:
+                continue
+            plan = [
+                row[3]
+                for row in self.conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+            ]
+            table_access = [d for d in plan if d.startswith(("SCAN", "SEARCH"))]
+            self.assertTrue(table_access, sql)
+            for detail in table_access:
+                # Walking a whole index costs as much as the table, whatever
+                # the range; full-text lookups go through the virtual table
+                if "VIRTUAL TABLE INDEX" not in detail:
+                    self.assertTrue(detail.startswith("SEARCH"), (sql, plan))
+                self.assertIn("INDEX", detail.replace("PRIMARY KEY", "INDEX"), (sql, plan))
+            checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_log_order(self):
+        db.log_order(self.conn, self.lock, "1001", "ACME", STEPS[1:])
+        self.assert_statements_use_indexes()
+
+    def test_record_print_file_start(self):
+        db.record_print_file_start(self.conn, self.lock, "1001")
+        self.assert_statements_use_indexes()
+
+    def test_load_steps(self):
+        db.load_steps(self.conn, self.lock, "1001")
+        self.assert_statements_use_indexes()
+
+    def test_load_steps_many(self):
+        db.load_steps_many(self.conn, self.lock, ["1001", "1002"])
+        self.assert_statements_use_indexes()
+
+    def test_load_lead_times_many(self):
+        db.load_lead_times_many(
+            self.conn, self.lock, ["1001", "1002"], datetime(2024, 1, 1), datetime(2024, 2, 1)
+        )
+        self.assert_statements_use_indexes()
+
+    def test_load_lead_times(self):
+        db.load_lead_times(
+            self.conn, self.lock, "1001", datetime(2024, 1, 1), datetime(2024, 2, 1)
+        )
+        self.assert_statements_use_indexes()
+
+    def test_load_order_groups_by_date_range(self):
+        db.load_order_groups_by_date_range(
+            self.conn, self.lock, datetime(2024, 1, 1), datetime(2024, 1, 31)
+        )
+        self.assert_statements_use_indexes()
+
+    def test_search_orders(self):
+        db.search_orders(self.conn, self.lock, "1001")
+        self.assert_statements_use_indexes()
+
+    def test_iter_jobs_by_date_range(self):
+        db.log_order(self.conn, self.lock, "1002", "ACME", STEPS)
+        list(
+            db.iter_jobs_by_date_range(
+                self.conn, self.lock, datetime(2024, 1, 1), datetime(2024, 1, 31), page_size=1
+            )
+        )
+        self.assert_statements_use_indexes()
+
+    def test_iter_jobs_by_date_range_sparse_orders(self):
+        later = [(name, ts and ts.replace(month=3)) for name, ts in STEPS]
+        for number in ("1002", "1003", "1004"):
+            db.log_order(self.conn, self.lock, number, "ACME", later)
+        db.log_order(self.conn, self.lock, "1005", "ACME", STEPS)
+        rows = list(
+            db.iter_jobs_by_date_range(
+                self.conn, self.lock, datetime(2024, 1, 1), datetime(2024, 1, 31), page_size=1
+            )
+        )
+        self.assertEqual([r.order for r in rows], ["1001", "1005"])
+        self.assertTrue(any(" IN (" in sql for sql in self.statements))
+        self.assert_statements_use_indexes()
+
+    def test_load_order_hours(self):
+        db.load_order_hours(
+            self.conn, self.lock, datetime(2024, 1, 1), datetime(2024, 1, 31)
+        )
+        self.assert_statements_use_indexes()
+
+    def test_load_jobs_by_date_range(self):
+        db.load_jobs_by_date_range(
+            self.conn, self.lock, datetime(2024, 1, 1), datetime(2024, 1, 31)
+        )
+        self.assert_statements_use_indexes()
+
+
+if __name__ == "__main__":
+    unittest.main()
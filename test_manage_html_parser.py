@@ -1,10 +1,26 @@
+import io
 import pytest
 from datetime import datetime
+from unittest.mock import patch
 
-from parsers.manage_html import parse_orders, parse_queue, Order, Step
+from hypothesis import given, settings, strategies as st
 
+from parsers import manage_html, rows
+from parsers.manage_html import iter_orders, parse_orders, parse_queue, Order, Step
 
-def test_parse_orders_basic():
+needs_lxml = pytest.mark.skipif(manage_html.lxml_html is None, reason="lxml not installed")
+
+BACKENDS = [
+    "html.parser",
+    pytest.param(
+        "lxml",
+        marks=needs_lxml,
+    ),
+]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_parse_orders_basic(backend):
     html = (
         "<table><tbody id='table'>"
         "<tr>"
@@ -18,7 +34,7 @@ def test_parse_orders_basic():
         "</tr>"
         "</tbody></table>"
     )
-    orders = parse_orders(html)
+    orders = parse_orders(html, backend=backend)
     assert len(orders) == 1
     order = orders[0]
     assert order.number == "12345"
@@ -28,6 +44,197 @@ def test_parse_orders_basic():
     assert order.steps == [Step(name="Cut", timestamp=datetime(2024, 1, 1, 10, 0))]
 
 
-def test_parse_queue_extracts_orders():
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_parse_queue_extracts_orders(backend):
     html = "<table><tbody><tr><td>Order 100</td></tr><tr><td>Job-200</td></tr></tbody></table>"
-    assert parse_queue(html) == {"100", "Job-200"}
+    assert parse_queue(html, backend=backend) == {"100", "Job-200"}
+
+
+EDGE_CASES = """<!DOCTYPE html>
+<html><head><meta charset="iso-8859-1"><title>Manage</title></head><body>
+<table><tbody><tr><td>Header 1</td></tr></tbody></table>
+<table><tbody id="table">
+<tr>
+  <td><!-- 999 --><b>Caf\u00e9&nbsp;Signs</b><br>#A-77<script>var x = 123;</script>
+    <ul class="steps workplaces">
+      <li><p>10Print</p><p class="np">01/02/24 08:15&nbsp;</p></li>
+      <li><p>20Laminate</p><p class="small np">not a date</p></li>
+      <li><p>30Cut</p><p class="np">&nbsp;</p></li>
+      <li><p class="np">01/03/24 09:00</p></li>
+      <li><span>Pack</span></li>
+    </ul></td>
+  <td>Fallback Co</td>
+  <td> <span>On</span> Hold </td>
+  <td></td>
+  <td><input name="p"></td>
+</tr>
+<tr>
+  <td>?<br>Order 555</td>
+  <td><i>Second</i> Name</td>
+  <td>Done</td>
+  <td></td>
+  <td> Low <style>.x{}</style></td>
+</tr>
+<tr><td>no number here</td></tr>
+<tr><td>ab<script>var n = 3;</script>12</td><td>x<template>34<b>y</b></template>z</td></tr>
+<tr><td>12</td></tr>
+<tr></tr>
+</tbody></table></body></html>"""
+
+
+@needs_lxml
+@pytest.mark.parametrize(
+    "html", [EDGE_CASES, "", "<p>no table</p>", "<table><tbody id='table'></tbody></table>"]
+)
+def test_backends_agree(html):
+    expected = parse_orders(html, backend="html.parser")
+    assert parse_orders(html, backend="lxml") == expected
+    assert parse_queue(html, backend="lxml") == parse_queue(html, backend="html.parser")
+
+
+UNCLOSED_P = (
+    "<table><tbody id='table'><tr><td>ACME<br>Order 1<ul class='workplaces'>"
+    "<li><p>1Cut<p class='np'>01/01/24 10:00</li><li><p>2Pack<p class='np'>&nbsp;</ul></td>"
+    "<td>Co</td><td>Running</td><td></td><td><input value='High'></td></tr></tbody></table>"
+)
+UNCLOSED_TD = (
+    "<table><tbody id='table'><tr><td>ACME<br>Order 2<ul class='workplaces'>"
+    "<li><p>1Cut</p><p class='np'>01/01/24 10:00</p></li></ul><td>Co<td>Running<td>"
+    "<td><input value='Low'></tr><tr><td>Beta<br>Order 3<td>Other<td>Done</tbody></table>"
+)
+STRAY_CLOSE = (
+    "<tbody id='table'><tr><td>Eps 6</p></td></td><td>Z</span></td><td>Open</td></tr></tbody>"
+)
+
+
+def test_default_backend_is_html_parser():
+    assert manage_html.DEFAULT_BACKEND == "html.parser"
+    assert parse_orders(UNCLOSED_P) == parse_orders(UNCLOSED_P, backend="html.parser")
+
+
+@needs_lxml
+@pytest.mark.parametrize("html", [UNCLOSED_TD, STRAY_CLOSE])
+def test_backends_agree_on_malformed_rows(html):
+    expected = parse_orders(html, backend="html.parser")
+    assert expected
+    assert parse_orders(html, backend="lxml") == expected
+    assert parse_queue(html, backend="lxml") == parse_queue(html, backend="html.parser")
+
+
+@needs_lxml
+def test_backends_differ_on_unclosed_p():
+    soup = parse_orders(UNCLOSED_P, backend="html.parser")
+    tree = parse_orders(UNCLOSED_P, backend="lxml")
+    # html.parser nests the time paragraph in the open name paragraph;
+    # lxml closes the name paragraph first, like a browser
+    assert soup[0].steps == [
+        Step("Cut01/01/24 10:00", datetime(2024, 1, 1, 10, 0)),
+        Step("Pack", None),
+    ]
+    assert tree[0].steps == [
+        Step("Cut", datetime(2024, 1, 1, 10, 0)),
+        Step("Pack", None),
+    ]
+    for order in (soup[0], tree[0]):
+        order.steps = []
+    assert soup == tree == [Order("1", "ACME", "Running", "High", [])]
+
+
+def test_edge_cases():
+    orders = parse_orders(EDGE_CASES, backend="html.parser")
+    assert [(o.number, o.company, o.status, o.priority) for o in orders[:2]] == [
+        ("A-77", "Caf\u00e9\xa0Signs", "OnHold", None),
+        ("555", "Second", "Done", "Low"),
+    ]
+    # Text on either side of a script is two strings
+    assert (orders[3].number, orders[3].company) == ("12", "ab")
+    assert orders[0].steps == [
+        Step("Print", datetime(2024, 1, 2, 8, 15)),
+        Step("Laminate", None),
+        Step("Cut", None),
+        Step("/03/24 09:00", datetime(2024, 1, 3, 9, 0)),
+        Step("", None),
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_iter_orders_streams_in_chunks(chunk_size):
+    expected = parse_orders(EDGE_CASES, backend="html.parser")
+    stream = io.BytesIO(EDGE_CASES.encode("utf-8"))
+    assert list(iter_orders(stream, chunk_size=chunk_size)) == expected
+    text = io.StringIO(EDGE_CASES)
+    assert list(iter_orders(text, chunk_size=chunk_size)) == expected
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        "",
+        "<table><tbody id='table'><tr><td>1<tr><td>2</tbody></table>",
+        "<tbody id='table'><tr><td>A<!-- x -->B 7</td></tr></p></tbody><tr><td>8</td></tr>",
+        "<tbody id='table'><tr><td>9<table><tr><td>Nested 10</td></tr></table></td></tr>",
+        "<tbody id='table'><tr><td>Cut off 11</td><td>ACME",
+    ],
+)
+def test_iter_orders_matches_html_parser(html):
+    expected = parse_orders(html, backend="html.parser")
+    assert list(iter_orders(io.StringIO(html))) == expected
+
+
+def test_iter_table_rows_stops_after_table():
+    rows = "".join(f"<tr><td>Order {n}</td></tr>" for n in range(50))
+    page = f"<table><tbody id='table'>{rows}</tbody></table><p>{'x' * 10000}</p>"
+    stream = io.BytesIO(page.encode("utf-8"))
+    numbers = [
+        "".join(tr.itertext()) for tr in manage_html.iter_table_rows(stream, chunk_size=64)
+    ]
+    assert numbers == [f"Order {n}" for n in range(50)]
+    assert stream.tell() < len(page)
+
+
+def test_iter_orders_without_lxml():
+    expected = parse_orders(EDGE_CASES, backend="html.parser")
+    with patch.object(manage_html, "etree", None):
+        assert list(iter_orders(io.BytesIO(EDGE_CASES.encode("utf-8")))) == expected
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        parse_orders("", backend="html5lib")
+
+
+def _strptime(text):
+    text = text.replace("\xa0", "").strip()
+    try:
+        return datetime.strptime(text, manage_html.HTML_DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+@settings(max_examples=2000, deadline=None)
+@given(st.text(alphabet="0123456789/: \xa0\t", max_size=16))
+def test_parse_timestamp_matches_strptime(text):
+    assert rows.parse_timestamp(text) == _strptime(text)
+
+
+@settings(max_examples=2000, deadline=None)
+@given(
+    st.integers(0, 19),
+    st.integers(0, 39),
+    st.integers(0, 99),
+    st.integers(0, 29),
+    st.integers(0, 69),
+    st.sampled_from(["", "0", " "]),
+    st.sampled_from([" ", "  ", "\t", "\xa0 "]),
+)
+def test_parse_timestamp_matches_strptime_on_dates(month, day, year, hour, minute, pad, sep):
+    text = f"{pad}{month}/{pad}{day}/{year:02d}{sep}{hour}:{minute:02d}"
+    assert rows.parse_timestamp(text) == _strptime(text)
+
+
+def test_parse_timestamp_is_memoized():
+    rows.parse_timestamp.cache_clear()
+    first = rows.parse_timestamp("07/22/25 10:00")
+    assert rows.parse_timestamp("07/22/25 10:00") is first
+    assert rows.parse_timestamp.cache_info().hits == 1
+
@@ -1,18 +1,26 @@
 import os
 import tempfile
 import unittest
-from datetime import datetime
+from datetime import date, datetime
 import sys
 import argparse
 import csv
+import json
+from unittest.mock import patch
 
 from bs4 import BeautifulSoup
 
 import manage_html_report
+from data import db
+from time_utils import BusinessCalendar
 from manage_html_report import (
     compute_lead_times,
+    merge_steps,
     parse_manage_html,
+    parse_snapshots,
     generate_realtime_report,
+    load_jobs,
+    snapshot_paths,
     write_realtime_report,
 )
 
@@ -124,6 +132,17 @@ class ManageHTMLTests(unittest.TestCase):
         self.assertEqual(jobs, {})
         os.remove(tmp_path)
 
+    def test_parse_manage_html_skips_rows_without_job(self):
+        extra = '<tr><td class="move"><p>No digits</p></td></tr><tr><td>1004</td></tr>'
+        html = SAMPLE_HTML_MULTI.replace("</tbody>", extra + "</tbody>")
+        with tempfile.NamedTemporaryFile("w+", delete=False, suffix=".html") as tmp:
+            tmp.write(html)
+            tmp_path = tmp.name
+        self.addCleanup(os.remove, tmp_path)
+        jobs = parse_manage_html(tmp_path)
+        self.assertEqual(list(jobs), ["1001", "1002"])
+        self.assertEqual(jobs["1002"][0], ("Prep", datetime(2025, 7, 21, 9, 0)))
+
     def test_compute_lead_times(self):
         jobs = parse_manage_html(self.tmp_path)
         results = compute_lead_times(jobs)
@@ -187,6 +206,13 @@ class ManageHTMLTests(unittest.TestCase):
             os.remove(csv_path)
             os.remove(out_html_path)
 
+    def test_compute_lead_times_calendar(self):
+        jobs = parse_manage_html(self.tmp_path)
+        calendar = BusinessCalendar(holidays=frozenset([date(2025, 7, 23)]))
+        results = compute_lead_times(jobs, calendar=calendar)
+        # only Tuesday 10:00-16:30 counts when Wednesday is a holiday
+        self.assertAlmostEqual(results["1001"][0]["hours"], 6.5)
+
     def test_compute_lead_times_date_range(self):
         jobs = parse_manage_html(self.tmp_path)
         start = datetime(2025, 7, 23)
@@ -210,6 +236,199 @@ class ManageHTMLTests(unittest.TestCase):
         finally:
             sys.argv = old_argv
 
+    def test_main_missing_file_is_an_error(self):
+        missing = os.path.join(os.path.dirname(self.tmp_path), "missing.html")
+        csv_path = missing + ".csv"
+        old_argv = sys.argv
+        try:
+            sys.argv = ["manage_html_report.py", missing, "--output", csv_path]
+            with self.assertRaises(FileNotFoundError):
+                manage_html_report.main()
+        finally:
+            sys.argv = old_argv
+        self.assertFalse(os.path.exists(csv_path))
+
+
+SNAPSHOT_TEMPLATE = """
+<tbody id="table">
+<tr data-id="1">
+<td class="move"><p>YBS {job}</p></td>
+<td>{company}</td>
+<td></td>
+<td>
+<ul class="workplaces">
+<li><p><span class="circle"></span>Prep</p><p class="np">{prep}</p></li>
+<li><p><span class="circle"></span>Print</p><p class="np">{print}</p></li>
+</ul>
+</td>
+</tr>
+</tbody>
+"""
+
+
+class BatchTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        snapshots = [
+            ("a.html", "1001", "ACME", "07/22/25 10:00", "&nbsp;"),
+            ("b.html", "1001", "ACME", "07/22/25 09:00", "07/22/25 12:00"),
+            ("c.htm", "1002", "Other", "07/21/25 09:00", "07/22/25 11:00"),
+            ("d.html", "1001", "ACME", "07/22/25 10:00", "07/22/25 13:00"),
+        ]
+        for name, job, company, prep, printed in snapshots:
+            with open(os.path.join(self.dir, name), "w") as f:
+                f.write(
+                    SNAPSHOT_TEMPLATE.format(job=job, company=company, prep=prep, print=printed)
+                )
+        with open(os.path.join(self.dir, "notes.txt"), "w") as f:
+            f.write("not a snapshot")
+
+    def test_snapshot_paths(self):
+        names = ["a.html", "b.html", "c.htm", "d.html"]
+        expected = [os.path.join(self.dir, n) for n in names]
+        self.assertEqual(snapshot_paths(self.dir), expected)
+        self.assertEqual(
+            snapshot_paths(os.path.join(self.dir, "*.html")),
+            [p for p in expected if p.endswith(".html")],
+        )
+        self.assertEqual(snapshot_paths("manage.html"), ["manage.html"])
+
+    def test_merge_steps_keeps_earliest(self):
+        t = [datetime(2025, 7, 22, h) for h in range(8, 13)]
+        steps = [("Prep", t[2]), ("Print", None), ("Prep", t[4])]
+        more = [("Prep", t[3]), ("Print", t[1]), ("Prep", t[0]), ("Ship", None)]
+        self.assertEqual(
+            merge_steps(steps, more),
+            [("Prep", t[2]), ("Print", t[1]), ("Prep", t[0]), ("Ship", None)],
+        )
+        self.assertEqual(merge_steps(more, []), more)
+
+    def test_parse_snapshots(self):
+        paths = snapshot_paths(self.dir) + [os.path.join(self.dir, "missing.html")]
+        with self.assertLogs(level="WARNING"):
+            jobs, companies, failed = parse_snapshots(paths)
+        self.assertEqual(failed, paths[-1:])
+        self.assertEqual(companies, {})
+        self.assertEqual(
+            jobs,
+            {
+                "1001": [
+                    ("Prep", datetime(2025, 7, 22, 9, 0)),
+                    ("Print", datetime(2025, 7, 22, 12, 0)),
+                ],
+                "1002": [
+                    ("Prep", datetime(2025, 7, 21, 9, 0)),
+                    ("Print", datetime(2025, 7, 22, 11, 0)),
+                ],
+            },
+        )
+        old_batch = manage_html_report.BATCH_FILES
+        manage_html_report.BATCH_FILES = 1
+        try:
+            parallel = parse_snapshots(paths[:-1], workers=2, with_companies=True)
+        finally:
+            manage_html_report.BATCH_FILES = old_batch
+        self.assertEqual(parallel[0], jobs)
+        self.assertEqual(parallel[1], {"1001": "ACME", "1002": "Other"})
+
+    def test_main_loads_database(self):
+        db_path = os.path.join(self.dir, "orders.db")
+        old_argv = sys.argv
+        try:
+            sys.argv = ["manage_html_report.py", self.dir, "--db", db_path, "--workers", "1"]
+            self.assertEqual(manage_html_report.main(), 0)
+        finally:
+            sys.argv = old_argv
+        conn, lock = db.connect_db(db_path)
+        self.addCleanup(conn.close)
+        self.assertEqual(
+            db.load_steps(conn, lock, "1001"),
+            [
+                ("Prep", datetime(2025, 7, 22, 9, 0)),
+                ("Print", datetime(2025, 7, 22, 12, 0)),
+            ],
+        )
+        company = conn.execute(
+            "SELECT c.name FROM orders o JOIN companies c ON c.id = o.company_id "
+            "WHERE o.order_number = '1002'"
+        ).fetchone()
+        self.assertEqual(company, ("Other",))
+
+    def test_main_uses_configured_hours(self):
+        db_path = os.path.join(self.dir, "orders.db")
+        config_path = os.path.join(self.dir, "config.json")
+        with open(config_path, "w") as f:
+            json.dump({"business_start": "10:00", "business_end": "17:00"}, f)
+        old_argv = sys.argv
+        try:
+            sys.argv = [
+                "manage_html_report.py", self.dir, "--db", db_path,
+                "--config", config_path, "--workers", "1",
+            ]
+            self.assertEqual(manage_html_report.main(), 0)
+        finally:
+            sys.argv = old_argv
+        conn, lock = db.connect_db(db_path)
+        self.addCleanup(conn.close)
+        # Prep ended at 09:00, before the day starts, so Print counts 10:00-12:00
+        self.assertEqual(
+            [lt["hours"] for lt in db.load_lead_times(conn, lock, "1001")], [2.0]
+        )
+
+    def test_main_fails_when_a_snapshot_cannot_be_read(self):
+        csv_path = os.path.join(self.dir, "report.csv")
+        read = manage_html_report._read_snapshot
+
+        def failing(path, with_companies):
+            if path.endswith("c.htm"):
+                raise OSError("unreadable")
+            return read(path, with_companies)
+
+        old_argv = sys.argv
+        try:
+            sys.argv = ["manage_html_report.py", self.dir, "--output", csv_path, "--workers", "1"]
+            with patch.object(manage_html_report, "_read_snapshot", failing):
+                with self.assertLogs(level="WARNING"):
+                    self.assertEqual(manage_html_report.main(), 1)
+        finally:
+            sys.argv = old_argv
+        with open(csv_path, newline="") as f:
+            self.assertEqual([r["job_number"] for r in csv.DictReader(f)], ["1001"])
+
+    def test_load_jobs_keeps_company_when_none_parsed(self):
+        conn, lock = db.connect_db(":memory:")
+        self.addCleanup(conn.close)
+        jobs, companies, _ = parse_snapshots(snapshot_paths(self.dir), with_companies=True)
+        load_jobs(conn, lock, jobs, companies)
+        jobs["1002"].append(("Ship", datetime(2025, 7, 23, 10, 0)))
+        load_jobs(conn, lock, jobs, {"1001": "ACME"})
+        company = conn.execute(
+            "SELECT c.name FROM orders o JOIN companies c ON c.id = o.company_id "
+            "WHERE o.order_number = '1002'"
+        ).fetchone()
+        self.assertEqual(company, ("Other",))
+        self.assertEqual(len(db.load_steps(conn, lock, "1002")), 3)
+
+    def test_main_writes_one_report(self):
+        csv_path = os.path.join(self.dir, "report.csv")
+        old_argv = sys.argv
+        try:
+            sys.argv = ["manage_html_report.py", self.dir, "--output", csv_path]
+            self.assertEqual(manage_html_report.main(), 0)
+        finally:
+            sys.argv = old_argv
+        with open(csv_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(
+            [(r["job_number"], r["start"], r["end"]) for r in rows],
+            [
+                ("1001", "2025-07-22 09:00:00", "2025-07-22 12:00:00"),
+                ("1002", "2025-07-21 09:00:00", "2025-07-22 11:00:00"),
+            ],
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,168 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+
+from data import db, metrics
+from parsers.manage_html import Order, Step
+
+
+def _order(number):
+    steps = [
+        Step("Print", datetime(2024, 1, 8, 8, 0)),
+        Step("Cut", datetime(2024, 1, 8, 9, 0)),
+        Step("Pack", None),
+    ]
+    return Order(number, "ACME", "Running", "", steps)
+
+
+class MetricsTests(unittest.TestCase):
+    def setUp(self):
+        registry = metrics.registry
+        self.saved = (
+            registry.enabled, registry.slow_threshold, registry.sample_interval, registry.sample_below
+        )
+        # Every call is timed unless a test samples them
+        registry.enabled = True
+        registry.sample_interval = 0
+        self.conn, self.lock = db.connect_db(":memory:")
+        db.log_orders(self.conn, self.lock, [_order(str(n)) for n in range(1001, 1006)])
+        # Load the name caches so their queries are not counted below
+        db.load_jobs_by_date_range(self.conn, self.lock, None, None)
+        metrics.registry.reset()
+
+    def tearDown(self):
+        registry = metrics.registry
+        (
+            registry.enabled, registry.slow_threshold, registry.sample_interval, registry.sample_below
+        ) = self.saved
+        metrics.registry.reset()
+        self.conn.close()
+
+    def test_records_rows_and_time_per_function(self):
+        db.load_steps(self.conn, self.lock, "1001")
+        db.load_steps(self.conn, self.lock, "1002")
+        db.load_lead_times(self.conn, self.lock, "1001")
+        stats = metrics.registry.snapshot()
+        self.assertEqual(stats["load_steps"]["calls"], 2)
+        self.assertEqual(stats["load_steps"]["rows"], 6)
+        self.assertEqual(stats["load_lead_times"]["rows"], 1)
+        s = stats["load_steps"]
+        self.assertGreater(s["sql"], 0)
+        self.assertAlmostEqual(s["total"], s["lock_wait"] + s["sql"] + s["decode"])
+        self.assertGreaterEqual(s["total"], s["max"])
+
+    def test_disabled_registry_records_nothing(self):
+        metrics.registry.enabled = False
+        db.load_steps(self.conn, self.lock, "1001")
+        self.assertEqual(metrics.registry.snapshot(), {})
+
+    def test_connections_are_only_timed_during_timed_calls(self):
+        self.assertTrue(metrics.MetricsRegistry().enabled)
+        # Opened while disabled, timed once enabled
+        metrics.registry.enabled = False
+        conn, lock = db.connect_db(":memory:")
+        self.addCleanup(conn.close)
+        metrics.registry.enabled = True
+        db.log_orders(conn, lock, [_order("1001")])
+        self.assertIs(type(conn), db.Connection)
+        self.assertEqual(len(db.load_steps(conn, lock, "1001")), 3)
+        self.assertIs(type(conn), db.Connection)
+        self.assertGreater(metrics.registry.snapshot()["load_steps"]["sql"], 0)
+
+    def test_calls_are_sampled(self):
+        metrics.registry.sample_interval = 60
+        metrics.registry.sample_below = 60
+        for _ in range(8):
+            db.load_steps(self.conn, self.lock, "1001")
+        stats = metrics.registry.snapshot()["load_steps"]
+        self.assertEqual((stats["calls"], stats["sampled"]), (8, 1))
+        # Extrapolated from the first call
+        self.assertEqual((stats["statements"], stats["rows"]), (8, 24))
+
+    def test_slow_functions_are_timed_on_every_call(self):
+        metrics.registry.sample_interval = 60
+        metrics.registry.sample_below = 0
+        for _ in range(3):
+            db.load_steps(self.conn, self.lock, "1001")
+        self.assertEqual(metrics.registry.snapshot()["load_steps"]["sampled"], 3)
+
+    def test_executemany_accepts_iterators(self):
+        with metrics.CallTimer("bulk"), metrics.timed(self.conn):
+            cur = self.conn.cursor()
+            cur.execute("CREATE TEMP TABLE t (n INTEGER)")
+            cur.executemany("INSERT INTO t VALUES (?)", ((n,) for n in range(3)))
+            cur.executemany("INSERT INTO t VALUES (?)", iter([]))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 3)
+        self.assertEqual(metrics.registry.snapshot()["bulk"]["statements"], 3)
+
+    def test_nested_timers_count_as_one_call(self):
+        with metrics.CallTimer("report"):
+            db.load_steps(self.conn, self.lock, "1001")
+            db.load_steps(self.conn, self.lock, "1002")
+        stats = metrics.registry.snapshot()
+        self.assertEqual(list(stats), ["report"])
+        self.assertEqual(stats["report"]["rows"], 6)
+
+    def test_lock_wait_is_recorded(self):
+        self.lock.acquire()
+        timer = threading.Timer(0.05, self.lock.release)
+        timer.start()
+        db.load_steps(self.conn, self.lock, "1001")
+        timer.join()
+        self.assertGreaterEqual(metrics.registry.snapshot()["load_steps"]["lock_wait"], 0.04)
+
+    def test_writes_and_commits_are_timed(self):
+        order = _order("1001")
+        order.steps[2] = Step("Pack", datetime(2024, 1, 8, 10, 0))
+        self.assertTrue(db.log_orders(self.conn, self.lock, [order]))
+        stats = metrics.registry.snapshot()["log_orders"]
+        self.assertEqual(stats["calls"], 1)
+        self.assertGreater(stats["sql"], 0)
+
+    def test_iterator_is_timed_per_page(self):
+        rows = list(
+            db.iter_jobs_by_date_range(
+                self.conn, self.lock, datetime(2024, 1, 1), datetime(2024, 1, 31), page_size=2
+            )
+        )
+        stats = metrics.registry.snapshot()["iter_jobs_by_date_range"]
+        # The order ids are looked up first, one row per order
+        self.assertEqual(stats["rows"], len(rows) + len({r.order for r in rows}))
+        self.assertEqual(stats["calls"], len(rows) // 2 + 1)
+
+    def test_slow_statement_is_logged_with_plan(self):
+        metrics.registry.slow_threshold = 0
+        with self.assertLogs("data.slow_queries", "WARNING") as logs:
+            db.load_steps(self.conn, self.lock, "1001")
+        message = "\n".join(logs.output)
+        self.assertIn("Slow query in load_steps", message)
+        self.assertIn("FROM steps", message)
+        self.assertIn("SEARCH", message)
+
+    def test_fast_statements_are_not_logged(self):
+        metrics.registry.slow_threshold = 60
+        with self.assertNoLogs("data.slow_queries"):
+            db.load_steps(self.conn, self.lock, "1001")
+
+    def test_pooled_readers_are_timed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            conn, lock = db.connect_db(os.path.join(tmp, "orders.db"))
+            self.assertIsNotNone(conn.readers)
+            db.log_orders(conn, lock, [_order("1001")])
+            db.load_steps(conn, lock, "1001")
+            metrics.registry.reset()
+            self.assertEqual(len(db.load_steps(conn, lock, "1001")), 3)
+            conn.close()
+        self.assertEqual(metrics.registry.snapshot()["load_steps"]["rows"], 3)
+
+    def test_summary_lists_functions(self):
+        db.load_steps(self.conn, self.lock, "1001")
+        summary = metrics.registry.summary()
+        self.assertIn("load_steps", summary)
+        self.assertIn("decode_ms", summary.splitlines()[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, time
+from unittest.mock import patch
+
+from data import db
+from data.recompute import (
+    RecomputeWorker,
+    main,
+    pending_recompute,
+    recompute_lead_times,
+)
+from time_utils import BusinessCalendar
+
+
+NINE_TO_FIVE = BusinessCalendar(shifts=((time(9, 0), time(17, 0)),))
+
+
+class RecomputeTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db, self.lock = db.connect_db(self.path)
+        for n in range(10):
+            db.log_order(
+                self.db,
+                self.lock,
+                f"{1000 + n}",
+                "ACME",
+                [
+                    ("Print", datetime(2024, 1, 8, 8, 0)),  # Monday
+                    ("Cut", datetime(2024, 1, 8, 10, 0)),
+                    ("Ship", None),
+                ],
+            )
+
+    def tearDown(self):
+        self.db.close()
+        os.remove(self.path)
+
+    def _hours(self):
+        cur = self.db.cursor()
+        cur.execute(
+            "SELECT o.order_number, hours FROM lead_times "
+            "JOIN orders o ON o.id = order_id ORDER BY o.order_number"
+        )
+        return cur.fetchall()
+
+    def test_recompute_applies_new_calendar(self):
+        self.assertEqual({h for _, h in self._hours()}, {2.0})
+        progress = []
+        finished = recompute_lead_times(
+            self.db, self.lock, NINE_TO_FIVE, chunk_size=3,
+            progress=lambda done, total: progress.append((done, total)),
+        )
+        self.assertTrue(finished)
+        self.assertEqual({h for _, h in self._hours()}, {1.0})
+        self.assertEqual(len(self._hours()), 10)
+        self.assertEqual(set(db.load_order_hours(self.db, self.lock).values()), {1.0})
+        self.assertEqual(progress, [(3, 10), (6, 10), (9, 10), (10, 10)])
+        self.assertIsNone(pending_recompute(self.db, self.lock))
+
+    def test_recompute_resumes_after_interruption(self):
+        stop = threading.Event()
+        finished = recompute_lead_times(
+            self.db, self.lock, NINE_TO_FIVE, chunk_size=4,
+            progress=lambda done, total: stop.set(), stop_event=stop,
+        )
+        self.assertFalse(finished)
+        self.assertEqual([h for _, h in self._hours()], [1.0] * 4 + [2.0] * 6)
+        self.assertEqual(pending_recompute(self.db, self.lock), NINE_TO_FIVE)
+
+        progress = []
+        recompute_lead_times(
+            self.db, self.lock, NINE_TO_FIVE, chunk_size=4,
+            progress=lambda done, total: progress.append(done),
+        )
+        self.assertEqual(progress, [8, 10])
+        self.assertEqual({h for _, h in self._hours()}, {1.0})
+
+    def test_recompute_restarts_for_other_calendar(self):
+        stop = threading.Event()
+        recompute_lead_times(
+            self.db, self.lock, NINE_TO_FIVE, chunk_size=4,
+            progress=lambda done, total: stop.set(), stop_event=stop,
+        )
+        progress = []
+        recompute_lead_times(
+            self.db, self.lock, chunk_size=4,
+            progress=lambda done, total: progress.append(done),
+        )
+        self.assertEqual(progress, [4, 8, 10])
+        self.assertEqual({h for _, h in self._hours()}, {2.0})
+
+    def test_failed_chunk_is_rolled_back(self):
+        refresh = db.refresh_daily_hours
+        calls = []
+
+        def failing(cur, order_ids, calendar=None):
+            calls.append(order_ids)
+            if len(calls) == 2:
+                raise RuntimeError("disk full")
+            return refresh(cur, order_ids, calendar)
+
+        with patch.object(db, "refresh_daily_hours", failing):
+            with self.assertRaises(RuntimeError):
+                recompute_lead_times(self.db, self.lock, NINE_TO_FIVE, chunk_size=4)
+        self.assertFalse(self.db.in_transaction)
+        # The second chunk's deleted lead times are back with the old hours
+        self.assertEqual([h for _, h in self._hours()], [1.0] * 4 + [2.0] * 6)
+        self.assertEqual(len(db.load_order_hours(self.db, self.lock)), 10)
+
+        recompute_lead_times(self.db, self.lock, NINE_TO_FIVE, chunk_size=4)
+        self.assertEqual({h for _, h in self._hours()}, {1.0})
+
+    def test_worker_runs_in_background(self):
+        worker = RecomputeWorker(self.db, self.lock, NINE_TO_FIVE, chunk_size=2).start()
+        worker._thread.join(10)
+        self.assertTrue(worker.finished)
+        self.assertIsNone(worker.error)
+        self.assertEqual(worker.progress, (10, 10))
+        self.assertEqual({h for _, h in self._hours()}, {1.0})
+
+    def test_cli(self):
+        self.db.close()
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"business_start": "09:00", "business_end": "17:00"}, f)
+            config_path = f.name
+        try:
+            self.assertEqual(main([self.path, "--config", config_path]), 0)
+        finally:
+            os.remove(config_path)
+        self.db, self.lock = db.connect_db(self.path)
+        self.assertEqual({h for _, h in self._hours()}, {1.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
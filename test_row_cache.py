@@ -0,0 +1,130 @@
+import unittest
+from datetime import datetime
+
+from data import db
+from parsers import manage_html
+from parsers.manage_html import parse_orders
+from parsers.row_cache import RowCache, split_rows
+
+BACKENDS = ["html.parser"] + (["lxml"] if manage_html.lxml_html is not None else [])
+
+
+def _row(number, company="ACME", cut=None):
+    cut_text = cut.strftime(manage_html.HTML_DATE_FORMAT) if cut else "&nbsp;"
+    return (
+        f'<tr data-id="{number}">'
+        f"<td>{company}<br>Order #{number}"
+        '<ul class="workplaces">'
+        '<li><p>1Print</p><p class="np">01/08/24 08:00</p></li>'
+        f'<li><p>2Cut</p><p class="np">{cut_text}</p></li>'
+        "</ul></td><td></td><td>Running</td><td></td>"
+        '<td><input value="1"></td>'
+        "</tr>\n"
+    )
+
+
+def _page(*rows):
+    return (
+        "<html><head><script>var rows = '<tr>';</script></head><body>"
+        f'<table><tbody id="table">\n{"".join(rows)}</tbody></table>'
+        "<table><tbody><tr><td>footer</td></tr></tbody></table></body></html>"
+    )
+
+
+CUT = datetime(2024, 1, 8, 10, 0)
+
+
+class RowCacheTests(unittest.TestCase):
+    def test_split_rows(self):
+        rows = split_rows(_page(_row("1001"), _row("1002")))
+        self.assertEqual(rows, [_row("1001"), _row("1002")])
+        self.assertEqual(split_rows(_page()), [])
+        self.assertIsNone(split_rows("<p>no table</p>"))
+        unsafe = [
+            _row("1001") + "<!-- <tr> -->",
+            _row("1001") + "<script>x</script>",
+            "stray text" + _row("1001"),
+            _row("1001").replace("</tr>", ""),
+            _row("1001").replace("<td></td>", "<td><table></table></td>", 1),
+        ]
+        for body in unsafe:
+            self.assertIsNone(split_rows(_page(body)), body)
+
+    def test_unchanged_rows_are_reused(self):
+        for backend in BACKENDS:
+            cache = RowCache(backend)
+            page = _page(_row("1001"), _row("1002"), _row("1003"))
+            first = cache.parse(page)
+            self.assertEqual(first, parse_orders(page, backend=backend))
+            self.assertEqual((cache.parsed, cache.unchanged), (3, set()))
+
+            second = cache.parse(page)
+            self.assertEqual(cache.parsed, 0)
+            self.assertEqual(cache.unchanged, {"1001", "1002", "1003"})
+            self.assertTrue(all(a is b for a, b in zip(first, second)))
+
+            page = _page(_row("1004"), _row("1001"), _row("1002", cut=CUT))
+            third = cache.parse(page)
+            self.assertEqual(third, parse_orders(page, backend=backend))
+            self.assertEqual(cache.parsed, 2)
+            self.assertEqual(cache.unchanged, {"1001"})
+            self.assertIs(third[1], first[0])
+            self.assertEqual(third[2].steps[1].timestamp, CUT)
+
+    def test_orders_leaving_the_page_are_dropped(self):
+        cache = RowCache()
+        cache.parse(_page(_row("1001"), _row("1002")))
+        cache.parse(_page(_row("1002")))
+        cache.parse(_page(_row("1001"), _row("1002")))
+        self.assertEqual((cache.parsed, cache.unchanged), (1, {"1002"}))
+
+    def test_page_that_cannot_be_split_is_parsed_whole(self):
+        cache = RowCache()
+        page = _page(_row("1001"))
+        cache.parse(page)
+        odd = page.replace("Order #1001", "Order #1001<!-- note -->")
+        self.assertEqual(cache.parse(odd), parse_orders(odd))
+        self.assertEqual((cache.parsed, cache.unchanged), (1, set()))
+        cache.parse(page)
+        self.assertEqual(cache.unchanged, set())
+
+    def test_same_number_on_two_rows(self):
+        cache = RowCache()
+        page = _page(_row("1001"), _row("1001", company="Other"))
+        cache.parse(page)
+        orders = cache.parse(page)
+        self.assertEqual([o.company for o in orders], ["ACME", "Other"])
+        self.assertEqual(cache.unchanged, {"1001"})
+        changed = _page(_row("1001"), _row("1001", company="Third"))
+        self.assertEqual([o.company for o in cache.parse(changed)], ["ACME", "Third"])
+        self.assertEqual(cache.unchanged, set())
+
+    def test_forget(self):
+        cache = RowCache()
+        page = _page(_row("1001"), _row("1002"))
+        cache.parse(page)
+        cache.forget(["1001"])
+        cache.parse(page)
+        self.assertEqual((cache.parsed, cache.unchanged), (1, {"1002"}))
+        cache.forget()
+        cache.parse(page)
+        self.assertEqual((cache.parsed, cache.unchanged), (2, set()))
+
+    def test_unchanged_orders_are_not_logged(self):
+        conn, lock = db.connect_db(":memory:")
+        self.addCleanup(conn.close)
+        cache = RowCache()
+        page = _page(_row("1001"), _row("1002"))
+        self.assertTrue(db.log_orders(conn, lock, cache.parse(page), unchanged=cache.unchanged))
+        self.assertFalse(db.log_orders(conn, lock, cache.parse(page), unchanged=cache.unchanged))
+
+        page = _page(_row("1001", cut=CUT), _row("1002", cut=CUT))
+        orders = cache.parse(page)
+        # Claimed unchanged, so the new step of 1002 is not looked at
+        self.assertTrue(db.log_orders(conn, lock, orders, unchanged={"1002"}))
+        self.assertEqual(db.load_steps(conn, lock, "1001")[1][1], CUT)
+        self.assertIsNone(db.load_steps(conn, lock, "1002")[1][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
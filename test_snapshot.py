@@ -0,0 +1,135 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from data import db
+from data.snapshot import ReportingSnapshot
+from parsers.manage_html import Order, Step
+
+JAN = (datetime(2024, 1, 1), datetime(2024, 1, 31))
+
+
+def _order(number):
+    steps = [Step("Print", datetime(2024, 1, 8, 8, 0)), Step("Cut", datetime(2024, 1, 8, 10, 0))]
+    return Order(number, "ACME", "Running", "", steps)
+
+
+def _orders(conn, lock):
+    return [r["order"] for r in db.load_jobs_by_date_range(conn, lock, *JAN)]
+
+
+class ReportingSnapshotTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.conn, self.lock = db.connect_db(os.path.join(tmp.name, "orders.db"))
+        self.addCleanup(self.conn.close)
+        db.log_orders(self.conn, self.lock, [_order("1001")])
+
+    def _snapshot(self, **kwargs):
+        snapshot = ReportingSnapshot(self.conn, self.lock, **kwargs)
+        self.addCleanup(snapshot.close)
+        return snapshot
+
+    def test_copy_is_isolated_until_refreshed(self):
+        snapshot = self._snapshot()
+        with snapshot.reading() as (conn, lock):
+            self.assertEqual(_orders(conn, lock), ["1001"])
+        db.log_orders(self.conn, self.lock, [_order("1002")])
+        with snapshot.reading() as (conn, lock):
+            self.assertEqual(_orders(conn, lock), ["1001"])
+        snapshot.refresh()
+        with snapshot.reading() as (conn, lock):
+            self.assertEqual(sorted(_orders(conn, lock)), ["1001", "1002"])
+
+    def test_refresh_does_not_take_the_writer_lock(self):
+        snapshot = self._snapshot()
+        with self.lock:
+            # Copied through a pooled WAL reader while a write is in progress
+            snapshot.refresh()
+            with snapshot.reading() as (conn, lock):
+                self.assertEqual(_orders(conn, lock), ["1001"])
+
+    def test_rollback_journal_copies_under_the_lock(self):
+        conn, lock = db.connect_db(":memory:")
+        self.addCleanup(conn.close)
+        db.log_orders(conn, lock, [_order("1001")])
+        snapshot = ReportingSnapshot(conn, lock)
+        self.addCleanup(snapshot.close)
+        with patch.object(conn, "backup", wraps=conn.backup) as backup:
+            snapshot.refresh()
+        backup.assert_called_once()
+        with snapshot.reading() as (copy, copy_lock):
+            self.assertEqual(_orders(copy, copy_lock), ["1001"])
+
+    def test_replaced_copy_stays_open_for_its_readers(self):
+        snapshot = self._snapshot()
+        with snapshot.reading() as (conn, lock):
+            db.log_orders(self.conn, self.lock, [_order("1002")])
+            snapshot.refresh()
+            # Still the old state, and still usable
+            self.assertEqual(_orders(conn, lock), ["1001"])
+        with self.assertRaises(db.sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+    def test_temp_file_copies_are_removed(self):
+        snapshot = self._snapshot(in_memory=False)
+        snapshot.refresh()
+        first = snapshot._current.path
+        self.assertTrue(os.path.exists(first))
+        snapshot.refresh()
+        second = snapshot._current.path
+        self.assertFalse(os.path.exists(first))
+        snapshot.close()
+        self.assertFalse(os.path.exists(second))
+
+    def test_interval_refreshes_in_background(self):
+        snapshot = self._snapshot(interval=0.05)
+        deadline = time.monotonic() + 5
+        while snapshot.taken_at is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        first = snapshot.taken_at
+        self.assertIsNotNone(first)
+        while snapshot.taken_at == first and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreater(snapshot.taken_at, first)
+        snapshot.close()
+        self.assertFalse(snapshot._thread.is_alive())
+        with self.assertRaises(RuntimeError):
+            snapshot.refresh()
+
+    def test_staleness(self):
+        snapshot = self._snapshot()
+        self.assertIsNone(snapshot.age())
+        self.assertEqual(snapshot.describe(), "No snapshot yet")
+        snapshot.refresh()
+        self.assertLess(snapshot.age(), 60)
+        self.assertIn("just taken", snapshot.describe())
+        snapshot.taken_at = datetime.now().replace(microsecond=0) - (
+            datetime(2024, 1, 1, 0, 5) - datetime(2024, 1, 1)
+        )
+        self.assertIn("5 min old", snapshot.describe())
+
+    def test_concurrent_reports_share_a_copy(self):
+        snapshot = self._snapshot()
+        snapshot.refresh()
+        results = []
+
+        def report():
+            with snapshot.reading() as (conn, lock):
+                results.append(_orders(conn, lock))
+
+        threads = [threading.Thread(target=report) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(results, [["1001"]] * 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
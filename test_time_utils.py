@@ -1,7 +1,71 @@
 import unittest
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
 
-from time_utils import business_hours_delta, business_hours_breakdown
+import numpy as np
+from hypothesis import given, settings, strategies as st
+
+from time_utils import (
+    BusinessCalendar,
+    business_hours_delta,
+    business_hours_breakdown,
+    business_hours_by_day,
+    business_hours_delta_many,
+)
+
+
+def _breakdown_total(start, end):
+    total = timedelta()
+    for seg_start, seg_end in business_hours_breakdown(start, end):
+        total += seg_end - seg_start
+    return total
+
+
+_datetimes = st.datetimes(
+    min_value=datetime(2000, 1, 1), max_value=datetime(2030, 12, 31)
+)
+
+_CALENDAR = BusinessCalendar(
+    shifts=((time(7, 0), time(15, 0)),),
+    holidays=frozenset([date(2024, 1, 1), date(2024, 12, 25), date(2024, 12, 26)]),
+    exceptions={
+        date(2024, 12, 24): [(time(7, 0), time(11, 0))],
+        date(2024, 3, 9): [(time(8, 0), time(10, 0)), (time(11, 0), time(12, 30))],
+    },
+)
+
+_TWO_SHIFTS = BusinessCalendar(
+    shifts=((time(6, 0), time(14, 0)), (time(14, 30), time(22, 30))),
+    holidays=frozenset([date(2024, 5, 27)]),
+)
+
+
+def _calendar_total(calendar, start, end):
+    """Reference implementation summing each calendar day separately."""
+    total = timedelta()
+    exceptions = dict(calendar.exceptions)
+    day = start.date()
+    while day <= end.date():
+        if day in calendar.holidays:
+            windows = []
+        elif day in exceptions:
+            windows = exceptions[day]
+        elif day.weekday() < 5:
+            windows = calendar.shifts
+        else:
+            windows = []
+        for open_t, close_t in windows:
+            seg_start = max(start, datetime.combine(day, open_t))
+            seg_end = min(end, datetime.combine(day, close_t))
+            if seg_end > seg_start:
+                total += seg_end - seg_start
+        day += timedelta(days=1)
+    return total
+
+
+_calendar_datetimes = st.datetimes(
+    min_value=datetime(2023, 12, 1), max_value=datetime(2025, 1, 31)
+)
 
 
 class TimeUtilsTests(unittest.TestCase):
@@ -18,6 +82,175 @@ class TimeUtilsTests(unittest.TestCase):
         ]
         self.assertEqual(segments, expected)
 
+    def test_business_hours_by_day(self):
+        days = business_hours_by_day(
+            datetime(2024, 1, 5, 16, 0), datetime(2024, 1, 8, 10, 0)
+        )
+        self.assertEqual(days, [(date(2024, 1, 5), 0.5), (date(2024, 1, 8), 2.0)])
+        days = business_hours_by_day(
+            datetime(2024, 5, 24, 20, 0), datetime(2024, 5, 28, 7, 0), _TWO_SHIFTS
+        )
+        self.assertEqual(days, [(date(2024, 5, 24), 2.5), (date(2024, 5, 28), 1.0)])
+
+    @given(_datetimes, _datetimes)
+    def test_business_hours_by_day_sums_to_delta(self, start, end):
+        total = sum(hours for _, hours in business_hours_by_day(start, end, _CALENDAR))
+        expected = business_hours_delta(start, end, _CALENDAR).total_seconds() / 3600
+        self.assertAlmostEqual(total, expected, places=6)
+
+    def test_business_hours_before_opening(self):
+        start = datetime(2024, 1, 8, 6, 0)  # Monday 6am
+        end = datetime(2024, 1, 8, 7, 30)
+        self.assertEqual(business_hours_breakdown(start, end), [])
+        self.assertEqual(business_hours_delta(start, end), timedelta(0))
+
+    def test_business_hours_long_span(self):
+        start = datetime(2024, 1, 1, 8, 0)  # Monday
+        end = datetime(2024, 12, 30, 8, 0)  # Monday, 52 weeks later
+        self.assertEqual(business_hours_delta(start, end), timedelta(hours=52 * 5 * 8.5))
+
+    @settings(max_examples=500, deadline=None)
+    @given(_datetimes, _datetimes)
+    def test_business_hours_delta_matches_breakdown(self, start, end):
+        self.assertEqual(business_hours_delta(start, end), _breakdown_total(start, end))
+
+    @settings(max_examples=200, deadline=None)
+    @given(_datetimes, st.timedeltas(min_value=timedelta(0), max_value=timedelta(days=10)))
+    def test_business_hours_delta_matches_breakdown_short_spans(self, start, span):
+        end = start + span
+        self.assertEqual(business_hours_delta(start, end), _breakdown_total(start, end))
+
+    @settings(max_examples=100, deadline=None)
+    @given(st.lists(st.tuples(_datetimes, _datetimes), max_size=50))
+    def test_business_hours_delta_many_matches_scalar(self, pairs):
+        starts = np.array([s for s, _ in pairs], dtype="datetime64[us]")
+        ends = np.array([e for _, e in pairs], dtype="datetime64[us]")
+        hours = business_hours_delta_many(starts, ends)
+        self.assertEqual(hours.dtype, np.float64)
+        expected = [business_hours_delta(s, e).total_seconds() / 3600 for s, e in pairs]
+        self.assertEqual(hours.tolist(), expected)
+
+    def test_business_hours_delta_many_missing_values(self):
+        starts = [datetime(2024, 1, 5, 16, 0), None, datetime(2024, 1, 8, 10, 0)]
+        ends = [datetime(2024, 1, 8, 10, 0), datetime(2024, 1, 8, 10, 0), None]
+        self.assertEqual(business_hours_delta_many(starts, ends).tolist(), [2.5, 0.0, 0.0])
+        self.assertEqual(business_hours_delta_many([], []).shape, (0,))
+
+
+class BusinessCalendarTests(unittest.TestCase):
+    def test_holiday_is_not_counted(self):
+        start = datetime(2024, 12, 23, 14, 0)  # Monday before Christmas
+        end = datetime(2024, 12, 27, 8, 0)  # Friday
+        # 1h Monday, 4h half day Tuesday, holidays Wednesday/Thursday, 1h Friday
+        self.assertEqual(_CALENDAR.delta(start, end), timedelta(hours=6))
+        hours = _CALENDAR.delta_many([start], [end])
+        self.assertEqual(hours.tolist(), [6.0])
+
+    def test_weekend_exception_adds_hours(self):
+        start = datetime(2024, 3, 9, 0, 0)  # Saturday
+        end = datetime(2024, 3, 10, 0, 0)
+        self.assertEqual(_CALENDAR.delta(start, end), timedelta(hours=3.5))
+
+    def test_default_calendar_matches_module_function(self):
+        start = datetime(2024, 1, 5, 16, 0)
+        end = datetime(2024, 1, 8, 10, 0)
+        calendar = BusinessCalendar()
+        self.assertEqual(calendar.delta(start, end), business_hours_delta(start, end))
+        self.assertEqual(business_hours_delta(start, end, calendar=_CALENDAR), timedelta(hours=3))
+
+    @settings(max_examples=300, deadline=None)
+    @given(_calendar_datetimes, _calendar_datetimes)
+    def test_delta_matches_reference(self, start, end):
+        self.assertEqual(_CALENDAR.delta(start, end), _calendar_total(_CALENDAR, start, end))
+
+    @settings(max_examples=100, deadline=None)
+    @given(st.lists(st.tuples(_calendar_datetimes, _calendar_datetimes), max_size=30))
+    def test_delta_many_matches_delta(self, pairs):
+        hours = _CALENDAR.delta_many([s for s, _ in pairs], [e for _, e in pairs])
+        expected = [_CALENDAR.delta(s, e).total_seconds() / 3600 for s, e in pairs]
+        self.assertEqual(hours.tolist(), expected)
+
+    def test_from_config(self):
+        calendar = BusinessCalendar.from_config(
+            {
+                "business_start": "07:00",
+                "business_end": "15:00",
+                "holidays": ["2024-12-25", "not a date"],
+                "business_exceptions": {"2024-12-24": [["07:00", "11:00"]], "bad": []},
+            }
+        )
+        self.assertEqual(calendar.start, time(7, 0))
+        self.assertEqual(calendar.end, time(15, 0))
+        self.assertEqual(calendar.holidays, frozenset([date(2024, 12, 25)]))
+        self.assertEqual(
+            calendar.exceptions, ((date(2024, 12, 24), ((time(7, 0), time(11, 0)),)),)
+        )
+
+    def test_from_config_shifts(self):
+        calendar = BusinessCalendar.from_config(
+            {"business_shifts": [["14:30", "22:30"], ["06:00", "14:00"]]}
+        )
+        self.assertEqual(calendar, _TWO_SHIFTS.__class__(shifts=_TWO_SHIFTS.shifts))
+        self.assertEqual((calendar.start, calendar.end), (time(6, 0), time(22, 30)))
+
+    def test_two_shifts(self):
+        start = datetime(2024, 5, 24, 13, 0)  # Friday
+        end = datetime(2024, 5, 28, 7, 0)  # Tuesday after a holiday Monday
+        # 1h + 8h on Friday, nothing on the weekend or holiday, 1h Tuesday
+        self.assertEqual(_TWO_SHIFTS.delta(start, end), timedelta(hours=10))
+        self.assertEqual(
+            business_hours_breakdown(start, end, calendar=_TWO_SHIFTS),
+            [
+                (start, datetime(2024, 5, 24, 14, 0)),
+                (datetime(2024, 5, 24, 14, 30), datetime(2024, 5, 24, 22, 30)),
+                (datetime(2024, 5, 28, 6, 0), end),
+            ],
+        )
+
+    @settings(max_examples=200, deadline=None)
+    @given(_calendar_datetimes, _calendar_datetimes)
+    def test_two_shifts_matches_reference(self, start, end):
+        self.assertEqual(
+            _TWO_SHIFTS.delta(start, end), _calendar_total(_TWO_SHIFTS, start, end)
+        )
+        self.assertEqual(
+            _TWO_SHIFTS.delta_many([start], [end]).tolist(),
+            [_TWO_SHIFTS.delta(start, end).total_seconds() / 3600],
+        )
+
+    def test_calendars_are_hashable_and_immutable(self):
+        same = BusinessCalendar(
+            shifts=_CALENDAR.shifts,
+            holidays=_CALENDAR.holidays,
+            exceptions=_CALENDAR.exceptions,
+        )
+        self.assertEqual(same, _CALENDAR)
+        self.assertEqual(hash(same), hash(_CALENDAR))
+        self.assertNotEqual(hash(_TWO_SHIFTS), hash(_CALENDAR))
+        self.assertEqual(len({same, _CALENDAR, _TWO_SHIFTS}), 2)
+        with self.assertRaises(AttributeError):
+            _CALENDAR.shifts = ()  # type: ignore[misc]
+
+    def test_calendars_evaluated_concurrently(self):
+        start = datetime(2024, 5, 24, 20, 0)
+        end = datetime(2024, 5, 28, 7, 0)
+        jobs = [_CALENDAR, _TWO_SHIFTS] * 50
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda c: business_hours_delta(start, end, c), jobs))
+        self.assertEqual(results[:2], [timedelta(hours=8), timedelta(hours=3.5)])
+        self.assertEqual(results, results[:2] * 50)
+
+    def test_to_config_round_trip(self):
+        config = _CALENDAR.to_config()
+        self.assertEqual(config["holidays"], ["2024-01-01", "2024-12-25", "2024-12-26"])
+        self.assertEqual(BusinessCalendar.from_config(config), _CALENDAR)
+        self.assertEqual(BusinessCalendar.from_config(_TWO_SHIFTS.to_config()), _TWO_SHIFTS)
+
+    def test_from_config_defaults(self):
+        calendar = BusinessCalendar.from_config({})
+        self.assertEqual((calendar.start, calendar.end), (time(8, 0), time(16, 30)))
+        self.assertEqual(calendar.holidays, frozenset())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,160 @@
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from data import db
+from data.writer import OrderWriter
+from parsers.manage_html import Order, Step
+
+
+def _order(number, cut=None):
+    steps = [Step("Print", datetime(2024, 1, 8, 8, 0)), Step("Cut", cut)]
+    return Order(number, "ACME", "Running", "", steps)
+
+
+class OrderWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.conn, self.lock = db.connect_db(":memory:")
+        self.writers = []
+
+    def tearDown(self):
+        for writer in self.writers:
+            writer.close(5)
+        self.conn.close()
+
+    def _writer(self, **kwargs):
+        kwargs.setdefault("max_delay", 60)
+        writer = OrderWriter(self.conn, self.lock, **kwargs)
+        self.writers.append(writer)
+        return writer
+
+    def _count(self, table="orders"):
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_flush_writes_group_in_one_commit(self):
+        writer = self._writer()
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        self.assertTrue(writer.submit_many(_order(str(n)) for n in range(100)))
+        self.assertEqual(self._count(), 0)
+        self.assertTrue(writer.flush(5))
+        self.conn.set_trace_callback(None)
+        self.assertEqual(self._count(), 100)
+        self.assertEqual(statements.count("COMMIT"), 1)
+        self.assertEqual(writer.commits, 1)
+
+    def test_repeated_updates_are_coalesced(self):
+        writer = self._writer()
+        writer.submit(_order("1001"))
+        writer.submit(_order("1001", datetime(2024, 1, 8, 9, 0)))
+        writer.submit(_order("1001", datetime(2024, 1, 8, 10, 0)))
+        writer.flush(5)
+        self.assertEqual(writer.coalesced, 2)
+        self.assertEqual(writer.written, 1)
+        self.assertEqual(
+            db.load_steps(self.conn, self.lock, "1001")[-1],
+            ("Cut", datetime(2024, 1, 8, 10, 0)),
+        )
+
+    def test_writes_after_max_delay(self):
+        writer = self._writer(max_delay=0.05)
+        writer.submit(_order("1001"))
+        deadline = time.monotonic() + 5
+        while writer.written == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self._count(), 1)
+
+    def test_writes_when_batch_size_is_reached(self):
+        writer = self._writer(batch_size=10)
+        writer.submit_many(_order(str(n)) for n in range(10))
+        deadline = time.monotonic() + 5
+        while writer.written < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self._count(), 10)
+
+    def test_full_buffer_blocks_submit(self):
+        writer = self._writer(max_pending=2, batch_size=2)
+        with self.lock:
+            # The first group is taken by the writer, which then waits for the lock
+            writer.submit_many([_order("1"), _order("2")])
+            deadline = time.monotonic() + 5
+            while writer._writing == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            writer.submit_many([_order("3"), _order("4")])
+            self.assertFalse(writer.submit(_order("5"), timeout=0.05))
+            # Updates of an order that is already waiting still fit
+            self.assertTrue(writer.submit(_order("4"), timeout=0.05))
+        writer.flush(5)
+        self.assertEqual(self._count(), 4)
+
+    def test_submit_waits_for_room(self):
+        writer = self._writer(max_pending=2, batch_size=2)
+        done = threading.Event()
+
+        def produce():
+            writer.submit_many(_order(str(n)) for n in range(20))
+            done.set()
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        thread.join(5)
+        self.assertTrue(done.is_set())
+        writer.flush(5)
+        self.assertEqual(self._count(), 20)
+
+    def test_close_writes_remaining_orders(self):
+        writer = self._writer()
+        writer.submit_many(_order(str(n)) for n in range(5))
+        self.assertTrue(writer.close(5))
+        self.assertEqual(self._count(), 5)
+        with self.assertRaises(RuntimeError):
+            writer.submit(_order("6"))
+
+    def test_failed_write_is_reported(self):
+        other, other_lock = db.connect_db(":memory:")
+        other.close()
+        writer = OrderWriter(other, other_lock, max_delay=60)
+        writer.submit(_order("1001"))
+        self.assertFalse(writer.flush(5))
+        self.assertIsInstance(writer.error, db.sqlite3.ProgrammingError)
+        self.assertEqual(writer.pending, 1)
+        # One last attempt on close, which fails again and keeps the order
+        self.assertFalse(writer.close(5))
+        self.assertEqual(writer.failures, 2)
+        self.assertEqual(writer.pending, 1)
+
+    def test_failed_group_is_retried(self):
+        writer = self._writer(retry_delay=0.05)
+        log_orders = db.log_orders
+        failing = patch.object(db, "log_orders", side_effect=OSError("disk full"))
+        with failing:
+            writer.submit_many([_order("1001"), _order("1002")])
+            self.assertFalse(writer.flush(5))
+            self.assertEqual(writer.pending, 2)
+            self.assertEqual(self._count(), 0)
+            # A newer update of a failed order replaces it
+            writer.submit(_order("1001", datetime(2024, 1, 8, 9, 0)))
+        with patch.object(db, "log_orders", wraps=log_orders) as retried:
+            self.assertTrue(writer.flush(5))
+        self.assertIsNone(writer.error)
+        self.assertEqual(retried.call_count, 1)
+        self.assertEqual(self._count(), 2)
+        self.assertEqual(
+            db.load_steps(self.conn, self.lock, "1001")[-1],
+            ("Cut", datetime(2024, 1, 8, 9, 0)),
+        )
+        self.assertTrue(writer.close(5))
+
+    def test_close_reports_lost_orders(self):
+        writer = self._writer()
+        writer.submit(_order("1001"))
+        with patch.object(db, "log_orders", side_effect=OSError("disk full")):
+            self.assertFalse(writer.close(5))
+        self.assertEqual(writer.pending, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,40 +1,314 @@
 """Utilities for working with business hours."""
 
-from datetime import datetime, timedelta, time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, time
+from functools import lru_cache
+from typing import FrozenSet, Tuple
+
+import numpy as np
 
 
 BUSINESS_START = time(8, 0)
 BUSINESS_END = time(16, 30)
 
+Shift = Tuple[time, time]
 
-def _next_business_start(dt: datetime) -> datetime:
-    """Return the next datetime aligned with the start of business hours.
 
-    Steps:
-    1. Add one calendar day to ``dt``.
-    2. Replace the time portion with ``BUSINESS_START`` (08:00).
-    3. Return the normalized datetime.
+def _microseconds(t: time) -> int:
+    """Return the offset of ``t`` from midnight in microseconds."""
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * 1_000_000 + t.microsecond
+
 
-    The helper itself does not skip weekends; callers should continue
-    invoking it until a weekday is reached.
+def _merge_windows(windows):
+    """Return sorted, non-overlapping ``(open, close)`` windows.
+
+    Works for both :class:`~datetime.time` pairs and microsecond offsets.
+    Empty or inverted windows are dropped.
     """
-    next_day = dt + timedelta(days=1)
-    return next_day.replace(
-        hour=BUSINESS_START.hour, minute=BUSINESS_START.minute, second=0, microsecond=0
-    )
+    merged = []
+    for open_at, close_at in sorted(windows):
+        if close_at <= open_at:
+            continue
+        if merged and open_at <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], close_at))
+        else:
+            merged.append((open_at, close_at))
+    return tuple(merged)
+
+
+def _clip_windows(of_day: int, windows) -> int:
+    """Return business microseconds elapsed on a day up to ``of_day``."""
+    total = 0
+    for open_us, close_us in windows:
+        total += min(max(of_day, open_us), close_us) - open_us
+    return total
+
+
+def _clip_windows_many(of_day, opens, closes):
+    """Vectorized :func:`_clip_windows` for an array of day offsets."""
+    return (np.clip(of_day[:, None], opens, closes) - opens).sum(axis=1)
+
+
+def _parse_hhmm(value: str) -> time:
+    return datetime.strptime(value.strip(), "%H:%M").time()
+
+
+def _parse_windows(windows):
+    return [(_parse_hhmm(o), _parse_hhmm(c)) for o, c in windows]
+
+
+def _prepare_pairs(starts, ends):
+    """Return ``datetime64[us]`` arrays plus a mask of computable pairs.
+
+    Pairs with ``NaT`` on either side or where ``start`` is not before
+    ``end`` are masked out and their values replaced by the epoch so the
+    calendar math stays defined.
+    """
+    starts = np.asarray(starts, dtype="datetime64[us]")
+    ends = np.asarray(ends, dtype="datetime64[us]")
+    valid = ~(np.isnat(starts) | np.isnat(ends))
+    valid &= ends > starts
+    epoch = np.datetime64(0, "us")
+    return np.where(valid, starts, epoch), np.where(valid, ends, epoch), valid
+
+
+class _CalendarIndex:
+    """Precomputed lookup structures for a :class:`BusinessCalendar`."""
+
+    def __init__(self, calendar):
+        self.hash = hash((calendar.shifts, calendar.holidays, calendar.exceptions))
+        self.regular = tuple(
+            (_microseconds(o), _microseconds(c)) for o, c in calendar.shifts
+        )
+        self.regular_us = sum(c - o for o, c in self.regular)
+        self.regular_opens = np.array([o for o, _ in self.regular], dtype=np.int64)
+        self.regular_closes = np.array([c for _, c in self.regular], dtype=np.int64)
+
+        special = {day: () for day in calendar.holidays}
+        special.update(calendar.exceptions)
+        self.special = special
+        self.days = sorted(day.toordinal() for day in special)
+        self.windows = [
+            tuple(
+                (_microseconds(o), _microseconds(c))
+                for o, c in special[date.fromordinal(ordinal)]
+            )
+            for ordinal in self.days
+        ]
+        # prefix[i] is the business time gained or lost on the first i
+        # special days compared with regular days
+        self.prefix = [0]
+        for ordinal, windows in zip(self.days, self.windows):
+            regular = self.regular_us if (ordinal - 1) % 7 < 5 else 0
+            actual = sum(c - o for o, c in windows)
+            self.prefix.append(self.prefix[-1] + actual - regular)
+
+        width = max((len(w) for w in self.windows), default=0)
+        self.day_array = np.array(
+            [date.fromordinal(o) for o in self.days], dtype="datetime64[D]"
+        )
+        self.prefix_array = np.array(self.prefix, dtype=np.int64)
+        self.opens = np.zeros((len(self.days), width), dtype=np.int64)
+        self.closes = np.zeros((len(self.days), width), dtype=np.int64)
+        for row, windows in enumerate(self.windows):
+            for col, (open_us, close_us) in enumerate(windows):
+                self.opens[row, col] = open_us
+                self.closes[row, col] = close_us
+
+
+@dataclass(frozen=True)
+class BusinessCalendar:
+    """Immutable business hours with shifts, holidays and exceptions.
+
+    ``shifts`` lists the ``(open, close)`` windows worked Monday to Friday,
+    e.g. ``((time(6), time(14)), (time(14, 30), time(22, 30)))`` for two
+    shifts with a break; shifts must not cross midnight. ``holidays`` holds
+    dates without any business hours and ``exceptions`` maps dates to
+    replacement windows, such as a half day or an overtime Saturday. It may
+    be given as a ``dict`` and is stored as a sorted tuple of pairs.
+
+    Instances are hashable and never change after construction, so they
+    can be passed explicitly to the calculation functions, shared between
+    threads and used as cache keys.
+
+    Only the special dates are indexed. They are kept sorted alongside a
+    prefix sum of how much business time each one adds or removes compared
+    to a regular day, so the business time before any moment is the
+    closed-form weekday count plus one bisect lookup and clipping of that
+    day. An interval therefore costs the same whether it spans a day or a
+    year of history.
+    """
+
+    shifts: Tuple[Shift, ...] = ((BUSINESS_START, BUSINESS_END),)
+    holidays: FrozenSet[date] = frozenset()
+    exceptions: Tuple[Tuple[date, Tuple[Shift, ...]], ...] = ()
+    _index: _CalendarIndex = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        exceptions = dict(self.exceptions)
+        object.__setattr__(self, "shifts", _merge_windows(self.shifts))
+        object.__setattr__(self, "holidays", frozenset(self.holidays))
+        object.__setattr__(
+            self,
+            "exceptions",
+            tuple(sorted((day, _merge_windows(w)) for day, w in exceptions.items())),
+        )
+        object.__setattr__(self, "_index", _CalendarIndex(self))
+
+    def __hash__(self):
+        return self._index.hash
+
+    @property
+    def start(self) -> time:
+        """Opening time of the first regular shift."""
+        return self.shifts[0][0] if self.shifts else time(0)
+
+    @property
+    def end(self) -> time:
+        """Closing time of the last regular shift."""
+        return self.shifts[-1][1] if self.shifts else time(0)
 
+    @classmethod
+    def from_config(cls, config):
+        """Build a calendar from the application config dictionary.
 
-def business_hours_breakdown(start: datetime, end: datetime):
+        Recognised keys are ``business_shifts`` (a list of ``[HH:MM, HH:MM]``
+        windows), or ``business_start`` and ``business_end`` for a single
+        shift, ``holidays`` (a list of ``YYYY-MM-DD`` dates) and
+        ``business_exceptions`` mapping ``YYYY-MM-DD`` to a list of windows,
+        where an empty list closes the day. Invalid entries are ignored.
+        """
+        shifts: Tuple[Shift, ...] = ()
+        try:
+            shifts = _merge_windows(_parse_windows(config["business_shifts"]))
+        except (KeyError, TypeError, ValueError):
+            pass
+        if not shifts:
+            try:
+                start = _parse_hhmm(config["business_start"])
+                end = _parse_hhmm(config["business_end"])
+                shifts = _merge_windows([(start, end)])
+            except (KeyError, TypeError, ValueError):
+                pass
+        holidays = []
+        for value in config.get("holidays") or []:
+            try:
+                holidays.append(datetime.strptime(value, "%Y-%m-%d").date())
+            except (TypeError, ValueError):
+                continue
+        exceptions = {}
+        for value, windows in (config.get("business_exceptions") or {}).items():
+            try:
+                day = datetime.strptime(value, "%Y-%m-%d").date()
+                exceptions[day] = _parse_windows(windows)
+            except (TypeError, ValueError):
+                continue
+        return cls(
+            shifts or ((BUSINESS_START, BUSINESS_END),),
+            frozenset(holidays),
+            tuple(exceptions.items()),
+        )
+
+    def to_config(self):
+        """Return the calendar as config keys understood by :meth:`from_config`.
+
+        The output is deterministic, so its JSON form can also serve as a
+        stable identifier for the calendar across processes.
+        """
+
+        def fmt(windows):
+            return [[o.strftime("%H:%M"), c.strftime("%H:%M")] for o, c in windows]
+
+        return {
+            "business_shifts": fmt(self.shifts),
+            "holidays": sorted(day.isoformat() for day in self.holidays),
+            "business_exceptions": {
+                day.isoformat(): fmt(windows) for day, windows in self.exceptions
+            },
+        }
+
+    def windows(self, day: date) -> Tuple[Shift, ...]:
+        """Return the ``(open, close)`` windows worked on ``day``."""
+        special = self._index.special
+        if day in special:
+            return special[day]
+        return self.shifts if day.weekday() < 5 else ()
+
+    def _offset_us(self, dt: datetime) -> int:
+        """Return business microseconds from 0001-01-01 up to ``dt``.
+
+        Whole weeks contribute five regular days each and the remaining days
+        of a partial week are counted directly, so the cost does not depend
+        on how far ``dt`` is from the epoch. Special days before ``dt`` are
+        accounted for by the prefix sum and only the day containing ``dt``
+        is clipped against its windows.
+        """
+        index = self._index
+        days = dt.toordinal() - 1  # ordinal 1 is a Monday
+        weekdays = (days // 7) * 5 + min(days % 7, 5)
+        total = weekdays * index.regular_us
+        of_day = _microseconds(dt.time())
+        if dt.weekday() < 5:
+            total += _clip_windows(of_day, index.regular)
+        if index.days:
+            ordinal = days + 1
+            idx = bisect_left(index.days, ordinal)
+            total += index.prefix[idx]
+            if idx < len(index.days) and index.days[idx] == ordinal:
+                total += _clip_windows(of_day, index.windows[idx])
+                if dt.weekday() < 5:
+                    total -= _clip_windows(of_day, index.regular)
+        return total
+
+    def delta(self, start: datetime, end: datetime) -> timedelta:
+        """Return the business time between ``start`` and ``end``."""
+        if start >= end:
+            return timedelta(0)
+        return timedelta(microseconds=self._offset_us(end) - self._offset_us(start))
+
+    def _offset_many(self, moments, days):
+        """Vectorized :meth:`_offset_us` relative to ``1970-01-01``."""
+        index = self._index
+        of_day = (moments - days).astype(np.int64)
+        total = np.busday_count(np.datetime64(0, "D"), days).astype(np.int64)
+        total *= index.regular_us
+        regular = _clip_windows_many(of_day, index.regular_opens, index.regular_closes)
+        total += np.where(np.is_busday(days), regular, 0)
+        if index.days:
+            idx = np.searchsorted(index.day_array, days)
+            total += index.prefix_array[idx]
+            hit_idx = np.minimum(idx, len(index.days) - 1)
+            hit = index.day_array[hit_idx] == days
+            if hit.any():
+                rows = hit_idx[hit]
+                total[hit] += _clip_windows_many(
+                    of_day[hit], index.opens[rows], index.closes[rows]
+                )
+                total[hit] -= np.where(np.is_busday(days[hit]), regular[hit], 0)
+        return total
+
+    def delta_many(self, starts, ends) -> np.ndarray:
+        """Vectorized :meth:`delta` returning a ``float64`` array of hours."""
+        starts, ends, valid = _prepare_pairs(starts, ends)
+        if not valid.any():
+            return np.zeros(valid.shape, dtype=np.float64)
+        total = self._offset_many(ends, ends.astype("datetime64[D]"))
+        total -= self._offset_many(starts, starts.astype("datetime64[D]"))
+        return np.where(valid, total / 1e6 / 3600, 0.0)
+
+
+DEFAULT_CALENDAR = BusinessCalendar()
+
+
+def business_hours_breakdown(start: datetime, end: datetime, calendar=None):
     """Return a list of business-hour segments between ``start`` and ``end``.
 
     Steps:
-    1. Iterate from ``start`` until ``end``.
-    2. Skip Saturdays and Sundays by jumping to the next business start.
-    3. For each weekday, compute the 08:00 ``day_start`` and 16:30 ``day_end``.
-    4. Snap the current time to ``day_start`` if it falls earlier.
-    5. If the current time is past ``day_end``, move to the next day.
-    6. Record a segment from the current time to the earlier of ``day_end`` or ``end``.
-    7. Advance to the next day's start and repeat.
+    1. Walk the calendar days from ``start`` to ``end``.
+    2. Look up the business windows of each day; weekends and holidays
+       have none.
+    3. Record the overlap of each window with ``start``/``end``.
 
     Example:
         >>> from datetime import datetime
@@ -44,54 +318,86 @@ def business_hours_breakdown(start: datetime, end: datetime):
         [(datetime(2024, 1, 5, 16, 0), datetime(2024, 1, 5, 16, 30)),
          (datetime(2024, 1, 8, 8, 0), datetime(2024, 1, 8, 10, 0))]
 
-    Weekends are skipped entirely, days are segmented by business start and
-    end, and the return value lists each contiguous span that contributes
-    to business time.
+    ``calendar`` defaults to :data:`DEFAULT_CALENDAR` (08:00–16:30,
+    Monday–Friday). The return value lists each contiguous span that
+    contributes to business time.
     """
 
+    calendar = calendar or DEFAULT_CALENDAR
     segments = []
-    current = start
-    while current < end:
-        # Skip weekends entirely
-        if current.weekday() >= 5:
-            current = _next_business_start(current)
-            continue
+    day = start.date()
+    while day <= end.date():
+        for open_t, close_t in calendar.windows(day):
+            seg_start = max(start, datetime.combine(day, open_t, start.tzinfo))
+            seg_end = min(end, datetime.combine(day, close_t, start.tzinfo))
+            if seg_end > seg_start:
+                segments.append((seg_start, seg_end))
+        day += timedelta(days=1)
+    return segments
 
-        day_start = current.replace(
-            hour=BUSINESS_START.hour, minute=BUSINESS_START.minute, second=0, microsecond=0
-        )
-        day_end = current.replace(
-            hour=BUSINESS_END.hour, minute=BUSINESS_END.minute, second=0, microsecond=0
-        )
 
-        if current < day_start:
-            current = day_start
-        if current >= day_end:
-            current = _next_business_start(current)
-            continue
+def business_hours_by_day(start: datetime, end: datetime, calendar=None):
+    """Return ``(date, hours)`` for each day with business time in the interval.
 
-        segment_end = min(day_end, end)
-        segments.append((current, segment_end))
-        current = _next_business_start(current)
+    The hours of all days add up to :func:`business_hours_delta` for the
+    same interval. Days without business time are left out.
+
+    Example:
+        >>> from datetime import datetime
+        >>> business_hours_by_day(
+        ...     datetime(2024, 1, 5, 16, 0), datetime(2024, 1, 8, 10, 0)
+        ... )
+        [(date(2024, 1, 5), 0.5), (date(2024, 1, 8), 2.0)]
+    """
+
+    days = {}
+    for seg_start, seg_end in business_hours_breakdown(start, end, calendar):
+        day = seg_start.date()
+        days[day] = days.get(day, 0.0) + (seg_end - seg_start).total_seconds() / 3600
+    return list(days.items())
 
-    return segments
 
+@lru_cache(maxsize=8192)
+def _cached_delta(calendar, start, end):
+    return calendar.delta(start, end)
 
-def business_hours_delta(start: datetime, end: datetime) -> timedelta:
+
+def business_hours_delta(start: datetime, end: datetime, calendar=None) -> timedelta:
     """Return the total business time between ``start`` and ``end``.
 
     Steps:
     1. If ``start`` is not before ``end``, return ``timedelta(0)``.
-    2. Use :func:`business_hours_breakdown` to obtain all weekday segments.
-    3. Sum the duration of each segment to compute the total.
+    2. Count the business time elapsed before ``start`` and before ``end``
+       using whole-week arithmetic plus clipping of the two edge days.
+    3. Return the difference between both counts.
 
-    Only hours between 08:00 and 16:30 on weekdays contribute to the
-    total because weekend periods are skipped by the breakdown.
+    The result matches summing :func:`business_hours_breakdown` but the
+    cost stays constant no matter how many days the interval spans.
+    ``calendar`` defaults to :data:`DEFAULT_CALENDAR`. Results are memoized
+    per calendar, which pays off when the same steps are recalculated on
+    every poll.
     """
 
     if start >= end:
         return timedelta(0)
-    total = timedelta()
-    for seg_start, seg_end in business_hours_breakdown(start, end):
-        total += seg_end - seg_start
-    return total
+    return _cached_delta(calendar or DEFAULT_CALENDAR, start, end)
+
+
+def business_hours_delta_many(starts, ends, calendar=None) -> np.ndarray:
+    """Return business hours between each pair of ``starts`` and ``ends``.
+
+    ``starts`` and ``ends`` are array-likes of ``datetime64`` values (or
+    anything :func:`numpy.asarray` can convert, such as lists of naive
+    ``datetime`` objects). The result is a ``float64`` array of hours with
+    the same semantics as :func:`business_hours_delta`: pairs where
+    ``start`` is not before ``end`` or either side is ``NaT`` yield ``0.0``.
+
+    Steps:
+    1. Count whole weekdays before each date with
+       :func:`numpy.busday_count`.
+    2. Clip the time of day on both edge days to the business windows.
+    3. Correct for holidays and exceptions with a vectorized bisect.
+    4. Combine both parts for every pair at once.
+    """
+
+    return (calendar or DEFAULT_CALENDAR).delta_many(starts, ends)
@@ -8,19 +8,20 @@ import os
 from datetime import datetime, timedelta
 import csv
 import logging
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Any, Optional
+from itertools import chain, groupby, islice
+from typing import Any, Iterable, Iterator, Optional
 from tkcalendar import DateEntry
 
 from config.settings import load_config as load_config_file, save_config as save_config_file
-from data import db
+from data import db, metrics, recompute
+from data.archive import ArchiveWorker
+from data.recompute import RecomputeWorker
+from data.snapshot import ReportingSnapshot
 
-from manage_html_report import (
-    compute_lead_times,
-    write_report,
-)
-import time_utils
-from time_utils import business_hours_delta
+from manage_html_report import write_report_rows
+from time_utils import BusinessCalendar, business_hours_delta
 from config.endpoints import ORDERS_URL
 
 logging.basicConfig(
@@ -28,6 +29,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Orders grouped per step lookup when streaming the date range CSV
+EXPORT_BATCH_ORDERS = 200
+
 
 @dataclass
 class JobStep:
@@ -65,20 +69,17 @@ class OrderScraperApp:
         self.last_db_dir = os.path.dirname(db_path) or os.getcwd()
         self.db: Any = None
         self.db_lock: Any = threading.Lock()
+        self.snapshot: Optional[ReportingSnapshot] = None
+        self.snapshot_status_var = ctk.StringVar(value="Live data")
+        # Business hours are kept in an immutable calendar that is passed
+        # explicitly to every calculation
+        self.calendar = BusinessCalendar.from_config(self.config)
+        # Database timings are sampled and cheap enough to leave on
+        metrics.registry.enabled = bool(self.config.get("db_metrics", True))
         self.connect_db(db_path)
-
-        # Load business hours from config if available
-        start_str = self.config.get("business_start")
-        end_str = self.config.get("business_end")
-        if start_str and end_str:
-            try:
-                start = datetime.strptime(start_str, "%H:%M").time()
-                end = datetime.strptime(end_str, "%H:%M").time()
-                if start < end:
-                    time_utils.BUSINESS_START = start
-                    time_utils.BUSINESS_END = end
-            except ValueError:
-                pass
+        self.recompute_worker: Optional[RecomputeWorker] = None
+        self.recompute_status_var = ctk.StringVar(value="")
+        self.archive_worker: Optional[ArchiveWorker] = None
 
         # export configuration
         export_path = self.config.get("export_path", os.getcwd())
@@ -94,8 +95,11 @@ class OrderScraperApp:
         self.range_total_hours_var = ctk.StringVar(value="0.00")
         self.date_range_rows: list[dict[str, Any]] = []
         self.filtered_date_range_rows: list[dict[str, Any]] = []
-        self.raw_date_range_rows: list[dict[str, Any]] = []
-        self.filtered_raw_date_range_rows: list[dict[str, Any]] = []
+        self.date_range_order_hours: dict[str, float] = {}
+        self.date_range_bounds: tuple[Optional[datetime], Optional[datetime]] = (None, None)
+        # Workstation rows of the orders opened so far, and the order of each tree row
+        self.date_range_workstations: dict[str, list[dict[str, Any]]] = {}
+        self.date_range_items: dict[str, str] = {}
         self.date_range_filter_var = ctk.StringVar()
 
         # Tabs
@@ -105,6 +109,10 @@ class OrderScraperApp:
         # settings tab on far right
         self.settings_tab = self.tab_control.add("Settings")
         self.tab_control.pack(expand=1, fill="both")
+        try:
+            self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        except Exception:
+            pass
 
         # Settings Tab
         ctk.CTkLabel(self.settings_tab, text="Database File:").grid(row=0, column=0, padx=5, pady=5)
@@ -112,10 +120,10 @@ class OrderScraperApp:
         ctk.CTkButton(self.settings_tab, text="Browse", command=self.browse_db).grid(row=0, column=2, padx=5, pady=5)
 
         ctk.CTkLabel(self.settings_tab, text="Business Start (HH:MM):").grid(row=1, column=0, padx=5, pady=5)
-        self.business_start_var = ctk.StringVar(value=time_utils.BUSINESS_START.strftime("%H:%M"))
+        self.business_start_var = ctk.StringVar(value=self.calendar.start.strftime("%H:%M"))
         ctk.CTkEntry(self.settings_tab, textvariable=self.business_start_var, width=80).grid(row=1, column=1, padx=5, pady=5)
         ctk.CTkLabel(self.settings_tab, text="Business End (HH:MM):").grid(row=2, column=0, padx=5, pady=5)
-        self.business_end_var = ctk.StringVar(value=time_utils.BUSINESS_END.strftime("%H:%M"))
+        self.business_end_var = ctk.StringVar(value=self.calendar.end.strftime("%H:%M"))
         ctk.CTkEntry(self.settings_tab, textvariable=self.business_end_var, width=80).grid(row=2, column=1, padx=5, pady=5)
         ctk.CTkButton(self.settings_tab, text="Set Hours", command=self.update_business_hours).grid(row=3, column=0, columnspan=2, pady=10)
 
@@ -126,6 +134,12 @@ class OrderScraperApp:
         ctk.CTkLabel(self.settings_tab, text="Export Time (HH:MM):").grid(row=5, column=0, padx=5, pady=5)
         ctk.CTkEntry(self.settings_tab, textvariable=self.export_time_var, width=80).grid(row=5, column=1, padx=5, pady=5)
         ctk.CTkButton(self.settings_tab, text="Set Export", command=self.update_export_settings).grid(row=6, column=0, columnspan=2, pady=10)
+        ctk.CTkLabel(self.settings_tab, textvariable=self.recompute_status_var).grid(row=7, column=0, columnspan=3, padx=5, pady=5)
+
+        ctk.CTkLabel(self.settings_tab, text="Report Snapshot (min, 0 = live):").grid(row=8, column=0, padx=5, pady=5)
+        self.snapshot_minutes_var = ctk.StringVar(value=str(self.config.get("report_snapshot_minutes", 0)))
+        ctk.CTkEntry(self.settings_tab, textvariable=self.snapshot_minutes_var, width=80).grid(row=8, column=1, padx=5, pady=5)
+        ctk.CTkButton(self.settings_tab, text="Set Snapshot", command=self.update_snapshot_settings).grid(row=9, column=0, columnspan=2, pady=10)
 
         # Date Range Report tab view
         control_frame = ctk.CTkFrame(self.date_range_tab)
@@ -158,6 +172,12 @@ class OrderScraperApp:
         ctk.CTkButton(control_frame, text="Filter", command=self.filter_date_range_rows).grid(
             row=1, column=2, padx=5, pady=5
         )
+        ctk.CTkLabel(control_frame, textvariable=self.snapshot_status_var).grid(
+            row=1, column=3, columnspan=2, padx=5, pady=5
+        )
+        ctk.CTkButton(control_frame, text="Refresh Snapshot", command=self.refresh_snapshot).grid(
+            row=1, column=5, padx=5, pady=5
+        )
         self.date_rows_expanded = False
         self.expand_collapse_btn = ctk.CTkButton(
             control_frame, text="Expand All", command=self.toggle_date_rows
@@ -213,15 +233,21 @@ class OrderScraperApp:
         self.date_tree.tag_configure("total", background="#e0e0e0", font=("Arial", 10, "bold"))
         self.date_tree.tag_configure("inprogress", background="#fff0e6")
         self.date_tree.bind("<Double-1>", self.toggle_order_row)
+        self.date_tree.bind("<<TreeviewOpen>>", self._on_date_row_open)
 
         summary = ctk.CTkFrame(self.date_range_tab)
         summary.grid(row=3, column=0, columnspan=7, sticky="ew", padx=10, pady=5)
         ctk.CTkLabel(summary, text="Total Jobs:").grid(row=0, column=0, padx=5, pady=5)
         ctk.CTkLabel(summary, textvariable=self.range_total_jobs_var).grid(row=0, column=1, padx=5, pady=5)
-        ctk.CTkLabel(summary, text="Total Hours:").grid(row=0, column=2, padx=5, pady=5)
+        ctk.CTkLabel(summary, text="Hours in Range:").grid(row=0, column=2, padx=5, pady=5)
         ctk.CTkLabel(summary, textvariable=self.range_total_hours_var).grid(row=0, column=3, padx=5, pady=5)
 
         self.schedule_daily_export()
+        self._poll_snapshot_status()
+        # Finish a lead time recompute interrupted by the last shutdown
+        if recompute.pending_recompute(self.db, self.db_lock):
+            self.start_recompute()
+        self.start_archive()
 
         # Ensure the window is sized to show all content
         try:
@@ -234,16 +260,23 @@ class OrderScraperApp:
         raw = db.load_steps(self.db, self.db_lock, order_number)
         return [JobStep(name, ts) for name, ts in raw]
 
-    def load_lead_times(
+    def load_steps_many(self, order_numbers: Iterable[str]) -> dict[str, list[JobStep]]:
+        with self._reporting() as (conn, lock):
+            raw = db.load_steps_many(conn, lock, order_numbers)
+        return {
+            order: [JobStep(name, ts) for name, ts in steps]
+            for order, steps in raw.items()
+        }
+
+    def load_lead_times_many(
         self,
-        order_number: str,
+        order_numbers: Iterable[str],
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-    ) -> list[dict[str, Any]]:
-        """Load precomputed lead times optionally filtered by date range."""
-        return db.load_lead_times(
-            self.db, self.db_lock, order_number, start_date, end_date
-        )
+    ) -> dict[str, list[dict[str, Any]]]:
+        """Load precomputed lead times for several orders in one query."""
+        with self._reporting() as (conn, lock):
+            return db.load_lead_times_many(conn, lock, order_numbers, start_date, end_date)
 
 
     def get_date_range(
@@ -275,36 +308,27 @@ class OrderScraperApp:
         if not start and not end:
             messagebox.showerror("Export", "Enter a start or end date")
             return
-        with self.db_lock:
-            cur = self.db.cursor()
-            query = "SELECT DISTINCT order_number FROM lead_times WHERE 1=1"
-            params = []
-            if start:
-                query += " AND start >= ?"
-                params.append(start.isoformat(sep=" "))
-            if end:
-                query += " AND end <= ?"
-                params.append(end.isoformat(sep=" "))
-            cur.execute(query, params)
-            orders = [r[0] for r in cur.fetchall()]
-        results: dict[str, list[dict[str, Any]]] = {}
-        for order in orders:
-            rows = self.load_lead_times(order, start, end)
-            if not rows:
-                steps = self.load_steps(order)
-                tuple_steps = [(s.name, s.timestamp) for s in steps]
-                rows = compute_lead_times({order: tuple_steps}, start, end).get(order, [])
-            if rows:
-                results[order] = rows
-        if not results:
-            messagebox.showinfo("Export", "No data for range")
-            return
-        s = start.strftime("%Y%m%d") if start else "begin"
-        e = end.strftime("%Y%m%d") if end else "now"
-        export_dir = self.export_path_var.get().strip() or os.getcwd()
-        os.makedirs(export_dir, exist_ok=True)
-        path = os.path.join(export_dir, f"lead_time_{s}_{e}.csv")
-        write_report(results, path)
+        with self._reporting() as (conn, lock):
+            rows = db.iter_jobs_by_date_range(conn, lock, start, end)
+            first = next(rows, None)
+            if first is None:
+                messagebox.showinfo("Export", "No data for range")
+                return
+            s = start.strftime("%Y%m%d") if start else "begin"
+            e = end.strftime("%Y%m%d") if end else "now"
+            export_dir = self.export_path_var.get().strip() or os.getcwd()
+            os.makedirs(export_dir, exist_ok=True)
+            path = os.path.join(export_dir, f"lead_time_{s}_{e}.csv")
+            write_report_rows(
+                (
+                    (
+                        r.order,
+                        {"workstation": r.workstation, "hours": r.hours, "start": r.start, "end": r.end},
+                    )
+                    for r in chain([first], rows)
+                ),
+                path,
+            )
         messagebox.showinfo("Export", f"Report written to {path}")
 
     def schedule_daily_export(self) -> None:
@@ -330,6 +354,7 @@ class OrderScraperApp:
 
     def _run_scheduled_export(self) -> None:
         self.export_date_range()
+        self.start_archive()
         self.schedule_daily_export()
 
     def load_config(self) -> dict[str, Any]:
@@ -348,13 +373,68 @@ class OrderScraperApp:
         if start >= end:
             messagebox.showerror("Business Hours", "Start must be before end")
             return
-        time_utils.BUSINESS_START = start
-        time_utils.BUSINESS_END = end
         self.config["business_start"] = start.strftime("%H:%M")
         self.config["business_end"] = end.strftime("%H:%M")
+        # A single window set here replaces any configured multi-shift day
+        self.config.pop("business_shifts", None)
+        self.calendar = BusinessCalendar.from_config(self.config)
         self.save_config()
+        self.start_recompute()
         messagebox.showinfo("Business Hours", "Business hours updated")
 
+    def start_recompute(self) -> None:
+        """Recompute stored lead times with ``self.calendar`` in the background."""
+        if self.recompute_worker is not None:
+            self.recompute_worker.stop()
+        self.recompute_worker = RecomputeWorker(
+            self.db, self.db_lock, self.calendar
+        ).start()
+        self._poll_recompute()
+
+    def _poll_recompute(self) -> None:
+        worker = self.recompute_worker
+        if worker is None:
+            return
+        done, total = worker.progress
+        if worker.is_alive():
+            self.recompute_status_var.set(
+                f"Recomputing lead times: {done}/{total} orders"
+            )
+            self.root.after(500, self._poll_recompute)
+        elif worker.error is not None:
+            logger.error("Lead time recompute failed: %s", worker.error)
+            self.recompute_status_var.set("Lead time recompute failed")
+        elif worker.finished:
+            self.recompute_status_var.set("Lead times up to date")
+        else:
+            self.recompute_status_var.set(
+                f"Lead time recompute paused at {done}/{total} orders"
+            )
+
+    def start_archive(self) -> None:
+        """Archive old completed orders in the background.
+
+        Runs only when ``archive_after_days`` is set in the config.
+        """
+        days = int(self.config.get("archive_after_days") or 0)
+        if days <= 0 or self.db is None or self.db.archive_dir is None:
+            return
+        if self.archive_worker is not None and self.archive_worker.is_alive():
+            return
+        self.archive_worker = ArchiveWorker(self.db, self.db_lock, days).start()
+        self._poll_archive()
+
+    def _poll_archive(self) -> None:
+        worker = self.archive_worker
+        if worker is None:
+            return
+        if worker.is_alive():
+            self.root.after(1000, self._poll_archive)
+        elif worker.error is not None:
+            logger.error("Archiving orders failed: %s", worker.error)
+        elif worker.moved:
+            logger.info("Archived %d orders", sum(worker.moved.values()))
+
     def update_export_settings(self) -> None:
         path = self.export_path_var.get().strip() or os.getcwd()
         t_str = self.export_time_var.get().strip()
@@ -386,14 +466,16 @@ class OrderScraperApp:
             return val
 
     # Date Range Report helpers
-    def load_jobs_by_date_range(
+    def load_order_groups_by_date_range(
         self, start: Optional[datetime], end: Optional[datetime]
     ) -> list[dict[str, Any]]:
-        """Fetch jobs within start/end dates from the database."""
-        return db.load_jobs_by_date_range(self.db, self.db_lock, start, end)
+        """Fetch per-order totals and status within start/end dates."""
+        with self._reporting() as (conn, lock):
+            return db.load_order_groups_by_date_range(conn, lock, start, end)
 
     def populate_date_range_table(self, rows: list[dict[str, Any]]) -> None:
         self.date_tree.delete(*self.date_tree.get_children())
+        self.date_range_items = {}
         # Highlight orders that are still in progress
         self.date_tree.tag_configure("inprogress", background="#fff0e6")
         total = 0.0
@@ -416,20 +498,16 @@ class OrderScraperApp:
                 tags=tags,
                 open=False,
             )
-            for ws in r.get("workstations", []):
+            self.date_range_items[parent] = r["order"]
+            workstations = self.date_range_workstations.get(r["order"])
+            if workstations is None:
+                # Replaced by the workstation rows when the order is opened
                 self.date_tree.insert(
-                    parent,
-                    "end",
-                    text="",
-                    values=(
-                        "",
-                        ws["workstation"],
-                        ws["start"],
-                        ws["end"],
-                        f"{ws['hours']:.2f}",
-                        "",
-                    ),
+                    parent, "end", text="", values=("", "Loading...", "", "", "", ""),
+                    tags=("placeholder",),
                 )
+            else:
+                self._insert_workstation_rows(parent, workstations)
             total += r["hours"]
         self.date_tree.insert(
             "",
@@ -439,15 +517,89 @@ class OrderScraperApp:
             tags=("total",),
         )
 
+    def _insert_workstation_rows(self, parent: str, workstations: list[dict[str, Any]]) -> None:
+        for ws in workstations:
+            self.date_tree.insert(
+                parent,
+                "end",
+                text="",
+                values=(
+                    "",
+                    ws["workstation"],
+                    ws["start"],
+                    ws["end"],
+                    f"{ws['hours']:.2f}",
+                    "",
+                ),
+            )
+
+    def load_date_range_workstations(self, orders: list[str]) -> dict[str, list[dict[str, Any]]]:
+        """Workstation rows of ``orders`` for the current report, cached per order.
+
+        Like the CSV export, the lead times starting in the range are
+        followed by the steps that have none there. All orders are read in
+        one batch with :meth:`load_lead_times_many` and
+        :meth:`load_steps_many`.
+        """
+        start, end = self.date_range_bounds
+        # The days start..end, as the report's totals select them
+        hi = end + timedelta(days=1) if end else None
+        with self._reporting():
+            lead_times = self.load_lead_times_many(orders)
+            groups: list[dict[str, Any]] = []
+            for order in orders:
+                workstations = [
+                    {
+                        "workstation": lt["workstation"],
+                        "hours": lt["hours"],
+                        "start": lt["start"].strftime("%Y-%m-%d %H:%M"),
+                        "end": lt["end"].strftime("%Y-%m-%d %H:%M") if lt["end"] else "",
+                    }
+                    for lt in lead_times[order]
+                    if lt["start"] is not None
+                    and (start is None or lt["start"] >= start)
+                    and (hi is None or lt["start"] < hi)
+                ]
+                groups.append({"order": order, "workstations": workstations})
+            self._add_missing_steps(groups)
+        for g in groups:
+            self.date_range_workstations[g["order"]] = g["workstations"]
+        return {g["order"]: g["workstations"] for g in groups}
+
+    def _load_date_rows(self, items: Iterable[str]) -> None:
+        """Replace the placeholder under each order row in ``items`` with its workstations."""
+        pending = {}
+        for item in items:
+            order = self.date_range_items.get(item)
+            children = self.date_tree.get_children(item)
+            if order is None or len(children) != 1:
+                continue
+            if "placeholder" in self.date_tree.item(children[0], "tags"):
+                pending[item] = order
+        if not pending:
+            return
+        workstations = self.load_date_range_workstations(list(pending.values()))
+        for item, order in pending.items():
+            self.date_tree.delete(*self.date_tree.get_children(item))
+            self._insert_workstation_rows(item, workstations[order])
+
+    def _on_date_row_open(self, event: Any) -> None:
+        self._load_date_rows([self.date_tree.focus()])
+
     def toggle_order_row(self, event: Any) -> None:
         item = self.date_tree.identify_row(event.y)
         if not item:
             return
         if self.date_tree.get_children(item):
             is_open = self.date_tree.item(item, "open")
+            if not is_open:
+                self._load_date_rows([item])
             self.date_tree.item(item, open=not is_open)
 
     def _set_all_date_rows_open(self, open_state):
+        if open_state:
+            self._load_date_rows(self.date_tree.get_children())
+
         def recurse(item):
             self.date_tree.item(item, open=open_state)
             for child in self.date_tree.get_children(item):
@@ -471,48 +623,37 @@ class OrderScraperApp:
             self.expand_collapse_btn.configure(text="Collapse All")
         self.date_rows_expanded = not self.date_rows_expanded
 
+    def load_order_hours(
+        self, start: Optional[datetime], end: Optional[datetime]
+    ) -> dict[str, float]:
+        """Business hours per order on the days of the range, from the rollup."""
+        with self._reporting() as (conn, lock):
+            return db.load_order_hours(conn, lock, start, end)
+
     def update_date_range_summary(self, rows: list[dict[str, Any]]) -> None:
-        total_jobs = len({r["order"] for r in rows})
-        total_hours = sum(r["hours"] for r in rows)
+        """Show the job count and the hours falling on the days of the range.
+
+        The hours come from the daily rollup and count only the part of each
+        lead time inside the range, unlike the TOTAL row of the table, which
+        adds up the full lead times listed above it.
+        """
+        orders = {r["order"] for r in rows}
+        total_jobs = len(orders)
+        total_hours = sum(self.date_range_order_hours.get(o, 0.0) for o in orders)
         self.range_total_jobs_var.set(str(total_jobs))
         self.range_total_hours_var.set(f"{total_hours:.2f}")
 
-    def run_date_range_report(self) -> None:
-        start, end = self.get_date_range(self.range_start_var, self.range_end_var)
-        if not start or not end:
-            messagebox.showerror("Date Range Report", "Start and end dates are required")
-            return
-        rows = self.load_jobs_by_date_range(start, end)
-        raw_rows = list(rows)
-        grouped: dict[str, dict[str, Any]] = {}
-        for r in rows:
-            order = str(r.get("order"))
-            g = grouped.setdefault(
-                order,
-                {
-                    "order": order,
-                    "company": r.get("company", ""),
-                    "hours": 0.0,
-                    "workstations": [],
-                    "status": "Completed",
-                },
-            )
-            g["hours"] += r.get("hours") or 0.0
-            end_time = r.get("end", "")
-            g["workstations"].append(
-                {
-                    "workstation": r.get("workstation", ""),
-                    "hours": r.get("hours") or 0.0,
-                    "start": r.get("start", ""),
-                    "end": end_time,
-                }
-            )
-            if not end_time:
-                g["status"] = "In Progress"
-
-        # Include missing steps for each order and ensure workstation order
-        for order, g in grouped.items():
-            steps = self.load_steps(order)
+    def _add_missing_steps(self, groups: list[dict[str, Any]]) -> None:
+        """Add the steps of each order that have no lead time in the range.
+
+        Updates the status of ``groups`` in place and orders the workstations
+        of each order like its steps. The hours of the added steps are shown
+        but not added to the order's total, which only counts the lead times
+        starting in the range.
+        """
+        steps_by_order = self.load_steps_many([g["order"] for g in groups])
+        for g in groups:
+            steps = steps_by_order.get(g["order"], [])
             step_order = {s.name.lower(): idx for idx, s in enumerate(steps)}
             existing = {ws["workstation"].lower() for ws in g["workstations"]}
             prev_ts: Optional[datetime] = None
@@ -524,7 +665,7 @@ class OrderScraperApp:
                 if step_lower not in existing:
                     start_str = prev_ts.strftime("%Y-%m-%d %H:%M") if prev_ts else ""
                     delta = (
-                        business_hours_delta(prev_ts, ts)
+                        business_hours_delta(prev_ts, ts, calendar=self.calendar)
                         if prev_ts and ts
                         else timedelta(0)
                     )
@@ -537,19 +678,6 @@ class OrderScraperApp:
                             "end": end_str,
                         }
                     )
-                    g["hours"] += hours
-                    status = "Completed" if end_str else "In Progress"
-                    raw_rows.append(
-                        {
-                            "order": order,
-                            "company": g.get("company", ""),
-                            "workstation": step_name,
-                            "hours": hours,
-                            "start": start_str,
-                            "end": end_str,
-                            "status": status,
-                        }
-                    )
                     existing.add(step_lower)
                 if not end_str:
                     g["status"] = "In Progress"
@@ -559,22 +687,72 @@ class OrderScraperApp:
                 key=lambda ws: step_order.get(ws["workstation"].lower(), len(step_order))
             )
 
-        grouped_rows = list(grouped.values())
-        self.raw_date_range_rows = raw_rows
+    def run_date_range_report(self) -> None:
+        start, end = self.get_date_range(self.range_start_var, self.range_end_var)
+        if not start or not end:
+            messagebox.showerror("Date Range Report", "Start and end dates are required")
+            return
+        with self._reporting():
+            grouped_rows = self.load_order_groups_by_date_range(start, end)
+            self.date_range_order_hours = self.load_order_hours(start, end)
+        self._update_snapshot_status()
+        self.date_range_bounds = (start, end)
+        self.date_range_workstations = {}
         self.date_range_rows = grouped_rows
         self.filtered_date_range_rows = list(grouped_rows)
-        self.filtered_raw_date_range_rows = list(self.raw_date_range_rows)
         self.populate_date_range_table(grouped_rows)
-        self.update_date_range_summary(self.filtered_raw_date_range_rows)
+        self.update_date_range_summary(self.filtered_date_range_rows)
+
+    def _iter_date_range_groups(
+        self, start: datetime, end: datetime, batch_size: int = EXPORT_BATCH_ORDERS
+    ) -> Iterable[dict[str, Any]]:
+        """Yield the grouped report rows of the range, ``batch_size`` orders at a time."""
+        with self._reporting() as (conn, lock):
+            rows = db.iter_jobs_by_date_range(conn, lock, start, end)
+            orders = groupby(rows, key=lambda r: r.order)
+            while True:
+                batch = []
+                for order, group in islice(orders, batch_size):
+                    order_rows = list(group)
+                    workstations = [
+                        {
+                            "workstation": r.workstation,
+                            "hours": r.hours,
+                            "start": r.start.strftime("%Y-%m-%d %H:%M") if r.start else "",
+                            "end": r.end.strftime("%Y-%m-%d %H:%M") if r.end else "",
+                        }
+                        for r in order_rows
+                    ]
+                    batch.append(
+                        {
+                            "order": order,
+                            "company": order_rows[0].company,
+                            "hours": sum(ws["hours"] for ws in workstations),
+                            "status": (
+                                "Completed"
+                                if all(ws["end"] for ws in workstations)
+                                else "In Progress"
+                            ),
+                            "workstations": workstations,
+                        }
+                    )
+                if not batch:
+                    return
+                self._add_missing_steps(batch)
+                yield from batch
 
     def export_date_range_csv(self) -> None:
-        """Export the date range report to a CSV file."""
-        if not self.date_range_rows:
-            messagebox.showerror("Date Range Report", "Run report before exporting")
-            return
+        """Export the date range report to a CSV file.
+
+        The rows are streamed from the database, so the range does not have
+        to fit in memory and the report does not have to be run first.
+        """
         start, end = self.get_date_range(self.range_start_var, self.range_end_var)
-        s = start.strftime("%Y%m%d") if start else "begin"
-        e = end.strftime("%Y%m%d") if end else "now"
+        if not start or not end:
+            messagebox.showerror("Date Range Report", "Start and end dates are required")
+            return
+        s = start.strftime("%Y%m%d")
+        e = end.strftime("%Y%m%d")
         export_dir = self.export_path_var.get().strip() or os.getcwd()
         os.makedirs(export_dir, exist_ok=True)
         path = os.path.join(export_dir, f"date_range_{s}_{e}.csv")
@@ -589,7 +767,7 @@ class OrderScraperApp:
                 "Hours",
                 "Status",
             ])
-            for r in self.date_range_rows:
+            for r in self._iter_date_range_groups(start, end):
                 writer.writerow([
                     r["order"],
                     r.get("company", ""),
@@ -611,28 +789,21 @@ class OrderScraperApp:
                     ])
         messagebox.showinfo("Date Range Report", f"Report written to {path}")
 
+    def search_orders(self, term: str) -> set[str]:
+        """Order numbers in the whole database whose number or company contains ``term``."""
+        with self._reporting() as (conn, lock):
+            return db.search_orders(conn, lock, term)
+
     def filter_date_range_rows(self) -> None:
-        term = self.date_range_filter_var.get().lower().strip()
+        term = self.date_range_filter_var.get().strip()
         if not term:
             rows = self.date_range_rows
-            raw_rows = self.raw_date_range_rows
         else:
-            rows = [
-                r
-                for r in self.date_range_rows
-                if term in str(r.get("order", "")).lower()
-                or term in str(r.get("company", "")).lower()
-            ]
-            raw_rows = [
-                r
-                for r in self.raw_date_range_rows
-                if term in str(r.get("order", "")).lower()
-                or term in str(r.get("company", "")).lower()
-            ]
+            matches = self.search_orders(term)
+            rows = [r for r in self.date_range_rows if r["order"] in matches]
         self.filtered_date_range_rows = rows
-        self.filtered_raw_date_range_rows = raw_rows
         self.populate_date_range_table(rows)
-        self.update_date_range_summary(raw_rows)
+        self.update_date_range_summary(rows)
 
     def sort_date_range_table(self, column: str, reverse: bool = False) -> None:
         key_funcs = {
@@ -644,7 +815,7 @@ class OrderScraperApp:
             return
         self.filtered_date_range_rows.sort(key=key_funcs[column], reverse=reverse)
         self.populate_date_range_table(self.filtered_date_range_rows)
-        self.update_date_range_summary(self.filtered_raw_date_range_rows)
+        self.update_date_range_summary(self.filtered_date_range_rows)
         if column == "order":
             self.date_tree.heading(
                 "#0", command=lambda: self.sort_date_range_table(column, not reverse)
@@ -659,8 +830,9 @@ class OrderScraperApp:
         self.range_end_var.set("")
         self.date_range_rows = []
         self.filtered_date_range_rows = []
-        self.raw_date_range_rows = []
-        self.filtered_raw_date_range_rows = []
+        self.date_range_order_hours = {}
+        self.date_range_bounds = (None, None)
+        self.date_range_workstations = {}
         self.date_range_filter_var.set("")
         self.date_tree.delete(*self.date_tree.get_children())
         self.update_date_range_summary([])
@@ -674,15 +846,103 @@ class OrderScraperApp:
         if path:
             self.connect_db(path)
 
-    def connect_db(self, path: str) -> None:
-        if hasattr(self, "db") and self.db:
+    def on_close(self) -> None:
+        """Write buffered orders and stop background work before exiting."""
+        self.close_db()
+        self.root.destroy()
+
+    def close_db(self) -> None:
+        for name in ("recompute_worker", "archive_worker"):
+            worker = getattr(self, name, None)
+            if worker is not None:
+                worker.stop()
+        snapshot = getattr(self, "snapshot", None)
+        if snapshot is not None:
+            snapshot.close()
+            self.snapshot = None
+        if getattr(self, "db", None):
             try:
                 self.db.close()
             except Exception:
                 pass
+            if metrics.registry.snapshot():
+                logger.info("Database timings:\n%s", metrics.registry.summary())
+                metrics.registry.reset()
+
+    def connect_db(self, path: str) -> None:
+        self.close_db()
         self.db_path_var.set(path)
         self.config["db_path"] = path
         self.last_db_dir = os.path.dirname(path) or os.getcwd()
         self.save_config()
         self.db, self.db_lock = db.connect_db(path)
+        self._start_snapshot()
+
+    def _start_snapshot(self) -> None:
+        """Read reports from a snapshot refreshed every configured number of minutes."""
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+        minutes = float(self.config.get("report_snapshot_minutes", 0) or 0)
+        if minutes > 0:
+            self.snapshot = ReportingSnapshot(self.db, self.db_lock, interval=minutes * 60)
+        self._update_snapshot_status()
+
+    def update_snapshot_settings(self) -> None:
+        try:
+            minutes = float(self.snapshot_minutes_var.get().strip() or 0)
+        except ValueError:
+            messagebox.showerror("Report Snapshot", "Enter the refresh interval in minutes")
+            return
+        if minutes < 0:
+            messagebox.showerror("Report Snapshot", "The interval cannot be negative")
+            return
+        self.config["report_snapshot_minutes"] = minutes
+        self.save_config()
+        self._start_snapshot()
+        messagebox.showinfo("Report Snapshot", "Report snapshot settings updated")
+
+    def refresh_snapshot(self) -> None:
+        """Take a snapshot now; reports read it until the next refresh."""
+        if self.snapshot is None:
+            # On demand only, with no interval configured
+            self.snapshot = ReportingSnapshot(self.db, self.db_lock)
+        try:
+            self.snapshot.refresh()
+        except Exception as exc:
+            logger.exception("Taking the reporting snapshot failed")
+            messagebox.showerror("Report Snapshot", f"Snapshot failed: {exc}")
+        self._update_snapshot_status()
+
+    def _update_snapshot_status(self) -> None:
+        if self.snapshot is None:
+            self.snapshot_status_var.set("Live data")
+        else:
+            self.snapshot_status_var.set(self.snapshot.describe())
+
+    def _poll_snapshot_status(self) -> None:
+        self._update_snapshot_status()
+        self.root.after(30000, self._poll_snapshot_status)
+
+    @contextmanager
+    def _reporting(self) -> Iterator[tuple[Any, Any]]:
+        """Yield the ``(db, db_lock)`` reports read from.
+
+        That is the snapshot when one is in use, else the live database.
+        Nested uses share one snapshot copy, so a report reads a single
+        consistent state even if the snapshot is refreshed meanwhile.
+        """
+        source = getattr(self, "_report_source", None)
+        snapshot = getattr(self, "snapshot", None)
+        if source is not None:
+            yield source
+        elif snapshot is None:
+            yield self.db, self.db_lock
+        else:
+            with snapshot.reading() as source:
+                self._report_source = source
+                try:
+                    yield source
+                finally:
+                    self._report_source = None
 